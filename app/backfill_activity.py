@@ -0,0 +1,25 @@
+"""
+Filename: backfill_activity.py
+
+Rebuilds the user_world_activity table from the existing bids and hunts.
+The table is normally maintained on Bid/Hunt insert; run this after importing
+data outside the ORM or to repair it:
+
+    python backfill_activity.py
+"""
+
+from database import SessionLocal
+from models import UserWorldActivity
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        rows = UserWorldActivity.backfill(db)
+        db.commit()
+        print(f"Backfilled {rows} user_world_activity rows.")
+    except Exception as e:
+        db.rollback()
+        print(f"Error backfilling user_world_activity: {e}")
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,132 @@
+"""
+Filename: benchmarks/active_users.py
+
+Compares the old Bid x Hunt outer-join "last activity" query with the
+UNION ALL based user_last_activity() query used by get_active_users.
+
+Run from the app directory:
+    python benchmarks/active_users.py --bids 100000 --hunts 100000
+
+By default an in-memory SQLite database is used. Set BENCH_DB_URL to run
+against a scratch Postgres database instead (its tables are dropped afterwards).
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import create_engine, event, insert, select, func, and_
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, User, Character, World, Spawn, Bid, Hunt, user_last_activity
+
+
+def legacy_last_activity(world_id):
+    """The pre-UNION query: outer-joins bids and hunts onto every character before aggregating."""
+    return (
+        select(
+            User.id.label('user_id'),
+            func.max(func.greatest(
+                Bid.hunt_window_start,
+                Hunt.start_time
+            )).label('last_activity_at')
+        )
+        .join(Character, Character.user_id == User.id)
+        .outerjoin(Bid, Bid.character_id == Character.id)
+        .outerjoin(Hunt, Hunt.character_id == Character.id)
+        .where(Character.world_id == world_id)
+        .group_by(User.id)
+    ).subquery()
+
+
+def count_active(db, latest_activity, threshold_date):
+    return db.execute(
+        select(func.count()).select_from(latest_activity).where(
+            and_(
+                latest_activity.c.last_activity_at.isnot(None),
+                latest_activity.c.last_activity_at >= threshold_date
+            )
+        )
+    ).scalar_one()
+
+
+def populate(engine, characters, bids, hunts):
+    """Spreads the bids and hunts evenly over the characters of a single world."""
+    now = datetime.now(UTC).replace(tzinfo=None)
+    with engine.begin() as conn:
+        world_id = conn.execute(insert(World).values(name='Benchmark').returning(World.id)).scalar_one()
+        spawn_id = conn.execute(insert(Spawn).values(name='Benchmark Spawn', world_id=world_id).returning(Spawn.id)).scalar_one()
+        conn.execute(insert(User), [
+            {'id': i + 1, 'username': f'user{i}', 'password_hash': 'x'} for i in range(characters)
+        ])
+        conn.execute(insert(Character), [
+            {'id': i + 1, 'name': f'Character {i}', 'level': 100, 'vocation': 'Knight',
+             'user_id': i + 1, 'world_id': world_id} for i in range(characters)
+        ])
+        conn.execute(insert(Bid), [
+            {'character_id': i % characters + 1, 'spawn_id': spawn_id, 'bid_points': 1, 'claim_time': 15,
+             'hunt_window_start': now - timedelta(minutes=i), 'hunt_window_end': now - timedelta(minutes=i) + timedelta(hours=1)}
+            for i in range(bids)
+        ])
+        conn.execute(insert(Hunt), [
+            {'character_id': i % characters + 1, 'spawn_id': spawn_id,
+             'start_time': now - timedelta(minutes=i), 'end_time': now - timedelta(minutes=i) + timedelta(hours=1)}
+            for i in range(hunts)
+        ])
+    return world_id
+
+
+def timed(label, fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<12} {best:.4f}s  (active users: {result})")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--characters', type=int, default=2000)
+    parser.add_argument('--bids', type=int, default=100_000)
+    parser.add_argument('--hunts', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    engine = create_engine(os.environ.get('BENCH_DB_URL', 'sqlite:///:memory:'))
+    if engine.dialect.name == 'sqlite':
+        # SQLite has no GREATEST(); emulate Postgres semantics (NULLs are ignored)
+        @event.listens_for(engine, 'connect')
+        def register_greatest(dbapi_connection, connection_record):
+            dbapi_connection.create_function(
+                'greatest', -1, lambda *values: max((v for v in values if v is not None), default=None)
+            )
+
+    Base.metadata.create_all(engine)
+    try:
+        print(f"Populating {args.characters} characters, {args.bids} bids, {args.hunts} hunts...")
+        world_id = populate(engine, args.characters, args.bids, args.hunts)
+        per_character = (args.bids // args.characters) * (args.hunts // args.characters)
+        print(f"Legacy join materializes ~{per_character * args.characters} intermediate rows\n")
+
+        threshold_date = datetime.now(UTC) - timedelta(days=30)
+        db = sessionmaker(bind=engine)()
+        try:
+            union_time = timed('union all', lambda: count_active(db, user_last_activity(world_ids=[world_id]), threshold_date), args.repeat)
+            legacy_time = timed('legacy join', lambda: count_active(db, legacy_last_activity(world_id), threshold_date), args.repeat)
+        finally:
+            db.close()
+        print(f"\nspeedup: {legacy_time / union_time:.1f}x")
+    finally:
+        Base.metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
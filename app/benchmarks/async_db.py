@@ -0,0 +1,116 @@
+"""
+Filename: benchmarks/async_db.py
+
+Compares serving concurrent requests with the synchronous Session (which
+blocks the event loop on every round trip) against the AsyncSession used by
+the route handlers. Each simulated request runs a few queries that each take
+--latency milliseconds on the database side.
+
+Run from the app directory:
+    python benchmarks/async_db.py --requests 50 --queries 3 --latency 20
+
+By default a temporary SQLite file is used; latency comes from a registered
+sleep() function. Set BENCH_DB_URL (a postgresql:// URL) to run against
+Postgres instead, where pg_sleep() is used and asyncpg serves the async side.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, World
+
+
+def register_sleep(engine):
+    """SQLite has no sleep(); add one so each query costs a fixed round trip."""
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.create_function('sleep', 1, lambda ms: time.sleep(ms / 1000) or 0)
+
+
+def latency_query(dialect_name, latency_ms):
+    if dialect_name == 'postgresql':
+        return select(func.pg_sleep(latency_ms / 1000), func.count(World.id))
+    return select(func.sleep(latency_ms), func.count(World.id))
+
+
+async def sync_request(SessionLocal, query, queries):
+    """The old handlers: an async def calling the blocking Session."""
+    db = SessionLocal()
+    try:
+        for _ in range(queries):
+            db.execute(query).all()
+    finally:
+        db.close()
+
+
+async def async_request(AsyncSessionLocal, query, queries):
+    async with AsyncSessionLocal() as db:
+        for _ in range(queries):
+            (await db.execute(query)).all()
+
+
+async def serve(request, requests):
+    start = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50, help='concurrent requests')
+    parser.add_argument('--queries', type=int, default=3, help='queries per request')
+    parser.add_argument('--latency', type=float, default=20, help='milliseconds per query')
+    parser.add_argument('--pool-size', type=int, default=20)
+    args = parser.parse_args()
+
+    sync_url = os.environ.get('BENCH_DB_URL')
+    if sync_url:
+        async_url = sync_url.replace('postgresql://', 'postgresql+asyncpg://', 1)
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        sync_url, async_url = f"sqlite:///{path}", f"sqlite+aiosqlite:///{path}"
+
+    engine = create_engine(sync_url, pool_size=args.pool_size)
+    async_engine = create_async_engine(async_url, pool_size=args.pool_size)
+    if engine.dialect.name == 'sqlite':
+        register_sleep(engine)
+        register_sleep(async_engine.sync_engine)
+
+    Base.metadata.create_all(engine)
+    try:
+        query = latency_query(engine.dialect.name, args.latency)
+        SessionLocal = sessionmaker(bind=engine)
+        AsyncSessionLocal = async_sessionmaker(async_engine)
+
+        ideal = args.queries * args.latency / 1000
+        print(f"{args.requests} concurrent requests x {args.queries} queries x {args.latency:g}ms "
+              f"(one request alone: {ideal:.3f}s)\n")
+
+        sync_time = asyncio.run(serve(lambda: sync_request(SessionLocal, query, args.queries), args.requests))
+        print(f"{'sync session':<14} {sync_time:.3f}s")
+
+        async def run_async():
+            try:
+                return await serve(lambda: async_request(AsyncSessionLocal, query, args.queries), args.requests)
+            finally:
+                await async_engine.dispose()
+
+        async_time = asyncio.run(run_async())
+        print(f"{'async session':<14} {async_time:.3f}s")
+        print(f"\nspeedup: {sync_time / async_time:.1f}x")
+    finally:
+        Base.metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
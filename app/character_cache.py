@@ -0,0 +1,178 @@
+"""
+Filename: character_cache.py
+
+An async cache for TibiaData character lookups, keyed by normalized
+character name.
+
+- Fresh entries (younger than `ttl`) are served directly.
+- Stale entries (younger than `ttl + stale_ttl`) are served immediately while
+  a background task refreshes them.
+- Concurrent lookups of the same name share a single in-flight fetch.
+- Unknown names (the fetch returns None) are cached for `negative_ttl`.
+- Fetch errors are not cached; they reach the caller, unless a stale entry
+  can be served instead.
+
+Entries live in a backend: InMemoryBackend per process, or RedisBackend to
+share them between workers.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+CHARACTER_CACHE_TTL = float(os.environ.get("CHARACTER_CACHE_TTL", "3600")) # seconds
+CHARACTER_CACHE_STALE_TTL = float(os.environ.get("CHARACTER_CACHE_STALE_TTL", "86400")) # seconds past ttl
+CHARACTER_CACHE_NEGATIVE_TTL = float(os.environ.get("CHARACTER_CACHE_NEGATIVE_TTL", "300")) # seconds
+CHARACTER_CACHE_SIZE = int(os.environ.get("CHARACTER_CACHE_SIZE", "10000"))
+CHARACTER_CACHE_BACKEND = os.environ.get("CHARACTER_CACHE_BACKEND", "memory") # "memory" or "redis"
+CHARACTER_CACHE_REDIS_URL = os.environ.get("CHARACTER_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+
+def normalize_name(name: str) -> str:
+    """Character names are case-insensitive; collapse whitespace and case."""
+    return " ".join(name.split()).lower()
+
+
+class InMemoryBackend:
+    """Per-process LRU storage of cache entries."""
+
+    def __init__(self, maxsize: int = CHARACTER_CACHE_SIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: dict, expire: float):
+        self._entries[key] = (self.clock() + expire, entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def clear(self):
+        self._entries.clear()
+
+
+class RedisBackend:
+    """
+    Storage shared between processes. Needs the optional 'redis' package;
+    entries are stored as JSON under `prefix + key`.
+    """
+
+    def __init__(self, url: str = CHARACTER_CACHE_REDIS_URL, prefix: str = "huntmaster:character:", client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise ImportError("RedisBackend requires the 'redis' package (pip install redis)") from e
+            client = redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, entry: dict, expire: float):
+        await self.client.set(self.prefix + key, json.dumps(entry), ex=max(int(expire), 1))
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def clear(self):
+        async for key in self.client.scan_iter(match=self.prefix + "*"):
+            await self.client.delete(key)
+
+
+def backend_from_env():
+    if CHARACTER_CACHE_BACKEND == "redis":
+        return RedisBackend(CHARACTER_CACHE_REDIS_URL)
+    return InMemoryBackend()
+
+
+class CharacterCache:
+    """
+    Wraps `fetch(name)`, which returns JSON-serializable character data, or
+    None when the character doesn't exist, and raises on lookup failures.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Optional[dict]]],
+        backend=None,
+        ttl: float = CHARACTER_CACHE_TTL,
+        stale_ttl: float = CHARACTER_CACHE_STALE_TTL,
+        negative_ttl: float = CHARACTER_CACHE_NEGATIVE_TTL,
+        clock=time.time
+    ):
+        self.fetch = fetch
+        self.backend = backend if backend is not None else InMemoryBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._inflight = {}
+
+    async def get(self, name: str) -> Optional[dict]:
+        key = normalize_name(name)
+        entry = await self.backend.get(key)
+        if entry is not None:
+            age = self.clock() - entry["fetched_at"]
+            if entry["value"] is None:
+                if age < self.negative_ttl:
+                    return None
+            elif age < self.ttl:
+                return entry["value"]
+            elif age < self.ttl + self.stale_ttl:
+                self._refresh(key, name).add_done_callback(self._log_refresh_failure)
+                return entry["value"]
+        return await asyncio.shield(self._refresh(key, name))
+
+    async def invalidate(self, name: str):
+        await self.backend.delete(normalize_name(name))
+
+    async def clear(self):
+        await self.backend.clear()
+
+    def _refresh(self, key: str, name: str) -> asyncio.Task:
+        """Returns the in-flight fetch for `key`, starting one if needed."""
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._fetch_and_store(key, name))
+            self._inflight[key] = task
+        return task
+
+    async def _fetch_and_store(self, key: str, name: str) -> Optional[dict]:
+        try:
+            value = await self.fetch(name)
+            if value is None:
+                expire = self.negative_ttl
+            else:
+                expire = self.ttl + self.stale_ttl
+            await self.backend.set(key, {"value": value, "fetched_at": self.clock()}, expire)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background character refresh failed: {task.exception()}")
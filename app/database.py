@@ -4,10 +4,13 @@ Filename: database.py
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from typing import Generator
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from typing import AsyncGenerator, Generator
 
 import os
 
+from pool_metrics import pool_metrics, TimedQueuePool, TimedAsyncAdaptedQueuePool
+
 # This is better for security (passwords) and deployment.
 DB_USER = os.environ.get("DB_USER")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
@@ -16,15 +19,37 @@ DB_PORT = os.environ.get("DB_PORT")
 DB_NAME = os.environ.get("DB_NAME")
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# The same database through asyncpg, used by the route handlers
+ASYNC_SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 # Check if the database URL is set.  If not, raise an exception.
 if not SQLALCHEMY_DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set.  Please set it before running this script.")
 
 
+# Connection pool settings, shared by the sync and async engines (each gets its own pool).
+# pre-ping tests a connection on checkout, so connections dropped by a Postgres
+# restart are replaced instead of failing the request; recycle (seconds) retires
+# connections before server-side idle timeouts can kill them.
+POOL_SETTINGS = {
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+}
+
+
 # Create the SQLAlchemy engine.  This is the entry point for interacting with the database.
 # echo=True will log all SQL statements to the console, which can be helpful for debugging.
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=False) #Set echo to false for production
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    echo=False, #Set echo to false for production
+    poolclass=TimedQueuePool,
+    pool_logging_name="sync",
+    **POOL_SETTINGS
+)
+pool_metrics.attach(engine)
 
 
 # Create a SessionLocal class.  This class will be used to create database sessions.
@@ -33,6 +58,22 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=False) #Set echo to false f
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+# The async engine and session class used by the route handlers, so database
+# round trips don't block the event loop. The sync engine above stays in use for
+# Alembic, scripts and the model tests.
+# expire_on_commit=False keeps loaded attributes readable after a commit,
+# since an AsyncSession can't lazily reload them when a template touches them.
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    echo=False,
+    poolclass=TimedAsyncAdaptedQueuePool,
+    pool_logging_name="async",
+    **POOL_SETTINGS
+)
+pool_metrics.attach(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
 # Dependency to get a database session.
 # This function will create a new session, yield it to the caller, and then close it.
 # This ensures that the session is properly closed after it's used.
@@ -48,6 +89,15 @@ def get_db() -> Generator: # Changed the return type to Generator
     finally:
         db.close()
 
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Get an async database session. This is the dependency used by the FastAPI
+    route handlers; the session is closed once the request is done.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
 if __name__ == "__main__":
     # This block of code will only be executed if this file is run directly (e.g.,
     # with `python database.py`).  It's a good place to put code that tests
@@ -0,0 +1,122 @@
+"""
+Filename: dependencies.py
+"""
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Depends, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+from models import User, Character, World
+
+CURRENT_USER_CACHE_TTL = float(os.environ.get("CURRENT_USER_CACHE_TTL", "60")) # seconds
+CURRENT_USER_CACHE_SIZE = int(os.environ.get("CURRENT_USER_CACHE_SIZE", "1024"))
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """
+    Slim identity of the logged-in user, used by route handlers and the layout
+    macro. This is not an ORM object; load the User row when more is needed.
+    """
+    id: int
+    username: str
+    is_admin: bool
+    world_names: tuple = () # Worlds of the user's characters, for the layout sidebar
+
+
+class IdentityCache:
+    """
+    A small TTL + LRU cache of CurrentUser identities keyed by user id.
+    Entries expire after `ttl` seconds; the least recently used entry is
+    evicted once `maxsize` entries are stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[CurrentUser]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, identity = entry
+        if expires_at <= self.clock():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return identity
+
+    def set(self, identity: CurrentUser):
+        self._entries[identity.id] = (self.clock() + self.ttl, identity)
+        self._entries.move_to_end(identity.id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+current_user_cache = IdentityCache(maxsize=CURRENT_USER_CACHE_SIZE, ttl=CURRENT_USER_CACHE_TTL)
+
+
+def invalidate_current_user(*user_ids):
+    """
+    Drops cached identities. Call after a user's password or characters change.
+    """
+    for user_id in user_ids:
+        if user_id is not None:
+            current_user_cache.invalidate(user_id)
+
+
+async def load_current_user(user_id: int, db: AsyncSession) -> Optional[CurrentUser]:
+    """
+    Column-only lookup of a user and the worlds of their characters, in one query.
+    """
+    rows = (await db.execute(
+        select(User.id, User.username, User.is_admin, World.name)
+        .outerjoin(Character, Character.user_id == User.id)
+        .outerjoin(World, World.id == Character.world_id)
+        .where(User.id == user_id)
+        .order_by(Character.id)
+    )).all()
+    if not rows:
+        return None
+    world_names = []
+    for _, _, _, world_name in rows:
+        if world_name is not None and world_name not in world_names:
+            world_names.append(world_name)
+    user_id, username, is_admin, _ = rows[0]
+    return CurrentUser(id=user_id, username=username, is_admin=bool(is_admin), world_names=tuple(world_names))
+
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_db)) -> Optional[CurrentUser]:
+    """
+    Dependency returning the logged-in user's identity, or None.
+    Served from the identity cache when possible; a session pointing at a
+    user that no longer exists is cleared.
+    """
+    user_id = request.session.get('user_id')
+    if not user_id:
+        return None
+
+    identity = current_user_cache.get(user_id)
+    if identity is None:
+        identity = await load_current_user(user_id, db)
+        if identity is None:
+            request.session.pop('user_id', None)
+            request.session.pop('username', None)
+            return None
+        current_user_cache.set(identity)
+    return identity
@@ -0,0 +1,51 @@
+"""
+Filename: loaders.py
+
+Named loader-option profiles. Relationships in models.py use lazy "select"
+loading, so nothing is eager-loaded unless a query opts into it. Each route
+picks the profile matching what it (and its template) actually reads. The
+layout's user comes from dependencies.get_current_user, not from these.
+
+    result = await db.execute(select(User).options(*AUTH_ONLY).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+"""
+
+from sqlalchemy.orm import load_only, selectinload, joinedload
+
+from models import User, Character, Spawn, SpawnProposal
+
+# Identity and credentials only; for redirects, JSON endpoints and form posts.
+AUTH_ONLY = (
+    load_only(User.id, User.username, User.password_hash, User.is_admin),
+)
+
+# Pending spawn proposals on the world page show their sponsor count.
+WORLD_PAGE_PROPOSALS = (
+    selectinload(SpawnProposal.sponsors).load_only(User.id),
+)
+
+# Favourite spawns (and their worlds) shown as dashboard cards.
+DASHBOARD_SPAWNS = (
+    joinedload(Spawn.world),
+)
+
+# Sponsoring checks the proposal's world; sponsors are inserted, not loaded.
+SPONSOR_PROPOSAL = (
+    joinedload(SpawnProposal.world),
+)
+
+# Character pages show the character's world.
+CHARACTER_PAGE = (
+    joinedload(Character.world),
+)
+
+# The character detail page also shows the owner's name.
+CHARACTER_DETAIL_PAGE = CHARACTER_PAGE + (
+    joinedload(Character.user).load_only(User.id, User.username),
+)
+
+# The spawn page shows the spawn's world. Its change proposals' vote tallies
+# are counter columns, so no votes are loaded.
+SPAWN_PAGE_SPAWN = (
+    joinedload(Spawn.world),
+)
@@ -0,0 +1,292 @@
+"""
+Filename: lock_sweeper.py
+
+Locks scheduled bids once they enter their spawn's locking period
+(scheduled_start - Spawn.locking_period), from a background task.
+
+- Upcoming lock deadlines across all spawns sit in a min-heap, loaded once on
+  startup; the task sleeps until the earliest one.
+- Schedules are written through resolve_spawn_and_track and
+  change_schedule_and_track, which pass the new deadlines to `update` after
+  committing; that wakes the task if a deadline moved earlier. Superseded heap
+  entries are skipped when they come up rather than searched for.
+- Due bids are locked in one batched UPDATE that only matches bids still at
+  the start the heap knows, and every locked bid gets its Hunt row.
+
+The heap only hears about schedules written by its own process, so exactly
+one process runs the sweeper: the one that writes schedules. The web app
+starts it only with LOCK_SWEEPER_ENABLED set, which suits a single worker;
+with several workers, leave it unset and run the scheduling job instead,
+which resolves every spawn with open bids every SCHEDULE_RESOLVE_INTERVAL
+seconds and owns the sweeper:
+
+    python lock_sweeper.py          # resolve and lock until stopped
+    python lock_sweeper.py --once   # resolve, lock what is due, exit
+
+    if LOCK_SWEEPER_ENABLED:
+        lock_sweeper.start()   # on startup
+    await resolve_spawn_and_track(db, spawn_id)
+    await lock_sweeper.stop()   # on shutdown
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import sys
+from datetime import datetime, UTC
+from typing import Optional
+
+from sqlalchemy import select, update, or_, tuple_
+
+from database import AsyncSessionLocal
+from models import Bid, Hunt, Spawn
+from scheduler import claim_duration, insert_hunts, resolve_spawn, open_spawns, schedules
+
+logger = logging.getLogger(__name__)
+
+LOCK_SWEEPER_ENABLED = os.environ.get("LOCK_SWEEPER_ENABLED", "false").lower() in ("1", "true", "yes") # run the sweeper in this process
+LOCK_SWEEPER_RETRY = float(os.environ.get("LOCK_SWEEPER_RETRY", "10")) # seconds before retrying a failed sweep
+SCHEDULE_RESOLVE_INTERVAL = float(os.environ.get("SCHEDULE_RESOLVE_INTERVAL", "60")) # seconds between the scheduling job's resolutions
+
+
+def utc_now() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def lock_bids(connection, due: dict) -> list:
+    """
+    Locks the due bids, {bid_id: scheduled_start}, in one UPDATE, skipping
+    any that were rescheduled or locked since, and adds the Hunt rows locked
+    bids are missing. Runs in the caller's transaction.
+    Returns the locked bids' (id, spawn_id) rows.
+    """
+    locked = connection.execute(
+        update(Bid)
+        .where(tuple_(Bid.id, Bid.scheduled_start).in_(list(due.items())), or_(Bid.is_locked == False, Bid.is_locked.is_(None)))
+        .values(is_locked=True)
+        .returning(Bid.id, Bid.character_id, Bid.spawn_id, Bid.bid_points, Bid.claim_time, Bid.scheduled_start)
+    ).all()
+    if not locked:
+        return []
+
+    with_hunts = set(connection.scalars(select(Hunt.bid_id).where(Hunt.bid_id.in_([bid.id for bid in locked]))))
+    missing = [bid for bid in locked if bid.id not in with_hunts]
+    if missing:
+        spawns = {
+            spawn.id: spawn for spawn in connection.execute(
+                select(Spawn.id, Spawn.claim_time_min, Spawn.claim_time_max).where(Spawn.id.in_({bid.spawn_id for bid in missing}))
+            )
+        }
+        insert_hunts(connection, [
+            {
+                "character_id": bid.character_id,
+                "spawn_id": bid.spawn_id,
+                "start_time": bid.scheduled_start,
+                "end_time": bid.scheduled_start + claim_duration(bid.claim_time, spawns[bid.spawn_id].claim_time_min, spawns[bid.spawn_id].claim_time_max),
+                "points_paid": bid.bid_points,
+                "bid_id": bid.id,
+            }
+            for bid in missing
+        ])
+    return [(bid.id, bid.spawn_id) for bid in locked]
+
+
+class LockSweeper:
+    """Locks bids as their lock deadlines pass; see the module docstring."""
+
+    def __init__(self, session_factory, retry: float = LOCK_SWEEPER_RETRY, clock=utc_now):
+        self.session_factory = session_factory
+        self.retry = retry
+        self.clock = clock
+        self.loaded = False
+        self.last_error: Optional[str] = None
+        self._heap = [] # (lock_at, bid_id, scheduled_start)
+        self._entries = {} # bid_id -> its current (scheduled_start, lock_at)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Starts the background loop; returns immediately."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def load(self):
+        """Fills the heap with every scheduled, unlocked bid."""
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(Bid.id, Bid.scheduled_start, Spawn.locking_period)
+                .join(Spawn, Spawn.id == Bid.spawn_id)
+                .where(Bid.scheduled_start.isnot(None), or_(Bid.is_locked == False, Bid.is_locked.is_(None)))
+            )).all()
+        self._entries = {row.id: (row.scheduled_start, row.scheduled_start - row.locking_period) for row in rows}
+        self._heap = [(lock_at, bid_id, start) for bid_id, (start, lock_at) in self._entries.items()]
+        heapq.heapify(self._heap)
+        self.loaded = True
+        self._wakeup.set()
+
+    def update(self, lock_deadlines: dict):
+        """
+        Takes {bid_id: (scheduled_start, lock_at) or None}, as returned by
+        SpawnSchedule.write; None means the bid no longer needs locking.
+        """
+        for bid_id, entry in lock_deadlines.items():
+            if entry is None:
+                self._entries.pop(bid_id, None)
+                continue
+            self._entries[bid_id] = entry
+            start, lock_at = entry
+            heapq.heappush(self._heap, (lock_at, bid_id, start))
+        self._wakeup.set()
+
+    def next_deadline(self) -> Optional[datetime]:
+        while self._heap:
+            lock_at, bid_id, start = self._heap[0]
+            if self._entries.get(bid_id) == (start, lock_at):
+                return lock_at
+            heapq.heappop(self._heap) # superseded
+        return None
+
+    def _pop_due(self, now: datetime) -> dict:
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            lock_at, bid_id, start = heapq.heappop(self._heap)
+            if self._entries.get(bid_id) == (start, lock_at):
+                del self._entries[bid_id]
+                due[bid_id] = start
+        return due
+
+    async def sweep_once(self, now: Optional[datetime] = None) -> bool:
+        """
+        Locks the bids that are due. Returns False if it failed; the bids go
+        back on the heap, and errors are logged and kept in `last_error`.
+        """
+        due = self._pop_due(now or self.clock())
+        if not due:
+            return True
+        try:
+            async with self.session_factory() as db:
+                locked = await db.run_sync(lambda session: lock_bids(session.connection(), due))
+                await db.commit()
+        except Exception as e:
+            self.last_error = f"An unexpected error occurred while locking bids: {e}"
+            logger.error(self.last_error)
+            self.update({bid_id: (start, now or self.clock()) for bid_id, start in due.items() if bid_id not in self._entries})
+            return False
+        self.last_error = None
+        # Locked bids leave the open schedule; their hunts are reserved time now
+        for spawn_id in {spawn_id for _, spawn_id in locked}:
+            schedules.invalidate(spawn_id)
+        if locked:
+            logger.info(f"Locked {len(locked)} bids.")
+        return True
+
+    async def run_forever(self):
+        while not self.loaded:
+            try:
+                await self.load()
+            except Exception as e:
+                self.last_error = f"Could not load lock deadlines: {e}"
+                logger.error(self.last_error)
+                await asyncio.sleep(self.retry)
+        while True:
+            self._wakeup.clear()
+            if not await self.sweep_once():
+                await asyncio.sleep(self.retry)
+                continue
+            deadline = self.next_deadline()
+            timeout = None if deadline is None else max((deadline - self.clock()).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def status(self) -> dict:
+        next_deadline = self.next_deadline()
+        return {
+            "loaded": self.loaded,
+            "running": self._task is not None and not self._task.done(),
+            "pending": len(self._entries),
+            "next_deadline": next_deadline.isoformat() if next_deadline else None,
+            "last_error": self.last_error,
+        }
+
+
+lock_sweeper = LockSweeper(AsyncSessionLocal)
+
+
+async def resolve_spawn_and_track(db, spawn_id: int, now: Optional[datetime] = None) -> dict:
+    """
+    Resolves the spawn's open bids (see scheduler.resolve_spawn), commits,
+    and passes the new lock deadlines to lock_sweeper.
+    """
+    result = await db.run_sync(lambda session: resolve_spawn(session.connection(), spawn_id, now))
+    await db.commit()
+    lock_sweeper.update(result["lock_deadlines"])
+    return result
+
+
+async def change_schedule_and_track(db, spawn_id: int, change) -> dict:
+    """
+    Applies `change` to the spawn's kept schedule, e.g.
+    `lambda schedule: schedule.add(bid)`, writes it, commits, and passes the
+    new lock deadlines to lock_sweeper. If that fails, the kept schedule is
+    dropped so it is loaded again. Returns the lock deadlines.
+    """
+    def write(session):
+        schedule = schedules.get(session.connection(), spawn_id)
+        return schedule.write(session.connection(), change(schedule))
+
+    try:
+        lock_deadlines = await db.run_sync(write)
+        await db.commit()
+    except Exception:
+        schedules.invalidate(spawn_id)
+        raise
+    lock_sweeper.update(lock_deadlines)
+    return lock_deadlines
+
+
+async def resolve_open_spawns(session_factory, now: Optional[datetime] = None) -> dict:
+    """Resolves every spawn with open bids, committing once per spawn."""
+    totals = {"spawns": 0, "scheduled": 0, "unplaced": 0}
+    async with session_factory() as db:
+        for spawn_id in await db.run_sync(lambda session: open_spawns(session.connection(), now)):
+            result = await resolve_spawn_and_track(db, spawn_id, now)
+            totals["spawns"] += 1
+            totals["scheduled"] += result["scheduled"]
+            totals["unplaced"] += result["unplaced"]
+    return totals
+
+
+async def run_scheduling_job(once: bool = False, interval: float = SCHEDULE_RESOLVE_INTERVAL):
+    # Load the heap before resolving, so no tracked deadline is overwritten by the load
+    await lock_sweeper.load()
+    if once:
+        print(f"Resolved bids: {await resolve_open_spawns(AsyncSessionLocal)}")
+        await lock_sweeper.sweep_once()
+        return
+    lock_sweeper.start()
+    try:
+        while True:
+            try:
+                logger.info(f"Resolved bids: {await resolve_open_spawns(AsyncSessionLocal)}")
+            except Exception as e:
+                logger.error(f"Error resolving bids: {e}")
+            await asyncio.sleep(interval)
+    finally:
+        await lock_sweeper.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_scheduling_job(once="--once" in sys.argv[1:]))
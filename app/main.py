@@ -1,18 +1,24 @@
 import os, time
 from datetime import datetime, UTC
-import httpx # Import httpx for making async HTTP requests
 
-from fastapi import FastAPI, Request, status, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, status, Depends, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from templating import templates
 from fastapi.staticfiles import StaticFiles
-from models import User, Spawn, World
+from models import Spawn, user_spawn_favorites
 
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.middleware.sessions import SessionMiddleware
 
 # Assuming database.py and models.py are in the same 'app' directory
-from database import get_db
+from database import AsyncSessionLocal, get_async_db
+from loaders import DASHBOARD_SPAWNS
+from dependencies import CurrentUser, get_current_user
+from pool_metrics import pool_metrics
+from tibiadata import tibiadata
+from world_sync import world_sync
+from lock_sweeper import lock_sweeper, LOCK_SWEEPER_ENABLED
 from routers import accounts, characters, spawns # Import the new routers
 
 import logging
@@ -41,66 +47,28 @@ def convert_to_utc_naive(dt: datetime) -> datetime:
         return dt # Assuming naive inputs are already UTC for simplicity here.
 
 
-# --- World Update Function ---
-async def update_worlds_from_tibiadata(db: Session):
-    """
-    Fetches world data from TibiaData.com API and updates the local World table.
-    """
-    TIBIADATA_WORLDS_API = "https://api.tibiadata.com/v4/worlds"
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(TIBIADATA_WORLDS_API)
-            response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-            data = response.json()
-
-        worlds_data = data.get('worlds', {}).get('regular_worlds', []) + data.get('worlds', {}).get('tournament_worlds', []) # Include tournament worlds too
-
-        for world_info in worlds_data:
-            world_name = world_info.get('name')
-            world_location = world_info.get('location') # TibiaData provides location
-
-            if world_name:
-                existing_world = db.query(World).filter(World.name == world_name).first()
-                if existing_world:
-                    # Update existing world's location if it changed
-                    if existing_world.location != world_location:
-                        existing_world.location = world_location
-                        db.add(existing_world)
-                        logger.info(f"Updated world: {world_name}")
-                else:
-                    # Add new world
-                    new_world = World(name=world_name, location=world_location)
-                    db.add(new_world)
-                    logger.info(f"Added new world: {world_name}")
-
-        db.commit()
-        logger.info("World data updated successfully from TibiaData.com.")
-
-    except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error updating worlds from TibiaData: {e.response.status_code} - {e.response.text}")
-        db.rollback()
-    except httpx.RequestError as e:
-        logger.error(f"Network error updating worlds from TibiaData: {e}")
-        db.rollback()
-    except Exception as e:
-        logger.error(f"An unexpected error occurred while updating worlds: {e}")
-        db.rollback()
-
-
-# --- Database Initialization (for development/testing) ---
+# --- Startup / Shutdown ---
 @app.on_event("startup")
 async def on_startup():
-    # Call the world update function on startup
-    db_session = next(get_db()) # Get a session for the startup event
+    # Open the shared TibiaData client, then sync worlds in the background so
+    # a slow or unreachable API doesn't hold up startup
+    await tibiadata.start()
+    world_sync.start()
+    if LOCK_SWEEPER_ENABLED:
+        lock_sweeper.start() # Only in the process that writes schedules; see lock_sweeper.py
+    # Warm the world/spawn slug cache; if it fails, it loads on first use
     try:
-        await update_worlds_from_tibiadata(db_session)
-    finally:
-        db_session.close()
+        async with AsyncSessionLocal() as db:
+            await spawns.slug_resolver.load(db)
+    except Exception as e:
+        logger.warning(f"Could not preload the slug resolver: {e}")
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    pass
+    await lock_sweeper.stop()
+    await world_sync.stop()
+    await tibiadata.close()
 
 
 # --- Include Routers ---
@@ -117,31 +85,29 @@ async def read_root(request: Request):
     return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request, db: Session = Depends(get_db)):
+async def dashboard(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
+):
     start_time_total = time.time() # Start timing for the entire request
 
-    username = request.session.get('username')
-    user_id = request.session.get('user_id')
-
-    if not username or not user_id:
+    if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
     start_time_db = time.time() # Start timing for DB query
-    user = db.query(User).options(selectinload(User.favourite_spawns).joinedload(Spawn.world)).filter(User.id == user_id).first()
+    favourite_spawns = (await db.scalars(select(Spawn).options(*DASHBOARD_SPAWNS).join(
+        user_spawn_favorites, user_spawn_favorites.c.spawn_id == Spawn.id
+    ).where(user_spawn_favorites.c.user_id == user.id))).all()
     end_time_db = time.time() # End timing for DB query
     logger.info(f"Dashboard DB query time: {end_time_db - start_time_db:.4f} seconds")
 
-    if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-
     # --- Construct Dashboard Cards ---
     cards = []
 
     # Individual cards for each Favorite Spawn
-    if user.favourite_spawns:
-        for spawn in user.favourite_spawns:
+    if favourite_spawns:
+        for spawn in favourite_spawns:
             # For `timedelta` objects (like locking_period), convert to string for simpler display in template
             # If a more complex formatting is needed, create a custom Jinja2 filter or format here.
             cards.append({
@@ -165,13 +131,46 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         "dashboard.html",
         {
             "request": request,
-            "current_user": user, # Pass the full user object for layout macro
-            "username": username, # Keep for backward compatibility if needed in dashboard.html
+            "current_user": user, # Pass the user identity for the layout macro
+            "username": user.username, # Keep for backward compatibility if needed in dashboard.html
             "cards": cards, # Pass the structured cards data
             "breadcrumbs": breadcrumbs
         }
     )
 
+@app.get("/internal/pool-stats")
+async def pool_stats(user: CurrentUser = Depends(get_current_user)):
+    """
+    Connection pool usage per engine: live checked-out and overflow counts plus
+    checkout, invalidation, timeout and wait-time statistics. Admins only.
+    """
+    if not user or not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admins only.")
+    return pool_metrics.snapshot()
+
+@app.get("/health/live")
+async def liveness():
+    """The process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness(db: AsyncSession = Depends(get_async_db)):
+    """
+    Ready to serve traffic: the database answers and the World table has been
+    populated. A failing background world sync alone doesn't make the app unready.
+    """
+    checks = {"database": True, "worlds": world_sync.ready}
+    try:
+        await db.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.error(f"Readiness check: database unavailable: {e}")
+        checks["database"] = False
+    ready = all(checks.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "unavailable", "checks": checks, "world_sync": world_sync.status()},
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
 # --- Debug/Test Endpoint (Development Only) ---
 if os.environ.get("DEBUG_MODE") == "true":
     import unittest
@@ -0,0 +1,55 @@
+"""Add user_world_activity table
+
+Revision ID: b3e1c9a4d2f7
+Revises: a76c147d7d0c
+Create Date: 2026-10-17 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e1c9a4d2f7'
+down_revision: Union[str, None] = 'a76c147d7d0c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_world_activity',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('world_id', sa.Integer(), nullable=False),
+    sa.Column('spawn_id', sa.Integer(), nullable=False),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['spawn_id'], ['spawns.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['world_id'], ['worlds.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'world_id', 'spawn_id')
+    )
+    op.create_index('ix_user_world_activity_world_last_activity', 'user_world_activity', ['world_id', 'last_activity_at'], unique=False)
+    op.create_index('ix_user_world_activity_spawn_last_activity', 'user_world_activity', ['spawn_id', 'last_activity_at'], unique=False)
+
+    # Backfill from the existing bid and hunt history (same as backfill_activity.py)
+    op.execute("""
+        INSERT INTO user_world_activity (user_id, world_id, spawn_id, last_activity_at)
+        SELECT characters.user_id, characters.world_id, activity.spawn_id, max(activity.activity_at)
+        FROM characters
+        JOIN (
+            SELECT character_id, spawn_id, hunt_window_start AS activity_at FROM bids
+            UNION ALL
+            SELECT character_id, spawn_id, start_time AS activity_at FROM hunts
+        ) AS activity ON activity.character_id = characters.id
+        WHERE characters.user_id IS NOT NULL
+        GROUP BY characters.user_id, characters.world_id, activity.spawn_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_world_activity_spawn_last_activity', table_name='user_world_activity')
+    op.drop_index('ix_user_world_activity_world_last_activity', table_name='user_world_activity')
+    op.drop_table('user_world_activity')
@@ -0,0 +1,32 @@
+"""Add lower(name) indexes for case-insensitive lookups
+
+Revision ID: c4d2e8f1a9b3
+Revises: b3e1c9a4d2f7
+Create Date: 2026-10-17 14:02:18.227415
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d2e8f1a9b3'
+down_revision: Union[str, None] = 'b3e1c9a4d2f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_worlds_lower_name', 'worlds', [sa.text('lower(name)')], unique=False)
+    op.create_index('ix_spawns_world_id_lower_name', 'spawns', ['world_id', sa.text('lower(name)')], unique=False)
+    op.create_index('ix_spawn_proposals_lower_name', 'spawn_proposals', [sa.text('lower(name)')], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_spawn_proposals_lower_name', table_name='spawn_proposals')
+    op.drop_index('ix_spawns_world_id_lower_name', table_name='spawns')
+    op.drop_index('ix_worlds_lower_name', table_name='worlds')
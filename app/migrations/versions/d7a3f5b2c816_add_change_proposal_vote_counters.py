@@ -0,0 +1,43 @@
+"""Add upvotes/downvotes counters to spawn_change_proposals
+
+Revision ID: d7a3f5b2c816
+Revises: c4d2e8f1a9b3
+Create Date: 2026-10-17 15:31:06.804152
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3f5b2c816'
+down_revision: Union[str, None] = 'c4d2e8f1a9b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('spawn_change_proposals', sa.Column('upvotes', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('spawn_change_proposals', sa.Column('downvotes', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the tallies from the existing votes
+    op.execute("""
+        UPDATE spawn_change_proposals SET
+            upvotes = (
+                SELECT count(*) FROM change_votes
+                WHERE change_votes.proposal_id = spawn_change_proposals.id AND change_votes.vote_type = 'UPVOTE'
+            ),
+            downvotes = (
+                SELECT count(*) FROM change_votes
+                WHERE change_votes.proposal_id = spawn_change_proposals.id AND change_votes.vote_type = 'DOWNVOTE'
+            )
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('spawn_change_proposals', 'downvotes')
+    op.drop_column('spawn_change_proposals', 'upvotes')
@@ -0,0 +1,53 @@
+"""Add the append-only points ledger
+
+Revision ID: e5b9c3d71a42
+Revises: d7a3f5b2c816
+Create Date: 2026-10-19 10:12:44.517301
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b9c3d71a42'
+down_revision: Union[str, None] = 'd7a3f5b2c816'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('points_ledger',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('character_id', sa.Integer(), nullable=False),
+    sa.Column('spawn_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Numeric(), nullable=False),
+    sa.Column('reason', sa.Enum('HUNT', 'WAITING', 'ADJUSTMENT', name='ledgerreason'), nullable=False),
+    sa.Column('hunt_id', sa.Integer(), nullable=True),
+    sa.Column('bid_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['bid_id'], ['bids.id'], ),
+    sa.ForeignKeyConstraint(['character_id'], ['characters.id'], ),
+    sa.ForeignKeyConstraint(['hunt_id'], ['hunts.id'], ),
+    sa.ForeignKeyConstraint(['spawn_id'], ['spawns.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('reason', 'bid_id', name='_points_ledger_bid_uc'),
+    sa.UniqueConstraint('reason', 'hunt_id', name='_points_ledger_hunt_uc')
+    )
+    op.create_index('ix_points_ledger_character_spawn', 'points_ledger', ['character_id', 'spawn_id'], unique=False)
+
+    # Existing balances become the ledger's opening entries
+    op.execute("""
+        INSERT INTO points_ledger (character_id, spawn_id, amount, reason, created_at)
+        SELECT character_id, spawn_id, points, 'ADJUSTMENT', now() FROM points
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_points_ledger_character_spawn', table_name='points_ledger')
+    op.drop_table('points_ledger')
+    op.execute("DROP TYPE IF EXISTS ledgerreason")
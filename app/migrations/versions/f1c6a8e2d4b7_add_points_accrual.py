@@ -0,0 +1,43 @@
+"""Add lazy accrual (base_time, rate) to points
+
+Revision ID: f1c6a8e2d4b7
+Revises: e5b9c3d71a42
+Create Date: 2026-10-19 16:40:21.093518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c6a8e2d4b7'
+down_revision: Union[str, None] = 'e5b9c3d71a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('points', sa.Column('base_time', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    op.add_column('points', sa.Column('rate', sa.Numeric(), server_default='0', nullable=False))
+    # New enum values can't be added inside a transaction on older Postgres
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE ledgerreason ADD VALUE IF NOT EXISTS 'ACCRUAL'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # The older model has no ACCRUAL reason: fold the accrued points into one
+    # ADJUSTMENT per balance, so the ledger still sums to the same balances
+    op.execute("""
+        INSERT INTO points_ledger (character_id, spawn_id, amount, reason, created_at)
+        SELECT character_id, spawn_id, SUM(amount), 'ADJUSTMENT', now()
+        FROM points_ledger WHERE reason = 'ACCRUAL'
+        GROUP BY character_id, spawn_id
+    """)
+    op.execute("DELETE FROM points_ledger WHERE reason = 'ACCRUAL'")
+    op.drop_column('points', 'rate')
+    op.drop_column('points', 'base_time')
+    # Postgres can't drop an enum value; ACCRUAL stays in ledgerreason
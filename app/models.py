@@ -3,13 +3,17 @@ import hashlib
 import enum
 import math
 
+from decimal import Decimal
 from datetime import datetime, UTC, timedelta
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, CheckConstraint, Boolean, Numeric, event, Enum, Table, Interval
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, CheckConstraint, Boolean, Numeric, event, Enum, Table, Interval, Index, insert, delete, update, literal, literal_column, inspect, tuple_, exists
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import relationship, column_property
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql import func, select, and_
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql import func, select, and_, case, union_all, true
+from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
 
 class ProposalStatus(enum.Enum):
     PENDING = "pending"
@@ -27,6 +31,12 @@ class VoteType(enum.Enum):
     UPVOTE = "upvote"
     DOWNVOTE = "downvote"
 
+class LedgerReason(enum.Enum):
+    HUNT = "hunt" # a winner paying for its hunt
+    WAITING = "waiting" # a bid that lost, credited for waiting
+    ACCRUAL = "accrual" # points grown over time, written when they're spent
+    ADJUSTMENT = "adjustment"
+
 Base = declarative_base()
 
 proposal_sponsors = Table(
@@ -42,9 +52,35 @@ class Vote(Base):
     proposal_id = Column(Integer, ForeignKey('spawn_change_proposals.id'), primary_key=True)
     vote_type = Column(Enum(VoteType))
 
-    user = relationship('User', back_populates='votes', lazy='joined')
-    proposal = relationship("SpawnChangeProposal", back_populates='votes', lazy='joined')
+    user = relationship('User', back_populates='votes')
+    proposal = relationship("SpawnChangeProposal", back_populates='votes')
 
+    @classmethod
+    def cast(cls, connection, user_id, proposal_id, spawn_id, vote_type):
+        """
+        Records a user's vote on a pending change proposal of the spawn and
+        counts it without explicit locks: INSERT ... ON CONFLICT DO NOTHING, then
+        the counter UPDATE ... RETURNING. Runs in the caller's transaction.
+        Returns the proposal's (upvotes, downvotes) after the vote, or None if
+        nothing was recorded (already voted, or no such pending proposal).
+        """
+        stmt = postgresql.insert(cls) if connection.dialect.name == 'postgresql' else sqlite.insert(cls)
+        stmt = stmt.from_select(
+            ['user_id', 'proposal_id', 'vote_type'],
+            select(
+                literal(user_id, Integer),
+                SpawnChangeProposal.id,
+                literal(vote_type, cls.vote_type.type)
+            ).where(
+                SpawnChangeProposal.id == proposal_id,
+                SpawnChangeProposal.spawn_id == spawn_id,
+                SpawnChangeProposal.status == ProposalStatus.PENDING
+            )
+        ).on_conflict_do_nothing(index_elements=['user_id', 'proposal_id']).returning(cls.proposal_id)
+        if connection.execute(stmt).first() is None:
+            return None
+        # Core inserts skip the mapper listeners, so count the vote here
+        return count_vote(connection, proposal_id, vote_type, 1)
 
 
 # New association table for User and Spawn (Favorites)
@@ -61,11 +97,11 @@ class User(Base):
     username = Column(String(80), unique=True, nullable=False)
     password_hash = Column(String(120), nullable=False)
     discord_id = Column(String(50), unique=True, nullable=True)  # Added for Discord integration
-    characters = relationship('Character', back_populates='user', lazy='joined')
-    recovery_tokens = relationship('RecoveryToken', back_populates='user', lazy='joined')
+    characters = relationship('Character', back_populates='user')
+    recovery_tokens = relationship('RecoveryToken', back_populates='user')
     is_admin = Column(Boolean, default=False)
     notifications = relationship('Notification', back_populates='user') # Added back_populates
-    votes = relationship('Vote', back_populates='user', lazy='joined')
+    votes = relationship('Vote', back_populates='user')
 
     sponsored_proposals = relationship(
         "SpawnProposal",
@@ -116,7 +152,7 @@ class Character(Base):
     name = Column(String(80), nullable=False) # This is now the Tibia.com name, globally unique
     level = Column(Integer, nullable=False) # Added back, nullable
     vocation = Column(String(50), nullable=False) # Added back, nullable
-    user_id = Column(Integer, ForeignKey('users.id')) # Changed to nullable for disown
+    user_id = column_property(Column(Integer, ForeignKey('users.id')), active_history=True) # Nullable for disown; the old owner's activity is rebuilt on change
     last_login = Column(DateTime, nullable=True)
     world_id = Column(Integer, ForeignKey('worlds.id'), nullable=False)
     validation_hash = Column(String(120), unique=True, nullable=True) # NULL means validated, non-NULL means pending validation
@@ -176,9 +212,14 @@ class World(Base):
     sponsorship_flat = Column(Integer, nullable=False, default=5)
     sposorship_fraction = Column(Numeric, nullable=False, default=0.1)
 
-    spawns = relationship('Spawn', back_populates='world', lazy='joined')
-    spawn_proposals = relationship('SpawnProposal', back_populates='world', lazy='joined')
-    characters = relationship('Character', back_populates='world', lazy='joined')
+    spawns = relationship('Spawn', back_populates='world')
+    spawn_proposals = relationship('SpawnProposal', back_populates='world')
+    characters = relationship('Character', back_populates='world')
+
+    # URLs name worlds case-insensitively: func.lower(World.name) == world_name.lower()
+    __table_args__ = (
+        Index('ix_worlds_lower_name', func.lower(name)),
+    )
 
     def get_active_users(self, db):
         """
@@ -190,38 +231,108 @@ class World(Base):
         # Calculate the threshold date in Python for the query
         threshold_date = datetime.now(UTC) - self.inactive_threshold
 
-        # Query to find the latest activity date (Bid or Hunt) for each user
-        # across their characters in this specific world.
-        latest_user_activity_in_world = (
+        # Users with any recorded activity in this world since the threshold date
+        active_user_ids = (
+            select(UserWorldActivity.user_id)
+            .where(
+                UserWorldActivity.world_id == self.id,
+                UserWorldActivity.last_activity_at >= threshold_date
+            )
+        )
+
+        return db.query(User).filter(User.id.in_(active_user_ids)).all()
+
+    @classmethod
+    def count_active_users(cls, db, worlds):
+        """
+        Returns a {world_id: active_user_count} mapping for the given worlds.
+        Uses the same activity rules as get_active_users, but counts every world
+        in a single grouped query without loading any User objects.
+        Worlds without active users are left out of the mapping.
+        """
+        now = datetime.now(UTC)
+        threshold_dates = {world.id: now - world.inactive_threshold for world in worlds}
+        if not threshold_dates:
+            return {}
+
+        # Each world has its own inactive_threshold, so pick the cutoff per row
+        threshold_date = case(threshold_dates, value=UserWorldActivity.world_id)
+
+        active_user_counts = (
             db.query(
-                User.id.label('user_id'),
-                func.max(func.greatest(
-                    Bid.hunt_window_start,
-                    Hunt.start_time
-                )).label('overall_last_activity')
+                UserWorldActivity.world_id,
+                func.count(func.distinct(UserWorldActivity.user_id))
             )
-            .join(Character, Character.user_id == User.id)
-            .outerjoin(Bid, Bid.character_id == Character.id)
-            .outerjoin(Hunt, Hunt.character_id == Character.id)
-            .filter(Character.world_id == self.id) # Filter characters to this specific world instance
-            .group_by(User.id)
-        ).subquery()
-
-        # Query for User objects based on their latest activity date in this world
-        active_users_query = (
-            db.query(User)
-            .join(latest_user_activity_in_world, latest_user_activity_in_world.c.user_id == User.id)
             .filter(
-                and_(
-                    latest_user_activity_in_world.c.overall_last_activity.isnot(None), # Must have activity
-                    latest_user_activity_in_world.c.overall_last_activity >= threshold_date # Activity is recent enough
-                )
+                UserWorldActivity.world_id.in_(threshold_dates),
+                UserWorldActivity.last_activity_at >= threshold_date
             )
-            .distinct() # Ensure distinct User objects
+            .group_by(UserWorldActivity.world_id)
+            .all()
         )
+        return {world_id: count for world_id, count in active_user_counts}
 
-        return active_users_query.all()
+    def stats_select(self):
+        """
+        A single-row select of this world's spawn, character, user, active-user
+        (same rules as get_active_users) and pending proposal counts, each as a
+        scalar subquery, so no ORM objects are loaded.
+        """
+        threshold_date = datetime.now(UTC) - self.inactive_threshold
+        return select(
+            select(func.count(Spawn.id)).where(Spawn.world_id == self.id)
+                .scalar_subquery().label('spawn_count'),
+            select(func.count(Character.id)).where(Character.world_id == self.id)
+                .scalar_subquery().label('character_count'),
+            select(func.count(func.distinct(Character.user_id))).where(Character.world_id == self.id)
+                .scalar_subquery().label('user_count'),
+            select(func.count(func.distinct(UserWorldActivity.user_id))).where(
+                UserWorldActivity.world_id == self.id,
+                UserWorldActivity.last_activity_at >= threshold_date
+            ).scalar_subquery().label('active_users_count'),
+            select(func.count(SpawnProposal.id)).where(
+                SpawnProposal.world_id == self.id,
+                SpawnProposal.status == ProposalStatus.PENDING
+            ).scalar_subquery().label('pending_proposals_count'),
+        )
+
+    @classmethod
+    def upsert_many(cls, connection, worlds):
+        """
+        Inserts or updates [{"name", "location"}] worlds in a single
+        INSERT ... ON CONFLICT (name) DO UPDATE, touching only rows whose
+        location changed. Returns {"inserted", "updated", "unchanged"} counts.
+        """
+        # ON CONFLICT can't update the same row twice in one statement
+        rows = list({world["name"]: {"name": world["name"], "location": world["location"]} for world in worlds}.values())
+        if not rows:
+            return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        if connection.dialect.name == 'postgresql':
+            stmt = postgresql.insert(cls)
+        else:
+            stmt = sqlite.insert(cls)
+            # SQLite has no xmax to tell inserts from updates, so look the names up first
+            existing = set(connection.execute(
+                select(cls.name).where(cls.name.in_([row["name"] for row in rows]))
+            ).scalars())
+        stmt = stmt.values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={'location': stmt.excluded.location},
+            where=cls.location.is_distinct_from(stmt.excluded.location)
+        )
 
+        if connection.dialect.name == 'postgresql':
+            # xmax is 0 for freshly inserted row versions
+            written = connection.execute(stmt.returning(literal_column("xmax = 0"))).scalars().all()
+            inserted = sum(1 for is_insert in written if is_insert)
+            updated = len(written) - inserted
+        else:
+            written = connection.execute(stmt.returning(cls.name)).scalars().all()
+            inserted = sum(1 for name in written if name not in existing)
+            updated = len(written) - inserted
+        return {"inserted": inserted, "updated": updated, "unchanged": len(rows) - len(written)}
 
     def __repr__(self):
         return f'<World {self.name}>'
@@ -243,8 +354,8 @@ class Spawn(Base):
     world = relationship('World', back_populates='spawns')
     proposal_origin = relationship('SpawnProposal', back_populates='spawn')
     change_proposals = relationship('SpawnChangeProposal', back_populates='spawn')
-    hunts = relationship('Hunt', back_populates='spawn', lazy='joined')
-    bids = relationship('Bid', back_populates='spawn', lazy='joined')
+    hunts = relationship('Hunt', back_populates='spawn')
+    bids = relationship('Bid', back_populates='spawn')
 
     # Updated: Using association table for favourited by users
     favourited_by = relationship(
@@ -256,6 +367,8 @@ class Spawn(Base):
     )
     __table_args__ = (
         UniqueConstraint('name', 'world_id', name='_spawn_name_world_uc'),
+        # Case-insensitive lookup of a spawn within its world
+        Index('ix_spawns_world_id_lower_name', world_id, func.lower(name)),
     )
 
     def get_active_users(self, db):
@@ -270,36 +383,43 @@ class Spawn(Base):
 
         threshold_date = datetime.now(UTC) - self.world.inactive_threshold
 
-        # Query to find the latest activity date (Bid or Hunt) for each user
-        # across their characters on this specific spawn.
-        latest_user_activity_on_spawn = (
+        # Users with any recorded activity on this spawn since the threshold date
+        active_user_ids = (
+            select(UserWorldActivity.user_id)
+            .where(
+                UserWorldActivity.spawn_id == self.id,
+                UserWorldActivity.last_activity_at >= threshold_date
+            )
+        )
+        return db.query(User).filter(User.id.in_(active_user_ids)).all()
+
+    @classmethod
+    def count_active_users(cls, db, spawns):
+        """
+        Returns a {spawn_id: active_user_count} mapping for the given spawns,
+        with the same rules as get_active_users, in one grouped query.
+        The spawns' worlds must be loaded. Spawns without active users are
+        left out of the mapping.
+        """
+        now = datetime.now(UTC)
+        threshold_dates = {spawn.id: now - spawn.world.inactive_threshold for spawn in spawns}
+        if not threshold_dates:
+            return {}
+
+        threshold_date = case(threshold_dates, value=UserWorldActivity.spawn_id)
+        active_user_counts = (
             db.query(
-                User.id.label('user_id'),
-                func.max(func.greatest(
-                    Bid.hunt_window_start,
-                    Hunt.start_time
-                )).label('overall_last_activity')
+                UserWorldActivity.spawn_id,
+                func.count(func.distinct(UserWorldActivity.user_id))
             )
-            .join(Character, Character.user_id == User.id)
-            .outerjoin(Bid, and_(Bid.character_id == Character.id, Bid.spawn_id == self.id)) # Filter bids to this spawn
-            .outerjoin(Hunt, and_(Hunt.character_id == Character.id, Hunt.spawn_id == self.id)) # Filter hunts to this spawn
-            .filter(Character.world_id == self.world_id) # Ensure character is in the same world as spawn
-            .group_by(User.id)
-        ).subquery()
-
-        # Query for User objects based on their latest activity date on this spawn
-        active_users_query = (
-            db.query(User)
-            .join(latest_user_activity_on_spawn, latest_user_activity_on_spawn.c.user_id == User.id)
             .filter(
-                and_(
-                    latest_user_activity_on_spawn.c.overall_last_activity.isnot(None), # Must have activity
-                    latest_user_activity_on_spawn.c.overall_last_activity >= threshold_date # Activity is recent enough
-                )
+                UserWorldActivity.spawn_id.in_(threshold_dates),
+                UserWorldActivity.last_activity_at >= threshold_date
             )
-            .distinct()
+            .group_by(UserWorldActivity.spawn_id)
+            .all()
         )
-        return active_users_query.all()
+        return {spawn_id: count for spawn_id, count in active_user_counts}
 
     def __repr__(self):
         return f'<Spawn {self.name}>'
@@ -337,6 +457,11 @@ class SpawnProposal(Base):
         back_populates="sponsored_proposals"
     )
 
+    # Proposal names are unique; new proposals are checked case-insensitively
+    __table_args__ = (
+        Index('ix_spawn_proposals_lower_name', func.lower(name)),
+    )
+
     @hybrid_property
     def num_sponsors(self) -> int:
         """Calculates the number of unique sponsors for this proposal."""
@@ -351,6 +476,39 @@ class SpawnProposal(Base):
             .label("num_unique_sponsors")
         )
 
+    @classmethod
+    def sponsor(cls, connection, user_id, proposal_id):
+        """
+        Adds the user as a sponsor of the pending proposal with INSERT ... ON
+        CONFLICT DO NOTHING. Runs in the caller's transaction.
+        Returns the proposal's sponsor count after the insert, or None if
+        nothing was added (already a sponsor, or no longer pending).
+        """
+        stmt = postgresql.insert(proposal_sponsors) if connection.dialect.name == 'postgresql' else sqlite.insert(proposal_sponsors)
+        stmt = stmt.from_select(
+            ['user_id', 'spawn_proposal_id'],
+            select(literal(user_id, Integer), cls.id).where(cls.id == proposal_id, cls.status == ProposalStatus.PENDING)
+        ).on_conflict_do_nothing(index_elements=['user_id', 'spawn_proposal_id']).returning(proposal_sponsors.c.spawn_proposal_id)
+        if connection.execute(stmt).first() is None:
+            return None
+        return connection.scalar(
+            select(func.count()).select_from(proposal_sponsors).where(proposal_sponsors.c.spawn_proposal_id == proposal_id)
+        )
+
+    @classmethod
+    def approve(cls, connection, proposal_id):
+        """
+        Approves a pending proposal with a conditional UPDATE, so of several
+        concurrent sponsors exactly one succeeds and creates its Spawn.
+        Returns the approved proposal's row, or None if it was no longer pending.
+        """
+        return connection.execute(
+            update(cls)
+            .where(cls.id == proposal_id, cls.status == ProposalStatus.PENDING)
+            .values(status=ProposalStatus.APPROVED, approved_at=datetime.now(UTC))
+            .returning(cls.name, cls.description, cls.world_id, cls.locking_period, cls.claim_time_min, cls.claim_time_max, cls.deprioratize_time)
+        ).first()
+
     def __repr__(self) -> str:
         return f"<SpawnProposal(id={self.id}, name='{self.name}', status='{self.status.value}')>"
 
@@ -376,7 +534,11 @@ class SpawnChangeProposal(Base):
     # Link to the actual Spawn if the proposal is approved and spawn created
     spawn_id = Column(Integer, ForeignKey('spawns.id'), nullable=True)
     spawn = relationship('Spawn', foreign_keys=[spawn_id], back_populates='change_proposals') # Link back to the created Spawn
-    votes = relationship('Vote', back_populates='proposal', lazy='joined')
+    votes = relationship('Vote', back_populates='proposal')
+
+    # Vote tallies, kept in step with change_votes by the Vote listeners below
+    upvotes = Column(Integer, nullable=False, default=0, server_default='0')
+    downvotes = Column(Integer, nullable=False, default=0, server_default='0')
 
     __table_args__ = (
         CheckConstraint(
@@ -385,38 +547,49 @@ class SpawnChangeProposal(Base):
         ),
     )
 
-    @property
-    def total_votes(self):
-        return len(self.votes)
+    @hybrid_property
+    def total_votes(self) -> int:
+        return self.upvotes + self.downvotes
 
     @property
     def favourability(self):
         return math.floor(self.votes_for / max(self.total_votes, 1) * 100)
 
+    def engagement_for(self, active_users_count):
+        """Votes per active user of the spawn, given that count."""
+        return math.floor(self.total_votes / max(active_users_count, 1))
+
     def get_engagement(self, session):
-        return math.floor(self.total_votes / max(len(self.spawn.get_active_users(session)),1))
+        active_users_count = Spawn.count_active_users(session, [self.spawn]).get(self.spawn_id, 0)
+        return self.engagement_for(active_users_count)
 
     @hybrid_property
     def votes_for(self) -> int:
-        """Calculates the total upvotes for this change proposal."""
-        return sum([1 for vote in self.votes if vote.vote_type == VoteType.UPVOTE])
-
-    @votes_for.expression
-    def votes_for_ex(cls):
-        return func.count(Vote.id).filter((Vote.proposal_id == cls.id) & (Vote.vote_type == 'UPVOTE'))
+        """The total upvotes for this change proposal."""
+        return self.upvotes
 
     @hybrid_property
     def votes_against(self) -> int:
-        """Calculates the total downvotes for this change proposal."""
-        return sum([1 for vote in self.votes if vote.vote_type == VoteType.DOWNVOTE])
-
-    @votes_against.expression
-    def votes_against_ex(cls):
-        return func.count(Vote.id).filter((Vote.proposal_id == cls.id) & (Vote.vote_type == 'DOWNVOTE'))
+        """The total downvotes for this change proposal."""
+        return self.downvotes
 
     def __repr__(self) -> str:
         return f"<SpawnChangeProposal(id={self.id}, name='{self.name}', status='{self.status.value}')>"
 
+    @classmethod
+    def decide(cls, connection, proposal_id, status):
+        """
+        Moves a pending proposal to APPROVED or REJECTED with a conditional
+        UPDATE, so of several concurrent deciders exactly one succeeds.
+        Returns the decided proposal's row, or None if it was no longer pending.
+        """
+        return connection.execute(
+            update(cls)
+            .where(cls.id == proposal_id, cls.status == ProposalStatus.PENDING)
+            .values(status=status, approved_at=datetime.now(UTC))
+            .returning(cls.start_time, cls.locking_period, cls.claim_time_min, cls.claim_time_max)
+        ).first()
+
 class Notification(Base):
     __tablename__ = 'notifications'
     id = Column(Integer, primary_key=True)
@@ -436,20 +609,150 @@ class Notification(Base):
     def __repr__(self) -> str:
         return f"<Notification(id={self.id}, user_id={self.user_id}, type='{self.notification_type.value}', is_read={self.is_read})>"
 
+class elapsed_seconds(FunctionElement):
+    """SQL for the seconds from one timestamp to another, as a number."""
+    type = Numeric()
+    inherit_cache = True
+
+@compiles(elapsed_seconds)
+def compile_elapsed_seconds(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f"EXTRACT(EPOCH FROM ({compiler.process(end, **kw)} - {compiler.process(start, **kw)}))"
+
+@compiles(elapsed_seconds, 'sqlite')
+def compile_elapsed_seconds_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f"((julianday({compiler.process(end, **kw)}) - julianday({compiler.process(start, **kw)})) * 86400.0)"
+
+
 class Points(Base):
+    """
+    Current balance of each character per spawn: a projection of the points
+    ledger, updated with every settlement and rebuildable from it.
+
+    Points also grow by `rate` per hour since `base_time`. That is computed on
+    read (points_at) and only written back, as an accrual entry in the ledger,
+    when the character spends points; idle characters cost nothing.
+    """
     __tablename__ = 'points'
     id = Column(Integer, primary_key=True)
     character_id = Column(Integer, ForeignKey('characters.id'), nullable=False)
     spawn_id = Column(Integer, ForeignKey('spawns.id'), nullable=False)
-    points = Column(Numeric, nullable=False) # Changed to Numeric for fractional values
+    points = Column(Numeric, nullable=False) # Balance at base_time; Changed to Numeric for fractional values
+    base_time = Column(DateTime, nullable=False, default=lambda: datetime.now(UTC).replace(tzinfo=None), server_default=func.now())
+    rate = Column(Numeric, nullable=False, default=0, server_default='0') # Points accrued per hour
     character = relationship('Character')
     spawn = relationship('Spawn')
     __table_args__ = (
         UniqueConstraint('character_id', 'spawn_id', name='_character_spawn_points_uc'),
     )
+
+    @hybrid_method
+    def points_at(self, now):
+        """The balance at `now`, accrual included."""
+        elapsed = Decimal(str((now - self.base_time).total_seconds()))
+        return Decimal(self.points) + Decimal(self.rate) * elapsed / 3600
+
+    @points_at.expression
+    def points_at(cls, now):
+        """The balance at `now` in SQL, for ranking: order_by(Points.points_at(now).desc())."""
+        return cls.points + cls.rate * elapsed_seconds(cls.base_time, literal(now, DateTime)) / 3600
+
+    @classmethod
+    def add(cls, connection, amounts: dict, now=None):
+        """Adds {(character_id, spawn_id): amount} to the balances in one upsert."""
+        if not amounts:
+            return
+        now = now or datetime.now(UTC).replace(tzinfo=None)
+        stmt = postgresql.insert(cls) if connection.dialect.name == 'postgresql' else sqlite.insert(cls)
+        stmt = stmt.values([
+            {"character_id": character_id, "spawn_id": spawn_id, "points": amount, "base_time": now}
+            for (character_id, spawn_id), amount in amounts.items()
+        ])
+        # Accrual doesn't depend on the balance, so amounts add to the base as is
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['character_id', 'spawn_id'],
+            set_={'points': cls.points + stmt.excluded.points}
+        )
+        connection.execute(stmt)
+
+    @classmethod
+    def materialize(cls, connection, keys, now):
+        """
+        Writes the points accrued since base_time for the (character_id,
+        spawn_id) keys into the ledger and the balance, and moves base_time
+        to `now`. Called before points are spent.
+        """
+        if not keys:
+            return
+        due = and_(tuple_(cls.character_id, cls.spawn_id).in_(list(keys)), cls.base_time < now)
+        connection.execute(insert(PointsLedgerEntry).from_select(
+            ['character_id', 'spawn_id', 'amount', 'reason', 'created_at'],
+            select(
+                cls.character_id, cls.spawn_id, cls.points_at(now) - cls.points,
+                literal(LedgerReason.ACCRUAL, PointsLedgerEntry.reason.type), literal(now, DateTime)
+            ).where(due, cls.rate != 0)
+        ))
+        connection.execute(update(cls).where(due).values(points=cls.points_at(now), base_time=now))
+
+    @classmethod
+    def rebuild(cls, connection, spawn_id=None):
+        """
+        Recomputes the balances (of one spawn, or all) from the ledger, keeping
+        each row's base_time and rate. Returns the number of rows written.
+        """
+        entries = PointsLedgerEntry.__table__
+        balances = (
+            select(entries.c.character_id, entries.c.spawn_id, func.sum(entries.c.amount))
+            .group_by(entries.c.character_id, entries.c.spawn_id)
+        )
+        unbacked = update(cls).where(~exists().where(
+            entries.c.character_id == cls.character_id, entries.c.spawn_id == cls.spawn_id
+        )).values(points=0)
+        if spawn_id is not None:
+            balances = balances.where(entries.c.spawn_id == spawn_id)
+            unbacked = unbacked.where(cls.spawn_id == spawn_id)
+        connection.execute(unbacked)
+
+        stmt = postgresql.insert(cls) if connection.dialect.name == 'postgresql' else sqlite.insert(cls)
+        stmt = stmt.from_select(['character_id', 'spawn_id', 'points'], balances)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['character_id', 'spawn_id'],
+            set_={'points': stmt.excluded.points}
+        )
+        return connection.execute(stmt).rowcount
+
     def __repr__(self):
         return f'<Points {self.points:.2f} for Character {self.character_id} on Spawn {self.spawn_id}>'
 
+
+class PointsLedgerEntry(Base):
+    """
+    One change to a character's points on a spawn. Entries are only ever
+    appended; balances are their sums, kept in Points.
+    A hunt is debited and a losing bid credited at most once.
+    """
+    __tablename__ = 'points_ledger'
+    id = Column(Integer, primary_key=True)
+    character_id = Column(Integer, ForeignKey('characters.id'), nullable=False)
+    spawn_id = Column(Integer, ForeignKey('spawns.id'), nullable=False)
+    amount = Column(Numeric, nullable=False) # negative for debits
+    reason = Column(Enum(LedgerReason), nullable=False)
+    hunt_id = Column(Integer, ForeignKey('hunts.id'), nullable=True)
+    bid_id = Column(Integer, ForeignKey('bids.id'), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(UTC).replace(tzinfo=None))
+    character = relationship('Character')
+    spawn = relationship('Spawn')
+
+    __table_args__ = (
+        UniqueConstraint('reason', 'hunt_id', name='_points_ledger_hunt_uc'),
+        UniqueConstraint('reason', 'bid_id', name='_points_ledger_bid_uc'),
+        Index('ix_points_ledger_character_spawn', 'character_id', 'spawn_id'),
+    )
+
+    def __repr__(self):
+        return f'<PointsLedgerEntry {self.amount} ({self.reason.value}) for Character {self.character_id} on Spawn {self.spawn_id}>'
+
 class Bid(Base):
     __tablename__ = 'bids'
     id = Column(Integer, primary_key=True)
@@ -489,3 +792,219 @@ class Hunt(Base):
 
     def __repr__(self):
         return f'<Hunt {self.id} - {self.character.name} on {self.spawn.name}>'
+
+
+class UserWorldActivity(Base):
+    """
+    Materialized last activity (Bid or Hunt) of each user per world and spawn.
+    Maintained on Bid/Hunt insert by the listeners below, so active-user checks
+    are an index range scan instead of an aggregate over the whole history.
+    A user's rows are rebuilt when their bids or hunts are deleted or their
+    characters change owner.
+    """
+    __tablename__ = 'user_world_activity'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    world_id = Column(Integer, ForeignKey('worlds.id'), primary_key=True)
+    spawn_id = Column(Integer, ForeignKey('spawns.id'), primary_key=True)
+    last_activity_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_user_world_activity_world_last_activity', 'world_id', 'last_activity_at'),
+        Index('ix_user_world_activity_spawn_last_activity', 'spawn_id', 'last_activity_at'),
+    )
+
+    @classmethod
+    def upsert_from_select(cls, connection, activity_select):
+        """
+        Inserts (user_id, world_id, spawn_id, last_activity_at) rows selected by
+        activity_select, keeping the later activity date on conflict.
+        """
+        if connection.dialect.name == 'postgresql':
+            stmt = postgresql.insert(cls)
+            latest = func.greatest
+        else:
+            # SQLite's multi-argument max() is a scalar function, like GREATEST().
+            # Without a WHERE, SQLite reads ON CONFLICT as a join constraint.
+            stmt = sqlite.insert(cls)
+            latest = func.max
+            activity_select = activity_select.where(true())
+        stmt = stmt.from_select(['user_id', 'world_id', 'spawn_id', 'last_activity_at'], activity_select)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'world_id', 'spawn_id'],
+            set_={'last_activity_at': latest(cls.last_activity_at, stmt.excluded.last_activity_at)}
+        )
+        return connection.execute(stmt)
+
+    @classmethod
+    def record(cls, connection, character_id, spawn_id, activity_at):
+        """Records one activity of a character on a spawn for the character's owner."""
+        activity_select = (
+            select(
+                Character.user_id,
+                Character.world_id,
+                literal(spawn_id, Integer),
+                literal(activity_at, DateTime)
+            )
+            .where(Character.id == character_id, Character.user_id.isnot(None))
+        )
+        cls.upsert_from_select(connection, activity_select)
+
+    @classmethod
+    def refresh(cls, connection, user_ids, spawn_id=None):
+        """
+        Rebuilds the rows of some users, optionally on one spawn only, from
+        their characters' current bids and hunts. The upserts only move
+        activity forward; this is for when it moves back or to another owner.
+        """
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        if not user_ids:
+            return
+        stale = delete(cls).where(cls.user_id.in_(user_ids))
+        if spawn_id is not None:
+            stale = stale.where(cls.spawn_id == spawn_id)
+        connection.execute(stale)
+        latest_user_activity = user_last_activity(spawn_id=spawn_id, per_spawn=True, user_ids=user_ids)
+        cls.upsert_from_select(connection, select(
+            latest_user_activity.c.user_id,
+            latest_user_activity.c.world_id,
+            latest_user_activity.c.spawn_id,
+            latest_user_activity.c.last_activity_at
+        ))
+
+    @classmethod
+    def refresh_characters(cls, connection, character_ids, spawn_id=None):
+        """Rebuilds the rows of the characters' owners; see refresh."""
+        user_ids = connection.scalars(
+            select(Character.user_id).distinct().where(Character.id.in_(list(character_ids)), Character.user_id.isnot(None))
+        ).all()
+        cls.refresh(connection, user_ids, spawn_id)
+
+    @classmethod
+    def backfill(cls, db):
+        """
+        Rebuilds the table from the existing bids and hunts.
+        Returns the number of rows written.
+        """
+        latest_user_activity = user_last_activity(per_spawn=True)
+        db.execute(delete(cls))
+        result = db.execute(
+            insert(cls).from_select(
+                ['user_id', 'world_id', 'spawn_id', 'last_activity_at'],
+                select(
+                    latest_user_activity.c.user_id,
+                    latest_user_activity.c.world_id,
+                    latest_user_activity.c.spawn_id,
+                    latest_user_activity.c.last_activity_at
+                )
+            )
+        )
+        return result.rowcount
+
+    def __repr__(self):
+        return f'<UserWorldActivity user {self.user_id} on Spawn {self.spawn_id} at {self.last_activity_at}>'
+
+# SQLAlchemy event listeners keeping user_world_activity up to date
+@event.listens_for(Bid, 'after_insert')
+def receive_bid_after_insert(mapper, connection, target):
+    """Records the bid's hunt window start as activity of the character's owner."""
+    UserWorldActivity.record(connection, target.character_id, target.spawn_id, target.hunt_window_start)
+
+@event.listens_for(Hunt, 'after_insert')
+def receive_hunt_after_insert(mapper, connection, target):
+    """Records the hunt's start time as activity of the character's owner."""
+    UserWorldActivity.record(connection, target.character_id, target.spawn_id, target.start_time)
+
+@event.listens_for(Bid, 'after_delete')
+@event.listens_for(Hunt, 'after_delete')
+def receive_activity_after_delete(mapper, connection, target):
+    """Rebuilds the owner's activity on the spawn without the deleted bid or hunt."""
+    UserWorldActivity.refresh_characters(connection, [target.character_id], target.spawn_id)
+
+@event.listens_for(Character, 'after_update')
+def receive_character_after_update(mapper, connection, target):
+    """Moves the character's activity to its new owner."""
+    history = inspect(target).attrs.user_id.history
+    if history.deleted or history.added:
+        UserWorldActivity.refresh(connection, list(history.deleted) + list(history.added))
+
+@event.listens_for(Character, 'after_delete')
+def receive_character_after_delete(mapper, connection, target):
+    """Drops the deleted character's activity from its owner's."""
+    UserWorldActivity.refresh(connection, [target.user_id])
+
+
+def count_vote(connection, proposal_id, vote_type, delta):
+    """
+    Adds delta to the proposal's upvotes or downvotes in one UPDATE.
+    Returns the proposal's (upvotes, downvotes) afterwards.
+    """
+    counter = SpawnChangeProposal.upvotes if vote_type == VoteType.UPVOTE else SpawnChangeProposal.downvotes
+    return connection.execute(
+        update(SpawnChangeProposal)
+        .where(SpawnChangeProposal.id == proposal_id)
+        .values({counter: counter + delta})
+        .returning(SpawnChangeProposal.upvotes, SpawnChangeProposal.downvotes)
+    ).one()
+
+@event.listens_for(Vote, 'after_insert')
+def receive_vote_after_insert(mapper, connection, target):
+    """Counts the vote in its proposal's tally."""
+    count_vote(connection, target.proposal_id, target.vote_type, 1)
+
+@event.listens_for(Vote, 'after_update')
+def receive_vote_after_update(mapper, connection, target):
+    """Moves a changed vote to the other tally."""
+    history = inspect(target).attrs.vote_type.history
+    if history.deleted and history.added:
+        count_vote(connection, target.proposal_id, history.deleted[0], -1)
+        count_vote(connection, target.proposal_id, history.added[0], 1)
+
+@event.listens_for(Vote, 'after_delete')
+def receive_vote_after_delete(mapper, connection, target):
+    """Removes the vote from its proposal's tally."""
+    count_vote(connection, target.proposal_id, target.vote_type, -1)
+
+
+def user_last_activity(world_ids=None, spawn_id=None, per_spawn=False, user_ids=None):
+    """
+    Returns a subquery with each user's last activity per world
+    (columns: world_id, user_id, last_activity_at), or per world and spawn
+    (with an extra spawn_id column) when per_spawn is set.
+
+    Bid and hunt timestamps are combined with UNION ALL before they are joined
+    to characters, so the cost is linear in the number of activity rows rather
+    than bids x hunts per character. Optionally restricted to some worlds,
+    to the activity on a single spawn and to some users.
+    """
+    bid_activity = select(
+        Bid.character_id.label('character_id'),
+        Bid.spawn_id.label('spawn_id'),
+        Bid.hunt_window_start.label('activity_at')
+    )
+    hunt_activity = select(
+        Hunt.character_id.label('character_id'),
+        Hunt.spawn_id.label('spawn_id'),
+        Hunt.start_time.label('activity_at')
+    )
+    if spawn_id is not None:
+        bid_activity = bid_activity.where(Bid.spawn_id == spawn_id)
+        hunt_activity = hunt_activity.where(Hunt.spawn_id == spawn_id)
+    activity = union_all(bid_activity, hunt_activity).subquery('activity')
+
+    latest_user_activity = (
+        select(
+            Character.world_id.label('world_id'),
+            Character.user_id.label('user_id'),
+            func.max(activity.c.activity_at).label('last_activity_at')
+        )
+        .join(activity, activity.c.character_id == Character.id)
+        .where(Character.user_id.isnot(None))
+        .group_by(Character.world_id, Character.user_id)
+    )
+    if per_spawn:
+        latest_user_activity = latest_user_activity.add_columns(activity.c.spawn_id).group_by(activity.c.spawn_id)
+    if world_ids is not None:
+        latest_user_activity = latest_user_activity.where(Character.world_id.in_(world_ids))
+    if user_ids is not None:
+        latest_user_activity = latest_user_activity.where(Character.user_id.in_(user_ids))
+    return latest_user_activity.subquery('user_last_activity')
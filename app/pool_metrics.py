@@ -0,0 +1,123 @@
+"""
+Filename: pool_metrics.py
+
+Connection pool statistics for the engines in database.py. Pool events count
+connects, checkouts and invalidations; the Timed* pool classes additionally
+measure how long each checkout waited for a free connection.
+
+    engine = create_engine(url, poolclass=TimedQueuePool, pool_logging_name="sync")
+    pool_metrics.attach(engine)
+    pool_metrics.snapshot()  # {"sync": {"checked_out": 2, "overflow": -3, ...}}
+"""
+
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Running counters for one pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+class PoolMetrics:
+    """
+    Collects PoolStats per pool, keyed by the pool's logging name, and reports
+    them together with the pool's live checked-out and overflow counts.
+    """
+
+    def __init__(self):
+        self._engines = {}
+        self._stats = {}
+
+    def stats_for(self, name: str) -> PoolStats:
+        return self._stats.setdefault(name, PoolStats())
+
+    def attach(self, engine):
+        """Starts collecting statistics for a (sync) Engine's pool."""
+        name = engine.pool.logging_name
+        stats = self.stats_for(name)
+        self._engines[name] = engine
+
+        event.listen(engine, 'connect', lambda dbapi_connection, record: stats.increment('connects'))
+        event.listen(engine, 'checkout', lambda dbapi_connection, record, proxy: stats.increment('checkouts'))
+        event.listen(engine, 'invalidate', lambda dbapi_connection, record, exception: stats.increment('invalidations'))
+        return engine
+
+    def snapshot(self) -> dict:
+        snapshot = {}
+        for name, engine in self._engines.items():
+            pool = engine.pool
+            snapshot[name] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                **self.stats_for(name).as_dict(),
+            }
+        return snapshot
+
+
+pool_metrics = PoolMetrics()
+
+
+class _TimedCheckoutMixin:
+    """Times every checkout, including the wait for a free connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            waited = time.perf_counter() - start
+            pool_metrics.stats_for(self.logging_name).record_wait(waited, timed_out=True)
+            logger.warning(f"Pool '{self.logging_name}' checkout timed out after {waited:.2f}s: {self.status()}")
+            raise
+        pool_metrics.stats_for(self.logging_name).record_wait(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
@@ -3,12 +3,15 @@ import uuid
 
 from fastapi import APIRouter, Request, Form, Depends, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
-from database import get_db
+from database import get_async_db
 from templating import templates
 from models import User, RecoveryToken
+from loaders import AUTH_ONLY
+from dependencies import CurrentUser, get_current_user, invalidate_current_user
 
 import logging
 logging.basicConfig(level=logging.INFO)
@@ -21,13 +24,8 @@ def get_now_utc_naive():
     return datetime.now(UTC).replace(tzinfo=None)
 
 @router.get("/login", response_class=HTMLResponse)
-async def get_login_form(request: Request, db: Session = Depends(get_db)):
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
+async def get_login_form(request: Request, user: CurrentUser = Depends(get_current_user)):
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return templates.TemplateResponse("login.html", {"current_user": user, "request": request, "error": None})
     else:
         return RedirectResponse(url="/dashboard", status_code=status.HTTP_303_SEE_OTHER)
@@ -37,9 +35,9 @@ async def post_login_form(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).options(*AUTH_ONLY).where(User.username == username))
 
     if not user or not user.check_password(password):
         return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid username or password."})
@@ -56,10 +54,7 @@ async def logout(request: Request):
     return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
 @router.get("/register", response_class=HTMLResponse)
-async def get_register_form(request: Request, db : Session = Depends(get_db)):
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
+async def get_register_form(request: Request, user: CurrentUser = Depends(get_current_user)):
     if user:
         return RedirectResponse(url="/dashboard", status_code=status.HTTP_303_SEE_OTHER)
     return templates.TemplateResponse("register.html", {"request": request, "error": None})
@@ -70,11 +65,9 @@ async def post_register_form(
     username: str = Form(...),
     password: str = Form(...),
     confirm_password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     if user:
         return RedirectResponse(url="/dashboard", status_code=status.HTTP_303_SEE_OTHER)
     error_message = None
@@ -89,7 +82,7 @@ async def post_register_form(
     if error_message:
         return templates.TemplateResponse("register.html", {"current_user": user, "request": request, "error": error_message})
 
-    existing_user_by_username = db.query(User).filter(User.username == username).first()
+    existing_user_by_username = await db.scalar(select(User).options(*AUTH_ONLY).where(User.username == username))
     if existing_user_by_username:
         error_message = "Username already registered."
         return templates.TemplateResponse("register.html", {"current_user": user, "request": request, "error": error_message})
@@ -99,33 +92,30 @@ async def post_register_form(
         new_user.set_password(password)
 
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
 
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         error_message = "A user with this username already exists (database integrity error)."
         return templates.TemplateResponse("register.html", {"current_user": user, "request": request, "error": error_message})
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error during registration: {e}")
         error_message = "An unexpected error occurred during registration."
         return templates.TemplateResponse("register.html", {"current_user": user, "request": request, "error": error_message})
 
 @router.get("/account-recovery", response_class=HTMLResponse)
-async def get_account_recovery(request: Request, db: Session = Depends(get_db)):
-    user_id = request.session.get('user_id')
-    if user_id:
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            request.session.pop('user_id', None)
-            request.session.pop('username', None)
-            return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-
-        # Fetch characters for the logged-in user
-        tokens = db.query(RecoveryToken).filter(RecoveryToken.user_id == user_id).all()
+async def get_account_recovery(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
+):
+    if user:
+        # Fetch recovery tokens for the logged-in user
+        tokens = (await db.scalars(select(RecoveryToken).where(RecoveryToken.user_id == user.id))).all()
 
         return templates.TemplateResponse(
             "account_recovery.html",
@@ -138,28 +128,22 @@ async def get_account_recovery(request: Request, db: Session = Depends(get_db)):
         )
 
 @router.post("/account-recovery/generate-token", response_class=HTMLResponse)
-async def generate_recovery_token(request: Request, db: Session = Depends(get_db)):
-    user_id = request.session.get('user_id')
-    if not user_id:
-        logger.error("User ID not found in session")
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-
-    user = db.query(User).filter(User.id == user_id).first()
+async def generate_recovery_token(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
+):
     if not user:
         logger.error("User not found")
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
     # Invalidate old active tokens for this user
-    db.query(RecoveryToken).filter(
+    await db.execute(update(RecoveryToken).where(
         RecoveryToken.user_id == user.id,
         RecoveryToken.used == False,
         RecoveryToken.expiration_time > datetime.now(UTC).replace(tzinfo=None)
-    ).update({"used": True})
-    db.commit()
-
-    db.refresh(user)
+    ).values(used=True))
+    await db.commit()
 
     token_value = str(uuid.uuid4())
     expiration_time = datetime.now(UTC) + timedelta(days=90)
@@ -171,8 +155,8 @@ async def generate_recovery_token(request: Request, db: Session = Depends(get_db
         used=False
     )
     db.add(new_token)
-    db.commit()
-    db.refresh(new_token)
+    await db.commit()
+    await db.refresh(new_token)
 
     return RedirectResponse(url="/account-recovery", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -186,7 +170,7 @@ async def consume_recovery_token(
     token: str = Form(...),
     new_password: str = Form(...),
     confirm_password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     error_message = None
 
@@ -203,7 +187,7 @@ async def consume_recovery_token(
             {"request": request, "logged_in_user": None, "error": error_message, "message": None, "now_utc_naive": get_now_utc_naive()}
         )
 
-    recovery_token_obj = db.query(RecoveryToken).filter(RecoveryToken.token == token).first()
+    recovery_token_obj = await db.scalar(select(RecoveryToken).where(RecoveryToken.token == token))
 
     if not recovery_token_obj:
         error_message = "Invalid or expired token."
@@ -219,7 +203,7 @@ async def consume_recovery_token(
             {"request": request, "logged_in_user": None, "error": error_message, "message": None, "now_utc_naive": get_now_utc_naive()}
         )
 
-    user = db.query(User).filter(User.id == recovery_token_obj.user_id).first()
+    user = await db.scalar(select(User).options(*AUTH_ONLY).where(User.id == recovery_token_obj.user_id))
     if not user:
         error_message = "Associated user not found. Invalid token."
         return templates.TemplateResponse(
@@ -232,14 +216,15 @@ async def consume_recovery_token(
         recovery_token_obj.used = True
         db.add(user)
         db.add(recovery_token_obj)
-        db.commit()
+        await db.commit()
+        invalidate_current_user(user.id)
 
         return RedirectResponse(
             url="/login?message=Password reset successfully. Please log in.",
             status_code=status.HTTP_303_SEE_OTHER
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error resetting password: {e}")
         error_message = "An unexpected error occurred during password reset."
         return templates.TemplateResponse(
@@ -1,18 +1,25 @@
+import asyncio
 import hashlib
+import os
 import httpx
 from json import JSONDecodeError
 
 from fastapi import APIRouter, Request, Form, Depends, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.sql import and_
+from sqlalchemy.sql import or_
 import logging
 
 
 
-from database import get_db
-from models import User, Character, World # Import all necessary models
+from database import get_async_db
+from models import Character, World # Import all necessary models
+from loaders import CHARACTER_PAGE, CHARACTER_DETAIL_PAGE
+from dependencies import CurrentUser, get_current_user, invalidate_current_user
+from tibiadata import tibiadata
+from character_cache import CharacterCache, backend_from_env
 
 from templating import templates
 
@@ -20,33 +27,34 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# How many alt characters validate_character looks up on TibiaData at once
+ALT_FETCH_CONCURRENCY = int(os.environ.get("ALT_FETCH_CONCURRENCY", "5"))
+
 @router.get("/characters", response_class=HTMLResponse)
 async def list_characters(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Displays a list of all characters in the system.
     Requires user to be logged in.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     if not user:
         # Redirect to login if not authenticated
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
-    # Fetch all characters from the database
-    characters = user.characters
+    # Fetch the user's characters from the database
+    characters = (await db.scalars(select(Character).options(*CHARACTER_PAGE).where(Character.user_id == user.id))).all()
 
     return templates.TemplateResponse(
         "character_list.html",
         {
             "current_user": user,
             "request": request,
-            "characters": characters
+            "characters": characters,
+            "message": request.query_params.get("message"),
+            "error": request.query_params.get("error")
         }
     )
 
@@ -54,19 +62,15 @@ async def list_characters(
 async def create_character(
     request: Request,
     name: str = Form(...), # Only character name is taken from the form
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Allows a logged-in user to create a new character.
     Fetches character details (level, vocation, world) from TibiaData.com.
     Generates a validation hash for the character.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
     error_message = None
@@ -78,13 +82,13 @@ async def create_character(
 
 
     # 3. Find or Create World
-    world = db.query(World).filter(World.name == character_data['world']).first()
+    world = await db.scalar(select(World).where(World.name == character_data['world']))
     if not world:
         # If world doesn't exist, create it (should ideally be handled by startup script)
         world = World(name=character_data['world'], location="Unknown") # Default location if not provided by API
         db.add(world)
-        db.commit() # Commit world creation immediately to get its ID
-        db.refresh(world)
+        await db.commit() # Commit world creation immediately to get its ID
+        await db.refresh(world)
         logger.info(f"Created new world entry: {world.name}")
 
     # 4. Generate validation hash
@@ -107,8 +111,9 @@ async def create_character(
             validation_hash=validation_hash # Assign the generated hash
         )
         db.add(new_character)
-        db.commit()
-        db.refresh(new_character)
+        await db.commit()
+        await db.refresh(new_character)
+        invalidate_current_user(user.id)
         message_text = f"Character '{new_character.name}' added successfully! Your validation hash is: {validation_hash}. Please place this hash in your Tibia.com character comment to validate."
 
         return RedirectResponse(
@@ -116,11 +121,11 @@ async def create_character(
             status_code=status.HTTP_303_SEE_OTHER
         )
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         error_message = f"A character with the name '{name}' already exists or another database integrity error occurred."
         logger.error(f"Integrity Error during character creation/update: {e}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         error_message = f"An unexpected error occurred during character creation/update: {e}"
         logger.error(f"Error during character creation/update: {e}")
 
@@ -135,15 +140,13 @@ async def create_character(
 async def view_character_detail(
     request: Request,
     character_name: str, # This is the path parameter
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Displays the detail page for a specific character.
     Requires user to be logged in and own the character.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     # get and update character data
     character_data, other_characters = await get_character_data(character_name)
     if not character_data:
@@ -152,13 +155,15 @@ async def view_character_detail(
             url=f"/characters?error={error_message}",
             status_code=status.HTTP_303_SEE_OTHER
         )
-    db.query(Character).filter(Character.name == character_name).update({"level": character_data['level']})
-    challenges = db.query(Character).filter(Character.name == character_name, Character.validation_hash != None).count()
+    await db.execute(update(Character).where(Character.name == character_name).values(level=character_data['level']))
+    challenges = await db.scalar(
+        select(func.count()).select_from(Character).where(Character.name == character_name, Character.validation_hash != None)
+    )
 
     # Fetch the character by name and ensure it belongs to the logged-in user
-    character = db.query(Character).filter(
+    character = await db.scalar(select(Character).options(*CHARACTER_DETAIL_PAGE).where(
         Character.name == character_name
-    ).first()
+    ))
 
     if not character:
         # If character not found or not owned by user, redirect to my characters with an error
@@ -187,26 +192,23 @@ async def view_character_detail(
 async def get_verify_character_page(
     request: Request,
     character_name: str, # Expected as a query parameter
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Displays the page to verify a character, showing the validation hash
     and a list of other characters on the same account that will be auto-validated.
     """
     logger.info(f"Viewing character verification page for {character_name}")
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
 
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
-    character_to_verify = db.query(Character).filter(
+    character_to_verify = await db.scalar(select(Character).options(*CHARACTER_PAGE).where(
         Character.user_id == user.id,
         Character.name == character_name,
         Character.validation_hash.isnot(None) # Must be unverified to be on this page
-    ).first()
+    ))
 
     if not character_to_verify:
         logger.info("Character not found")
@@ -217,24 +219,11 @@ async def get_verify_character_page(
         )
 
     # Fetch other characters from TibiaData.com for the same account
-    tibia_other_characters = []
-    TIBIADATA_CHARACTER_API = f"https://api.tibiadata.com/v4/character/{character_name}"
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(TIBIADATA_CHARACTER_API)
-            response.raise_for_status()
-            tibia_data = response.json()
-            tibia_other_characters = tibia_data.get('character', {}).get('other_characters', [])
-            logger.info("Fetched other characters from TibiaData")
-    except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error fetching TibiaData for other characters: {e.response.status_code} - {e.response.text}")
-        # Continue without other characters if API call fails
-    except httpx.RequestError as e:
-        logger.error(f"Network error fetching TibiaData for other characters: {e}")
-        # Continue without other characters if API call fails
-    except Exception as e:
-        logger.error(f"An unexpected error occurred fetching TibiaData for other characters: {e}")
+    tibia_character, tibia_other_characters = await get_character_data(character_name)
+    if not tibia_character:
+        logger.error(f"Error fetching TibiaData for other characters: {tibia_other_characters}")
         # Continue without other characters if API call fails
+        tibia_other_characters = []
 
     # Filter other characters that belong to the current user and are currently unvalidated
     other_characters_to_validate = []
@@ -243,11 +232,11 @@ async def get_verify_character_page(
         if other_char_name == character_name or other_char_info['world'] != character_to_verify.world.name: # Skip the main character itself
             continue
         logger.info(f"Processing other character: {other_char_name}")
-        existing_other_char_in_db = db.query(Character).filter(
+        existing_other_char_in_db = await db.scalar(select(Character).where(
             Character.name == other_char_name,
             Character.user_id == user.id,
             Character.validation_hash.isnot(None) # Only show if it's currently unvalidated
-        ).first()
+        ))
 
         if existing_other_char_in_db:
             other_characters_to_validate.append(other_char_name)
@@ -272,118 +261,170 @@ async def get_verify_character_page(
         }
     )
 
-def validated_characters_on_world(other_chars_list : list,world_name: int, db : Session):
+async def validated_characters_on_world(other_chars_list : list,world_name: int, db : AsyncSession):
     logger.info(f"Other characters on world: {other_chars_list}")
     names_list = [char["name"] for char in other_chars_list if char["world"] == world_name]
-    validated_in_database = db.query(Character.name).filter(
+    validated_in_database = (await db.scalars(select(Character.name).where(
             Character.validation_hash == None,
             Character.name.in_(names_list)
-        ).all()
-    validated_names = [name[0] for name in validated_in_database]
+        ))).all()
+    validated_names = list(validated_in_database)
     return [name for name in names_list if name != "" and name not in validated_names]
 
-def verify_character(user : User, world : World, character_data : dict, db : Session):
-    character_name = character_data["name"]
-    character_level = character_data["level"]
-    character_vocation = character_data["vocation"]
+async def verify_characters(user : CurrentUser, world : World, characters_data : list, db : AsyncSession):
+    """
+    Marks the given characters as verified for `user` in a single transaction:
+    existing claims are validated, missing ones are created, and other users'
+    verified claims on the same names are removed.
+    Returns the verified Character rows, in the order of `characters_data`.
+    """
+    names = [character_data["name"] for character_data in characters_data]
+    existing = (await db.scalars(select(Character).where(
+        Character.name.in_(names),
+        or_(Character.user_id == user.id, Character.validation_hash == None)
+    ))).all()
+    own_claims = {character.name: character for character in existing if character.user_id == user.id}
+    other_verified_claims = [
+        character for character in existing
+        if character.user_id is not None and character.user_id != user.id
+    ]
+
+    verified = []
+    for character_data in characters_data:
+        character_in_db = own_claims.get(character_data["name"])
+        if character_in_db and not character_in_db.validated:
+            character_in_db.validation_hash = None
+        elif not character_in_db:
+            character_in_db = Character(name=character_data["name"], world=world, level=character_data["level"], vocation=character_data["vocation"], user_id=user.id, validation_hash=None)
+            db.add(character_in_db)
+        verified.append(character_in_db)
+
+    for other_claim in other_verified_claims:
+        await db.delete(other_claim)
+    await db.commit()
+
+    invalidate_current_user(user.id, *(other_claim.user_id for other_claim in other_verified_claims))
+    return verified
+
+
+async def fetch_alt_characters(names : list):
+    """
+    Looks up several characters concurrently, at most ALT_FETCH_CONCURRENCY at a time.
+    Returns (character_data_list, failures) where failures maps name -> error.
+    """
+    semaphore = asyncio.Semaphore(ALT_FETCH_CONCURRENCY)
 
-    character_in_db = db.query(Character).filter(
-            and_(Character.name == character_name, Character.user_id == user.id)
-        ).first()
-    other_verified_claims = db.query(Character).filter(
-        Character.name == character_name,
-        Character.validation_hash == None,
-        Character.user_id != user.id
-    ).all()
-    if character_in_db and not character_in_db.validated:
-        character_in_db.validation_hash = None
-        db.commit()
-        db.refresh(character_in_db)
-    elif not character_in_db:
-        character_in_db = Character(name=character_name, world=world, level=character_level, vocation=character_vocation, user_id=user.id, validation_hash=None)
-        db.add(character_in_db)
-        db.commit()
-        db.refresh(character_in_db)
-
-    if len(other_verified_claims) > 0:
-        for other_claim in other_verified_claims:
-            db.delete(other_claim)
-            db.commit()
-            db.refresh(other_claim)
-    return character_in_db
+    async def fetch(name):
+        async with semaphore:
+            return name, await get_character_data(name)
 
-async def get_character_data(character_name: str):
-    """
-    Fetches character data from the TibiaData API.
+    characters_data, failures = [], {}
+    for name, (character_data, error) in await asyncio.gather(*(fetch(name) for name in names)):
+        if character_data:
+            characters_data.append(character_data)
+        else:
+            logger.error(f"Failed to fetch data for character {name}: {error}")
+            failures[name] = error
+    return characters_data, failures
+
+class CharacterLookupError(Exception):
+    """A TibiaData character lookup failed; the message is shown to the user."""
 
-    Args:
-        character_name (str): The name of the Tibia character to search for.
+
+async def fetch_character_data(character_name: str):
+    """
+    Fetches character data from the TibiaData API, bypassing the cache.
 
     Returns:
-        dict | None: A dictionary containing the character data if successful,
-                     otherwise None.
+        dict | None: {'character': {...}, 'other_characters': [...]}, or None
+                     if the character doesn't exist.
+
+    Raises:
+        CharacterLookupError: if the API can't be reached or returns an error.
     """
-    BASE_URL = "https://api.tibiadata.com/v4"
     endpoint = f"/character/{character_name.replace(' ', '%20')}" # Replace spaces for URL
-    url = f"{BASE_URL}{endpoint}"
 
-    print(f"Attempting to fetch data for character: {character_name}")
-    print(f"API URL: {url}")
+    logger.debug(f"Fetching TibiaData for character {character_name}: {tibiadata.base_url}{endpoint}")
 
     try:
-        # Use httpx.AsyncClient for asynchronous requests
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, follow_redirects=True, timeout=10.0)
-            response.raise_for_status()  # Raise an exception for 4xx or 5xx responses
-
-            # Parse the JSON response
-            data = response.json()
-
-            # TibiaData API often wraps actual data in 'characters' -> 'character'
-            if data and 'character' in data and 'character' in data['character']:
-                character_info = data['character']['character']
-                other_characters = data['character']['other_characters']
-                return character_info, other_characters
-            elif data and 'error' in data:
-                logger.error(f"API Error for {character_name}: {data['error']['message']}")
-                return None, data['error']['message']
-            else:
-                logger.warning(f"Unexpected response format for {character_name}: {data}")
-                return None, f"Unexpected response format for {character_name}: {data}"
+        # Use the shared TibiaData client, which keeps connections alive between requests
+        response = await tibiadata.get(endpoint)
+        response.raise_for_status()  # Raise an exception for 4xx or 5xx responses
 
+        # Parse the JSON response
+        data = response.json()
     except httpx.HTTPStatusError as e:
         logger.error(f"HTTP error occurred for {character_name}: {e.response.status_code} - {e.response.text}")
         if e.response.status_code == 404:
             logger.warning(f"Character '{character_name}' not found.")
-        return None, e.response.text
+            return None
+        raise CharacterLookupError(e.response.text) from e
     except httpx.RequestError as e:
         logger.error(f"An error occurred while requesting {e.request.url!r}: {e}")
-        return None, f"An error occurred while requesting {e.request.url!r}: {e}"
+        raise CharacterLookupError(f"An error occurred while requesting {e.request.url!r}: {e}") from e
     except JSONDecodeError as e:
         logger.error(f"Failed to decode JSON from response for {character_name}.")
+        raise CharacterLookupError(str(e)) from e
+
+    # TibiaData API often wraps actual data in 'characters' -> 'character'
+    if data and 'character' in data and 'character' in data['character']:
+        character_info = data['character']['character']
+        if not character_info.get('name'):
+            logger.warning(f"Character '{character_name}' not found.")
+            return None
+        return {
+            'character': character_info,
+            'other_characters': data['character'].get('other_characters') or []
+        }
+    elif data and 'error' in data:
+        logger.error(f"API Error for {character_name}: {data['error']['message']}")
+        raise CharacterLookupError(data['error']['message'])
+    else:
+        logger.warning(f"Unexpected response format for {character_name}: {data}")
+        raise CharacterLookupError(f"Unexpected response format for {character_name}: {data}")
+
+
+# Character data changes at most once per server save, so lookups are cached
+character_cache = CharacterCache(fetch_character_data, backend=backend_from_env())
+
+
+async def get_character_data(character_name: str):
+    """
+    Fetches character data from the TibiaData API, through the character cache.
+
+    Args:
+        character_name (str): The name of the Tibia character to search for.
+
+    Returns:
+        tuple: (character_info, other_characters) if successful,
+               otherwise (None, error_message).
+    """
+    try:
+        data = await character_cache.get(character_name)
+    except CharacterLookupError as e:
         return None, str(e)
     except Exception as e:
         logger.error(f"An unexpected error occurred for {character_name}: {e}")
         return None, str(e)
 
+    if data is None:
+        return None, f"Character '{character_name}' not found."
+    return data['character'], data['other_characters']
+
 
 @router.post("/character/verify", response_class=HTMLResponse)
 async def validate_character(
     request: Request,
     character_name: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Handles the POST request to validate a character.
     Fetches character comment from TibiaData.com and checks for the validation hash.
     If successful, marks the character and other associated characters as validated.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
     # Verify Main Character
@@ -394,31 +435,32 @@ async def validate_character(
             url=f"/character/verify?character_name={character_name}&error={other_characters}",
             status_code=status.HTTP_303_SEE_OTHER
         )
-    world = db.query(World).filter(World.name == character_data['world']).first()
-    character = verify_character(user, world, character_data, db)
+    world = await db.scalar(select(World).where(World.name == character_data['world']))
 
-    if not character:
+    # Fetch the account's other characters on this world concurrently
+    alts_data, failures = [], {}
+    if other_characters and len(other_characters) > 0:
+        logger.info(f"Processing {other_characters}")
+        alt_names = [
+            name for name in await validated_characters_on_world(other_characters, character_data['world'], db)
+            if name != character_data['name']
+        ]
+        alts_data, failures = await fetch_alt_characters(alt_names)
+
+    # Then verify the main character and its alts in one transaction
+    try:
+        await verify_characters(user, world, [character_data] + alts_data, db)
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error verifying {character_name} for user {user.username}: {e}", exc_info=True)
         return RedirectResponse(
             url=f"/character/verify?character_name={character_name}&error=an error happened verifying {character_name}",
             status_code=status.HTTP_303_SEE_OTHER
         )
 
-    if other_characters and len(other_characters) > 0:
-        logger.info(f"Processing {other_characters}")
-        other_char_data = None
-        for other_char_name in validated_characters_on_world(other_characters, character_data['world'], db):
-            other_char_data, _ = await get_character_data(other_char_name)
-            if not other_char_data:
-                logger.error(f"Failed to fetch data for character {other_char_name}")
-                continue
-            other_char_db = verify_character(user, world, other_char_data, db)
-            if not other_char_db:
-                logger.error(f"Failed to verify character {other_char_name}")
-                return RedirectResponse(
-                    url=f"/character/verify?character_name={character_name}&error=an error happened verifying {other_char_name}",
-                    status_code=status.HTTP_303_SEE_OTHER
-                )
-
+    if failures:
+        error_message = "Could not verify: " + ", ".join(f"{name} ({error})" for name, error in failures.items())
+        return RedirectResponse(url=f"/characters?error={error_message}", status_code=status.HTTP_303_SEE_OTHER)
     return RedirectResponse(url="/characters", status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -427,23 +469,19 @@ async def validate_character(
 async def get_disown_character_page(
     request: Request,
     character_name: str, # Expected as a query parameter
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Displays a confirmation page to disown a character, showing its stats.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
-    character_to_disown = db.query(Character).filter(
+    character_to_disown = await db.scalar(select(Character).options(*CHARACTER_PAGE).where(
         Character.name == character_name,
         Character.user_id == user.id, # Must be owned by the current user
-    ).first()
+    ))
 
     if not character_to_disown:
         logger.warning(f"User {user.username} attempted to access disown page for non-existent, or unowned: {character_name}")
@@ -472,24 +510,20 @@ async def get_disown_character_page(
 async def disown_character(
     request: Request,
     character_name: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Allows a logged-in user to disown a character they currently own.
     Sets user_id to None and validation_hash to None.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
-    character_to_disown = db.query(Character).filter(
+    character_to_disown = await db.scalar(select(Character).where(
         Character.name == character_name,
         Character.user_id == user.id, # Must be owned by the current user
-    ).first()
+    ))
 
     if not character_to_disown:
         logger.warning(f"User {user.username} attempted to disown non-existent, or unowned: {character_name}")
@@ -499,15 +533,16 @@ async def disown_character(
         )
 
     try:
-        db.delete(character_to_disown)
-        db.commit()
+        await db.delete(character_to_disown)
+        await db.commit()
+        invalidate_current_user(user.id)
         logger.info(f"User {user.username} successfully disowned character: {character_name}")
         return RedirectResponse(
             url=f"/characters?message=Character '{character_name}' has been successfully disowned.",
             status_code=status.HTTP_303_SEE_OTHER
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         error_message = f"An unexpected error occurred while disowning character: {e}"
         logger.error(f"Error disowning character {character_name} for user {user.username}: {e}", exc_info=True)
         return RedirectResponse(
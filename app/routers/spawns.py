@@ -1,14 +1,23 @@
+import math
+import os
+from time import monotonic
+
 from fastapi import APIRouter, Request, Depends, HTTPException, status, Form
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, distinct
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select, func, distinct, union_all, literal, and_, or_, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from typing import Optional
 from datetime import datetime, timedelta, UTC, time
 import pytz
 
-from database import get_db
+from database import get_async_db
 from models import World, Character, Spawn, SpawnProposal, ProposalStatus, SpawnChangeProposal, User, VoteType, Vote # Import necessary models and enums
+from models import proposal_sponsors, user_spawn_favorites, UserWorldActivity
+from loaders import WORLD_PAGE_PROPOSALS, SPONSOR_PROPOSAL, SPAWN_PAGE_SPAWN
+from dependencies import CurrentUser, get_current_user
+from scheduler import schedules
 
 import logging
 logging.basicConfig(level=logging.INFO)
@@ -17,46 +26,149 @@ router = APIRouter()
 
 from templating import templates
 
+
+class SlugResolver:
+    """
+    Maps the world and spawn names in URLs (case-insensitively) to ids, so
+    resolving a route doesn't need a database round trip.
+
+    Worlds only appear on TibiaData sync and spawns on proposal approval, and
+    neither is renamed or deleted, so cached ids never go stale. A name that
+    isn't cached yet (e.g. added by another worker) is looked up once and added.
+    """
+
+    def __init__(self):
+        self._worlds = {} # lower(world name) -> world id
+        self._spawns = {} # (world id, lower(spawn name)) -> spawn id
+        self._loaded = False
+
+    async def load(self, db: AsyncSession):
+        """Loads every world and spawn id; called on startup."""
+        worlds = (await db.execute(select(World.id, World.name))).all()
+        spawns = (await db.execute(select(Spawn.id, Spawn.world_id, Spawn.name))).all()
+        self._worlds = {name.lower(): world_id for world_id, name in worlds}
+        self._spawns = {(world_id, name.lower()): spawn_id for spawn_id, world_id, name in spawns}
+        self._loaded = True
+
+    def invalidate(self):
+        """Drops the cache; it is reloaded on the next lookup."""
+        self._worlds = {}
+        self._spawns = {}
+        self._loaded = False
+
+    async def world_id(self, db: AsyncSession, world_name: str) -> Optional[int]:
+        if not self._loaded:
+            await self.load(db)
+        key = world_name.lower()
+        world_id = self._worlds.get(key)
+        if world_id is None:
+            world_id = await db.scalar(select(World.id).where(func.lower(World.name) == key))
+            if world_id is not None:
+                self._worlds[key] = world_id
+        return world_id
+
+    async def spawn_id(self, db: AsyncSession, world_name: str, spawn_name: str) -> tuple[Optional[int], Optional[int]]:
+        """Returns (world_id, spawn_id); either is None if not found."""
+        world_id = await self.world_id(db, world_name)
+        if world_id is None:
+            return None, None
+        key = (world_id, spawn_name.lower())
+        spawn_id = self._spawns.get(key)
+        if spawn_id is None:
+            spawn_id = await db.scalar(select(Spawn.id).where(
+                func.lower(Spawn.name) == key[1],
+                Spawn.world_id == world_id
+            ))
+            if spawn_id is not None:
+                self._spawns[key] = spawn_id
+        return world_id, spawn_id
+
+
+slug_resolver = SlugResolver()
+
+
+WORLD_STATS_TTL = float(os.environ.get("WORLD_STATS_TTL", "30")) # seconds
+SPAWN_ACTIVE_USERS_TTL = float(os.environ.get("SPAWN_ACTIVE_USERS_TTL", "60")) # seconds
+
+
+class TTLCache:
+    """
+    Values kept per key for `ttl` seconds. `get` awaits `load()` for keys
+    that are missing or expired.
+    """
+
+    def __init__(self, ttl: float, clock=monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {} # key -> (expires_at, value)
+
+    async def get(self, key, load):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > self.clock():
+            return entry[1]
+        value = await load()
+        self._entries[key] = (self.clock() + self.ttl, value)
+        return value
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# World page statistics (see World.stats_select) per world id. Proposals
+# created or approved on this process drop their world's entry right away.
+world_stats_cache = TTLCache(WORLD_STATS_TTL)
+
+# Active-user counts per spawn id, for evaluating vote thresholds.
+spawn_active_users_cache = TTLCache(SPAWN_ACTIVE_USERS_TTL)
+
+
+async def load_world_stats(db: AsyncSession, world: World) -> dict:
+    return dict((await db.execute(world.stats_select())).one()._mapping)
+
+
+async def load_spawn_active_users(db: AsyncSession, spawn: Spawn) -> int:
+    """The spawn's active-user count; the spawn's world must be loaded."""
+    return (await db.run_sync(Spawn.count_active_users, [spawn])).get(spawn.id, 0)
+
 @router.get("/worlds", response_class=HTMLResponse)
 async def get_all_worlds(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Displays a page listing all available game worlds with basic statistics.
     """
-
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
-    if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
-
     # Get all worlds with their spawn counts
-    worlds = db.query(World).order_by(World.name).all()
+    worlds = (await db.scalars(select(World).order_by(World.name))).all()
 
     # Get spawn counts per world
-    spawn_counts = db.query(
+    spawn_counts = (await db.execute(select(
         Spawn.world_id,
         func.count(Spawn.id).label('spawn_count')
-    ).group_by(Spawn.world_id).all()
+    ).group_by(Spawn.world_id))).all()
     spawn_counts = {world_id: count for world_id, count in spawn_counts}
 
     # Get character counts per world
-    character_counts = db.query(
+    character_counts = (await db.execute(select(
         Character.world_id,
         func.count(Character.id).label('character_count')
-    ).group_by(Character.world_id).all()
+    ).group_by(Character.world_id))).all()
     character_counts = {world_id: count for world_id, count in character_counts}
 
     # Get user counts per world
-    user_counts = db.query(
+    user_counts = (await db.execute(select(
         Character.world_id,
         func.count(distinct(Character.user_id)).label('user_count')
-    ).group_by(Character.world_id).all()
+    ).group_by(Character.world_id))).all()
     user_counts = {world_id: count for world_id, count in user_counts}
 
+    # Active user counts for every world in one grouped query
+    active_users_counts = await db.run_sync(World.count_active_users, worlds)
+
     # Prepare world data with statistics
     worlds_data = []
     for world in worlds:
@@ -65,7 +177,7 @@ async def get_all_worlds(
             "spawn_count": spawn_counts.get(world.id, 0),
             "character_count": character_counts.get(world.id, 0),
             "user_count": user_counts.get(world.id, 0),
-            "active_users_count": len(world.get_active_users(db))
+            "active_users_count": active_users_counts.get(world.id, 0)
         })
 
     return templates.TemplateResponse(
@@ -74,7 +186,7 @@ async def get_all_worlds(
             "current_user": user,
             "request": request,
             "worlds": worlds_data,
-            "logged_in_user_id": request.session.get('user_id')
+            "logged_in_user_id": user.id if user else None
         }
     )
 
@@ -82,7 +194,8 @@ async def get_all_worlds(
 async def get_world_page(
     request: Request,
     world_name: str, # Changed parameter name to world_name
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Displays a dedicated page for a specific game world, showing its details,
@@ -90,8 +203,10 @@ async def get_world_page(
     The world_name lookup is case-insensitive.
     """
 
-    # Convert the incoming world_name to lowercase for case-insensitive comparison
-    world = db.query(World).filter(func.lower(World.name) == world_name.lower()).first()
+    world_id = await slug_resolver.world_id(db, world_name)
+    if world_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="World not found")
+    world = await db.get(World, world_id)
 
     breadcrumbs = [
         {
@@ -107,28 +222,22 @@ async def get_world_page(
             'link': None
         }
     ]
-    if not world:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="World not found")
-
 
-    logged_in_user_id = request.session.get('user_id')
-    user = None
+    logged_in_user_id = user.id if user else None
 
-    characters_on_world = db.query(Character).filter(Character.world_id == world.id, Character.user_id == logged_in_user_id, Character.validation_hash == None).all()
-    unique_characters = db.query(Character).filter(Character.world_id == world.id).count()
-    unique_users = db.query(Character.user_id).filter(Character.world_id == world.id).distinct().count()
+    characters_on_world = (await db.scalars(select(Character).where(Character.world_id == world.id, Character.user_id == logged_in_user_id, Character.validation_hash == None))).all()
+    world_stats = await world_stats_cache.get(world.id, lambda: load_world_stats(db, world))
 
     # Fetch all Spawns associated with this World
-    spawns_in_world = db.query(Spawn).filter(Spawn.world_id == world.id).all() # Filter by world.id now
+    spawns_in_world = (await db.scalars(select(Spawn).where(Spawn.world_id == world.id))).all() # Filter by world.id now
 
     # Fetch PENDING SpawnProposals for this world, ordered by creation time
-    pending_spawn_proposals = db.query(SpawnProposal).filter(
+    pending_spawn_proposals = (await db.scalars(select(SpawnProposal).options(*WORLD_PAGE_PROPOSALS).where(
         SpawnProposal.world_id == world.id,
         SpawnProposal.status == ProposalStatus.PENDING
-    ).order_by(SpawnProposal.created_at.asc()).all()
+    ).order_by(SpawnProposal.created_at.asc()))).all()
 
-    active_users_count = len(world.get_active_users(db))
-    min_sponsors_required = min(world.sponsorship_flat, round(active_users_count * world.sposorship_fraction))
+    min_sponsors_required = min(world.sponsorship_flat, round(world_stats["active_users_count"] * world.sposorship_fraction))
 
     # Initialize sponsored_proposal_ids and favourited_spawn_ids
     sponsored_proposal_ids = set()
@@ -137,14 +246,14 @@ async def get_world_page(
     # Get logged-in user ID for template rendering logic and fetching user-specific data
 
 
-    if logged_in_user_id:
-        # Fetch the user with their sponsored proposals (eager loading the relationship)
-        # Note: 'User.favourited_spawns' is a placeholder. You'll need to define this
-        # relationship and the associated join table in models.py for this to work.
-        user = db.query(User).options(joinedload(User.sponsored_proposals)).filter(User.id == logged_in_user_id).first()
-        if user:
-            favourited_spawn_ids = [spawn.id for spawn in user.favourite_spawns]
-            sponsored_proposal_ids = [proposal.id for proposal in user.sponsored_proposals]
+    if user:
+        # Read the ids straight from the association tables; no User rows are needed
+        favourited_spawn_ids = (await db.scalars(select(user_spawn_favorites.c.spawn_id).where(
+            user_spawn_favorites.c.user_id == user.id
+        ))).all()
+        sponsored_proposal_ids = (await db.scalars(select(proposal_sponsors.c.spawn_proposal_id).where(
+            proposal_sponsors.c.user_id == user.id
+        ))).all()
 
     return templates.TemplateResponse(
         "world.html",
@@ -152,8 +261,9 @@ async def get_world_page(
             "request": request,
             "world": world,
             "breadcrumbs": breadcrumbs,
-            "unique_users_count": unique_users,
-            "total_characters_count": unique_characters,
+            "unique_users_count": world_stats["user_count"],
+            "total_characters_count": world_stats["character_count"],
+            "world_stats": world_stats,
             "characters_on_world": characters_on_world,
             "min_sponsors_required": min_sponsors_required,
             "spawns": spawns_in_world,
@@ -168,18 +278,14 @@ async def get_world_page(
 async def get_propose_spawn_form(
     request: Request,
     world_name: str, # Capture world_name from the path
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Displays the form for proposing a new spawn.
     """
     # Check if user is logged in
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
     return templates.TemplateResponse(
@@ -204,7 +310,8 @@ async def post_propose_spawn(
     claim_min_mins: int = Form(..., alias='claim_min_mins'),
     claim_max_mins: int = Form(..., alias='claim_max_mins'),
     deprioratize_time_mins: int = Form(..., alias="deprioratize_time_mins"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Handles the submission of a new spawn proposal.
@@ -212,32 +319,31 @@ async def post_propose_spawn(
     the proposal is approved via the sponsorship mechanism.
     """
     # Check if user is logged in
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
     # Find the world by name (case-insensitive)
-    world = db.query(World).filter(func.lower(World.name) == world_name.lower()).first()
-    if not world:
+    world_id = await slug_resolver.world_id(db, world_name)
+    if world_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="World not found.")
+    world = await db.get(World, world_id)
 
     # Check if a spawn with this name already exists in this world (case-insensitive)
-    existing_spawn = db.query(Spawn).filter(
-        func.lower(Spawn.name) == spawn_name.lower(),
-        Spawn.world_id == world.id
-    ).first()
-    if existing_spawn:
+    _, existing_spawn = await slug_resolver.spawn_id(db, world_name, spawn_name)
+    # Proposal names are unique across worlds, also compared case-insensitively
+    existing_proposal = None
+    if not existing_spawn:
+        existing_proposal = await db.scalar(select(SpawnProposal.id).where(
+            func.lower(SpawnProposal.name) == spawn_name.lower()
+        ))
+    if existing_spawn or existing_proposal:
         return templates.TemplateResponse(
             "propose_spawn.html",
             {
                 "current_user": user,
                 "request": request,
                 "world_name": world_name,
-                "error": f"A spawn named '{spawn_name}' already exists in {world.name}.",
+                "error": f"A spawn named '{spawn_name}' already exists in {world.name}." if existing_spawn else f"A spawn named '{spawn_name}' has already been proposed.",
                 "message": "Please try a different name.",
                 # Retain form values to pre-fill the form on error, for better UX
                 "name": spawn_name,
@@ -270,121 +376,116 @@ async def post_propose_spawn(
     )
 
     db.add(new_proposal)
-    db.commit()
-    db.refresh(new_proposal)
+    await db.commit()
+    world_stats_cache.invalidate(world.id)
+    await db.refresh(new_proposal)
 
     return RedirectResponse(url=f"/worlds/{world.name}", status_code=status.HTTP_303_SEE_OTHER)
 
 
+def spawn_page_proposals_select(spawn: Spawn, user_id: Optional[int], now_utc: datetime):
+    """
+    Selects (proposal, category, user's vote type, spawn's active users) rows
+    for the change proposals listed on the spawn page, in display order:
+
+    - "permanent": the last approved permanent change
+    - "temporary": the last approved temporary change currently in effect
+    - "recent": proposals approved or rejected within the last week
+    - "pending": the 3 oldest pending proposals
+
+    Each category is ranked with row_number() in a UNION ALL, so a proposal
+    can be listed in more than one category. The user's vote is outer-joined
+    for the listed proposals only. The spawn's world must be loaded.
+    """
+    proposals = SpawnChangeProposal
+    categories = [
+        ("permanent", 1, proposals.approved_at.desc(), (
+            proposals.status == ProposalStatus.APPROVED,
+            proposals.start_time.is_(None),
+            proposals.end_time.is_(None)
+        )),
+        ("temporary", 1, proposals.approved_at.desc(), (
+            proposals.status == ProposalStatus.APPROVED,
+            proposals.start_time.isnot(None),
+            proposals.end_time.isnot(None),
+            proposals.start_time <= now_utc,
+            proposals.end_time >= now_utc
+        )),
+        ("recent", None, proposals.approved_at.desc(), (
+            proposals.status.in_([ProposalStatus.REJECTED, ProposalStatus.APPROVED]),
+            proposals.approved_at >= now_utc - timedelta(days=7)
+        )),
+        ("pending", 3, proposals.created_at.asc(), (
+            proposals.status == ProposalStatus.PENDING,
+        )),
+    ]
+    ranked = union_all(*(
+        select(
+            proposals.id.label("proposal_id"),
+            literal(category).label("category"),
+            literal(position).label("position"),
+            literal(limit, Integer).label("max_rank"),
+            func.row_number().over(order_by=order_by).label("rank")
+        ).where(proposals.spawn_id == spawn.id, *conditions)
+        for position, (category, limit, order_by, conditions) in enumerate(categories)
+    )).subquery()
+
+    threshold_date = now_utc - spawn.world.inactive_threshold
+    active_users_count = select(func.count(distinct(UserWorldActivity.user_id))).where(
+        UserWorldActivity.spawn_id == spawn.id,
+        UserWorldActivity.last_activity_at >= threshold_date
+    ).scalar_subquery()
+
+    return (
+        select(proposals, ranked.c.category, Vote.vote_type, active_users_count)
+        .join(ranked, ranked.c.proposal_id == proposals.id)
+        .outerjoin(Vote, and_(Vote.proposal_id == proposals.id, Vote.user_id == user_id))
+        .where(or_(ranked.c.max_rank.is_(None), ranked.c.rank <= ranked.c.max_rank))
+        .order_by(ranked.c.position, ranked.c.rank)
+    )
+
+
 @router.get("/worlds/{world_name}/spawns/{spawn_name}", response_class=HTMLResponse)
 async def get_spawn_detail_page(
     request: Request,
     world_name: str,
     spawn_name: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Displays a dedicated page for a specific spawn within a world.
     Both world_name and spawn_name lookups are case-insensitive.
     Also fetches and displays various types of spawn change proposals.
     """
-
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
-    if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
-
-    # First, find the world
-    world = db.query(World).filter(func.lower(World.name) == world_name.lower()).first()
-    if not world:
+    world_id, spawn_id = await slug_resolver.spawn_id(db, world_name, spawn_name)
+    if world_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="World not found")
-
-    # Then, find the spawn within that world
-    spawn = db.query(Spawn).filter(
-        func.lower(Spawn.name) == spawn_name.lower(),
-        Spawn.world_id == world.id
-    ).first()
-    if not spawn:
+    if spawn_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Spawn not found in this world")
+    spawn = await db.get(Spawn, spawn_id, options=SPAWN_PAGE_SPAWN)
+    world = spawn.world
 
-    # Fetch last approved permanent change proposal
-    last_approved_permanent_proposal = db.query(SpawnChangeProposal).filter(
-        SpawnChangeProposal.spawn_id == spawn.id,
-        SpawnChangeProposal.status == ProposalStatus.APPROVED,
-        SpawnChangeProposal.start_time.is_(None),
-        SpawnChangeProposal.end_time.is_(None)
-    ).order_by(SpawnChangeProposal.approved_at.desc()).first()
-
-    # Fetch last approved temporary change proposal if it is currently in effect
     now_utc = datetime.now(UTC)
-    last_approved_temporary_proposal = db.query(SpawnChangeProposal).filter(
-        SpawnChangeProposal.spawn_id == spawn.id,
-        SpawnChangeProposal.status == ProposalStatus.APPROVED,
-        SpawnChangeProposal.start_time.isnot(None),
-        SpawnChangeProposal.end_time.isnot(None),
-        SpawnChangeProposal.start_time <= now_utc,
-        SpawnChangeProposal.end_time >= now_utc
-    ).order_by(SpawnChangeProposal.approved_at.desc()).first()
-
-    # Fetch recently rejected AND approved proposals (displayed for a week)
-    one_week_ago = now_utc - timedelta(days=7)
-    recently_rejected_and_approved_proposals = db.query(SpawnChangeProposal).filter(
-        SpawnChangeProposal.spawn_id == spawn.id,
-        SpawnChangeProposal.status.in_([ProposalStatus.REJECTED, ProposalStatus.APPROVED]), # Modified filter
-        SpawnChangeProposal.approved_at >= one_week_ago # Assuming approved_at is used for rejection/approval timestamp
-    ).order_by(SpawnChangeProposal.approved_at.desc()).all()
-
-
-    # Fetch currently pending proposals (limit to 3, scrollable)
-    pending_proposals_raw = db.query(SpawnChangeProposal).filter(
-        SpawnChangeProposal.spawn_id == spawn.id,
-        SpawnChangeProposal.status == ProposalStatus.PENDING
-    ).order_by(SpawnChangeProposal.created_at.asc()).limit(3).all()
-
-    # Get logged-in user ID for template rendering logic and fetching user-specific data
-    logged_in_user_id = request.session.get('user_id')
-
-    # Prepare pending proposals with user's vote status
-    pending_proposals = []
-
-    # Eager load the spawn_change_proposals_voted to get the vote type
-    user = db.query(User).filter(User.id == logged_in_user_id).first()
-
-    if user:
-        # Query the proposal_votes association table directly for user's votes
-        user_vote_records = db.query(Vote).filter(Vote.user_id == logged_in_user_id).all()
-
-        # Create a dictionary to quickly look up user's vote for each proposal
-        user_votes = {vote.proposal_id: vote.vote_type.value for vote in user_vote_records}
-
-        for proposal in pending_proposals_raw:
-            # Check if the user has voted on this specific proposal
-            proposal.user_vote = user_votes.get(proposal.id)
-            pending_proposals.append(proposal)
-    else:
-        # If user not found (e.g., session stale), treat as not logged in for voting purposes
-        for proposal in pending_proposals_raw:
-            proposal.user_vote = None
-            pending_proposals.append(proposal)
-
-    # Helper to calculate engagement and favorability for proposals
-    def calculate_proposal_stats(proposal):
-        return {
-            "engagement": proposal.get_engagement(db),
+    logged_in_user_id = user.id if user else None
+
+    # Every proposal card, the user's votes on them and the spawn's active-user
+    # count come back from one query
+    rows = (await db.execute(spawn_page_proposals_select(spawn, logged_in_user_id, now_utc))).all()
+    listed = {"permanent": [], "temporary": [], "recent": [], "pending": []}
+    for proposal, category, user_vote, active_users_count in rows:
+        proposal.user_vote = user_vote.value if user_vote else None
+        # Engagement per active user; vote tallies are counter columns on the proposal
+        proposal.stats = {
+            "engagement": proposal.engagement_for(active_users_count),
             "favorability": proposal.favourability
         }
+        listed[category].append(proposal)
 
-    # Attach stats to proposals
-    if last_approved_permanent_proposal:
-        last_approved_permanent_proposal.stats = calculate_proposal_stats(last_approved_permanent_proposal)
-    if last_approved_temporary_proposal:
-        last_approved_temporary_proposal.stats = calculate_proposal_stats(last_approved_temporary_proposal)
-    for proposal in recently_rejected_and_approved_proposals: # Apply to the combined list
-        proposal.stats = calculate_proposal_stats(proposal)
-    for proposal in pending_proposals:
-        proposal.stats = calculate_proposal_stats(proposal)
+    last_approved_permanent_proposal = listed["permanent"][0] if listed["permanent"] else None
+    last_approved_temporary_proposal = listed["temporary"][0] if listed["temporary"] else None
+    recently_rejected_and_approved_proposals = listed["recent"]
+    pending_proposals = listed["pending"]
 
     return templates.TemplateResponse(
         "spawn_detail.html",
@@ -407,21 +508,17 @@ async def sponsor_spawn_proposal(
     request: Request,
     world_name: str,
     proposal_id: int = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Handles sponsoring a spawn proposal asynchronously.
     This function implements the sponsorship logic and evaluates approval thresholds.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
-
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Only accessable by users, login first")
 
-    spawn_proposal = db.query(SpawnProposal).filter(SpawnProposal.id == proposal_id).first()
+    spawn_proposal = await db.scalar(select(SpawnProposal).options(*SPONSOR_PROPOSAL).where(SpawnProposal.id == proposal_id))
     if not spawn_proposal:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Spawn proposal not found.")
 
@@ -435,102 +532,92 @@ async def sponsor_spawn_proposal(
     if spawn_proposal.status != ProposalStatus.PENDING:
         return {"message": f"This proposal is already {spawn_proposal.status.value}.", "proposal_id": proposal_id}
 
-    # Check if user has already sponsored this proposal
-    if user in spawn_proposal.sponsors:
-        return {"message": "You have already sponsored this proposal.", "proposal_id": proposal_id}
-
-    # Add the sponsorship
-    spawn_proposal.sponsors.append(user)
-    db.add(spawn_proposal)
-    db.commit()
-    db.refresh(spawn_proposal) # Refresh to get updated sponsors list
-
     # --- Evaluate Sponsorship Thresholds ---
     # 1. Calculate active users in the world (for the 1% rule)
     # An "active user" in a world is defined as any user who has:
     # - Has at least one Character associated with that World AND
     # - That character has participated in *any* Hunt within that World in the last 90 days.
+    # Read before the sponsorship's transaction starts writing
+    world_stats = await world_stats_cache.get(world.id, lambda: load_world_stats(db, world))
+    min_sponsors_required = min(world.sponsorship_flat, round(world_stats["active_users_count"] * world.sposorship_fraction))
+
+    # Add the sponsorship; a repeated or concurrent one by the same user is not inserted
+    num_sponsors = await db.run_sync(lambda session: SpawnProposal.sponsor(session.connection(), user.id, proposal_id))
+    if num_sponsors is None:
+        await db.rollback()
+        spawn_proposal = await db.get(SpawnProposal, proposal_id)
+        if spawn_proposal.status != ProposalStatus.PENDING:
+            return {"message": f"This proposal is already {spawn_proposal.status.value}.", "proposal_id": proposal_id}
+        return {"message": "You have already sponsored this proposal.", "proposal_id": proposal_id}
 
-
-    active_users_count = len(world.get_active_users(db))
-    min_sponsors_required = min(world.sponsorship_flat, round(active_users_count * world.sposorship_fraction))
-
-    # Check if the proposal meets the approval threshold
-    if spawn_proposal.num_sponsors >= min_sponsors_required:
-        spawn_proposal.status = ProposalStatus.APPROVED
-        spawn_proposal.approved_at = datetime.now(UTC)
-
-        # Create the actual Spawn if the proposal is approved
-        new_spawn = Spawn(
-            name=spawn_proposal.name,
-            description=spawn_proposal.description,
-            world_id=spawn_proposal.world_id,
-            # min_level=spawn_proposal.min_level,
-            # max_level=spawn_proposal.max_level,
-            # Hardcoded defaults for fields not in SpawnProposal model (for now)
-            # These fields need to be added to SpawnProposal model for full configurability
-            locking_period=spawn_proposal.locking_period, # Default value
-            claim_time_min=spawn_proposal.claim_time_min,         # Default value
-            claim_time_max=spawn_proposal.claim_time_max,        # Default value
-            deprioratize_time=spawn_proposal.deprioratize_time if spawn_proposal.deprioratize_time != None else timedelta(minutes=0),   # Default value
-            proposal_id=spawn_proposal.id, # Link to the proposal
-        )
-        db.add(new_spawn)
-        db.flush() # Flush to get the ID for new_spawn before committing
-        spawn_proposal.spawn_id = new_spawn.id # Link proposal to created spawn
-
-        db.commit()
-        db.refresh(spawn_proposal)
-        db.refresh(new_spawn)
-
-        return JSONResponse({
-            "message": "Proposal approved and spawn created!",
-            "proposal_id": proposal_id,
-            "spawn_created": True,
-            "spawn_details": {
-                "id": new_spawn.id,
-                "name": new_spawn.name,
-                "description": new_spawn.description,
-                # "min_level": new_spawn.min_level,
-                # "max_level": new_spawn.max_level,
-                "locking_period": new_spawn.locking_period.seconds//60,
-                "claim_time_min": new_spawn.claim_time_min.seconds//60,
-                "claim_time_max": new_spawn.claim_time_max.seconds//60,
-                "deprioratize_time": new_spawn.deprioratize_time.seconds//60
-            }
-        })
-    else:
-        db.commit() # Commit the sponsorship even if not approved yet
-        return JSONResponse({"message": f"Proposal sponsored successfully! Needs {min_sponsors_required - spawn_proposal.num_sponsors} more sponsors for approval.", "proposal_id": proposal_id})
+    # Check if the proposal meets the approval threshold; of several
+    # concurrent final sponsors, only one gets to approve it
+    approved = None
+    if num_sponsors >= min_sponsors_required:
+        approved = await db.run_sync(lambda session: SpawnProposal.approve(session.connection(), proposal_id))
+    if not approved:
+        await db.commit() # Commit the sponsorship even if not approved yet
+        if num_sponsors >= min_sponsors_required:
+            return {"message": "Proposal sponsored successfully! It has already been approved.", "proposal_id": proposal_id}
+        return JSONResponse({"message": f"Proposal sponsored successfully! Needs {min_sponsors_required - num_sponsors} more sponsors for approval.", "proposal_id": proposal_id})
+
+    # Create the actual Spawn now that the proposal is approved
+    new_spawn = Spawn(
+        name=approved.name,
+        description=approved.description,
+        world_id=approved.world_id,
+        # min_level=spawn_proposal.min_level,
+        # max_level=spawn_proposal.max_level,
+        locking_period=approved.locking_period,
+        claim_time_min=approved.claim_time_min,
+        claim_time_max=approved.claim_time_max,
+        deprioratize_time=approved.deprioratize_time if approved.deprioratize_time != None else timedelta(minutes=0),
+        proposal_id=proposal_id, # Link to the proposal
+    )
+    db.add(new_spawn)
+    await db.commit()
+    slug_resolver.invalidate()
+    world_stats_cache.invalidate(world.id)
+
+    return JSONResponse({
+        "message": "Proposal approved and spawn created!",
+        "proposal_id": proposal_id,
+        "spawn_created": True,
+        "spawn_details": {
+            "id": new_spawn.id,
+            "name": new_spawn.name,
+            "description": new_spawn.description,
+            # "min_level": new_spawn.min_level,
+            # "max_level": new_spawn.max_level,
+            "locking_period": new_spawn.locking_period.seconds//60,
+            "claim_time_min": new_spawn.claim_time_min.seconds//60,
+            "claim_time_max": new_spawn.claim_time_max.seconds//60,
+            "deprioratize_time": new_spawn.deprioratize_time.seconds//60
+        }
+    })
 
 @router.get("/worlds/{world_name}/spawns/{spawn_name}/propose", response_class=HTMLResponse)
 async def get_propose_spawn_change_form(
     request: Request,
     world_name: str,
     spawn_name: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Displays the form for proposing changes to an existing spawn.
     Dynamically populates current values and allows input for new ones.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
-    world = db.query(World).filter(func.lower(World.name) == world_name.lower()).first()
-    if not world:
+    world_id, spawn_id = await slug_resolver.spawn_id(db, world_name, spawn_name)
+    if world_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="World not found")
-
-    spawn = db.query(Spawn).filter(
-        func.lower(Spawn.name) == spawn_name.lower(),
-        Spawn.world_id == world.id
-    ).first()
-    if not spawn:
+    if spawn_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Spawn not found in this world.")
+    spawn = await db.get(Spawn, spawn_id, options=SPAWN_PAGE_SPAWN)
+    world = spawn.world
 
     return templates.TemplateResponse(
         "propose_change.html",
@@ -551,17 +638,14 @@ async def vote_on_spawn_change_proposal(
     spawn_name: str,
     proposal_id: int = Form(...),
     raw_vote_type: str = Form(..., alias="vote_type"), # Receive as string
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Handles casting a vote (upvote/downvote) on a spawn change proposal.
     Evaluates proposal status based on vote thresholds.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You must be logged in to vote on proposals.")
 
     try:
@@ -569,110 +653,84 @@ async def vote_on_spawn_change_proposal(
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid vote type. Must be 'upvote' or 'downvote'.")
 
-
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
-
-    # Modified query to join with World and filter correctly
-    spawn = db.query(Spawn).join(World).filter(
-        func.lower(Spawn.name) == spawn_name.lower(),
-        func.lower(World.name) == world_name.lower()
-    ).first()
-
-    if not spawn:
+    _, spawn_id = await slug_resolver.spawn_id(db, world_name, spawn_name)
+    if spawn_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Spawn not found.")
+    spawn = await db.get(Spawn, spawn_id, options=SPAWN_PAGE_SPAWN)
     world = spawn.world
-    proposal = db.query(SpawnChangeProposal).filter(
-        SpawnChangeProposal.id == proposal_id,
-        SpawnChangeProposal.spawn_id == spawn.id
-    ).first()
-    if not proposal:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Spawn change proposal not found for this spawn.")
-
-    # Check if the proposal is still pending
-    if proposal.status != ProposalStatus.PENDING:
-        return {"message": f"This proposal is already {proposal.status.value}.", "proposal_id": proposal_id, "status": proposal.status.value}
-
-    # Check if the user has already voted on this proposal
-    # We need to query the association table directly for the user's vote
-    existing_vote_record = db.query(Vote).filter(Vote.user_id == user_id, Vote.proposal_id == proposal_id).first()
-
-    if existing_vote_record:
-        # User has already voted. Decide if re-voting is allowed or simply return a message.
-        # For now, let's just inform them they've already voted.
-        return {"message": "You have already voted on this proposal.", "proposal_id": proposal_id, "status": "already_voted", "your_vote": existing_vote_record.vote_type.value}
+    # Read before the vote's transaction starts writing
+    active_users_count = await spawn_active_users_cache.get(spawn.id, lambda: load_spawn_active_users(db, spawn))
 
     try:
-        # Add the vote record to the association table
-        vote = Vote(user=user, proposal=proposal, vote_type=vote_type)
-
-        db.add(vote)
-        db.add(proposal) # Add proposal back to session to mark it for update
-        db.commit()
-        db.refresh(proposal) # Refresh to get updated vote counts
-
-        if proposal.get_engagement(db) >= world.engagement_threshold:
-            if proposal.favourability >= world.favourability_approval:
-                # Proposal approved! Apply changes to the Spawn.
-                proposal.status = ProposalStatus.APPROVED
-                proposal.approved_at = datetime.now(UTC)
-                if proposal.start_time == None:
-                    spawn.locking_period_minutes = proposal.locking_period
-                    spawn.claim_time_min = proposal.claim_time_min
-                    spawn.claim_time_max = proposal.claim_time_max
-                    db.add(spawn)
-                db.add(proposal)
-                db.commit()
-                return {
-                    "message": "Vote cast successfully! Proposal APPROVED and changes applied.",
-                    "proposal_id": proposal_id,
-                    "status": "approved",
-                    "your_vote": vote_type.value,
-                    "current_votes_for": proposal.votes_for, # Return current counts
-                    "current_votes_against": proposal.votes_against,
-                    "total_votes": proposal.total_votes,
-                    "favorability": proposal.favourability
-                }
-            elif proposal.favourability < world.favourability_rejection:
-                # Proposal rejected due to not meeting approval percentage
-                proposal.status = ProposalStatus.REJECTED
-                proposal.approved_at = datetime.now(UTC) # Use approved_at for rejection timestamp too
-                db.add(proposal)
-                db.commit()
-                return {
-                    "message": "Vote cast successfully! Proposal REJECTED (did not meet approval threshold).",
-                    "proposal_id": proposal_id,
-                    "status": "rejected",
-                    "your_vote": vote_type.value,
-                    "current_votes_for": proposal.votes_for, # Return current counts
-                    "current_votes_against": proposal.votes_against,
-                    "total_votes": proposal.total_votes,
-                    "favorability": proposal.favourability
-                }
-        else:
-            # Not enough total votes yet, remains pending
-            db.commit() # Commit the vote even if not approved yet
-            return {
-                "message": f"Vote cast successfully! Proposal is still PENDING.",
-                "proposal_id": proposal_id,
-                "status": "pending",
-                "your_vote": vote_type.value,
-                "current_votes_for": proposal.votes_for,
-                "current_votes_against": proposal.votes_against,
-                "total_votes": proposal.total_votes,
-                "favorability": round((proposal.votes_for / proposal.total_votes) * 100, 2) if proposal.total_votes > 0 else 0.0
-            }
-
+        # Insert the vote and bump the proposal's counter; a concurrent or
+        # repeated vote by the same user is simply not inserted
+        tallies = await db.run_sync(lambda session: Vote.cast(session.connection(), user.id, proposal_id, spawn_id, vote_type))
+        if tallies is None:
+            await db.rollback() # Expires the spawn; only its id is needed below
+            proposal = await db.get(SpawnChangeProposal, proposal_id)
+            if not proposal or proposal.spawn_id != spawn_id:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Spawn change proposal not found for this spawn.")
+            if proposal.status != ProposalStatus.PENDING:
+                return {"message": f"This proposal is already {proposal.status.value}.", "proposal_id": proposal_id, "status": proposal.status.value}
+            existing_vote_record = await db.get(Vote, (user.id, proposal_id))
+            return {"message": "You have already voted on this proposal.", "proposal_id": proposal_id, "status": "already_voted", "your_vote": existing_vote_record.vote_type.value}
+
+        votes_for, votes_against = tallies
+        total_votes = votes_for + votes_against
+        # Same rules as SpawnChangeProposal.get_engagement and .favourability
+        engagement = math.floor(total_votes / max(active_users_count, 1))
+        favourability = math.floor(votes_for / max(total_votes, 1) * 100)
+
+        decision = None
+        if engagement >= world.engagement_threshold:
+            if favourability >= world.favourability_approval:
+                decision = ProposalStatus.APPROVED
+            elif favourability < world.favourability_rejection:
+                decision = ProposalStatus.REJECTED
+
+        # Only one of several concurrent voters gets to decide the proposal
+        decided = None
+        if decision:
+            decided = await db.run_sync(lambda session: SpawnChangeProposal.decide(session.connection(), proposal_id, decision))
+        changes_applied = decided and decision == ProposalStatus.APPROVED and decided.start_time == None
+        if changes_applied:
+            # Proposal approved! Apply changes to the Spawn.
+            spawn.locking_period = decided.locking_period
+            spawn.claim_time_min = decided.claim_time_min
+            spawn.claim_time_max = decided.claim_time_max
+        await db.commit()
+        if changes_applied:
+            schedules.invalidate(spawn_id) # Kept schedules use the old claim limits and locking period
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         # This could happen if a concurrent vote was cast or there's an issue with the association table.
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Database error while recording vote: {e.orig}")
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.info(f"Error during vote submission: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred while casting your vote.")
 
+    response = {
+        "proposal_id": proposal_id,
+        "your_vote": vote_type.value,
+        "current_votes_for": votes_for, # Return current counts
+        "current_votes_against": votes_against,
+        "total_votes": total_votes
+    }
+    if decided and decision == ProposalStatus.APPROVED:
+        return {"message": "Vote cast successfully! Proposal APPROVED and changes applied.", "status": "approved", "favorability": favourability, **response}
+    if decided and decision == ProposalStatus.REJECTED:
+        return {"message": "Vote cast successfully! Proposal REJECTED (did not meet approval threshold).", "status": "rejected", "favorability": favourability, **response}
+    # Not decided yet, remains pending
+    return {
+        "message": f"Vote cast successfully! Proposal is still PENDING.",
+        "status": "pending",
+        "favorability": round((votes_for / total_votes) * 100, 2) if total_votes > 0 else 0.0,
+        **response
+    }
+
 
 @router.post("/worlds/{world_name}/spawns/{spawn_name}/propose", response_class=HTMLResponse)
 async def post_propose_spawn_change(
@@ -687,30 +745,22 @@ async def post_propose_spawn_change(
     temporary_change_toggle: Optional[str] = Form(None), # Checkbox sends 'on' if checked, None if unchecked
     start_date: Optional[str] = Form(None), # Date string 'YYYY-MM-DD'
     end_date: Optional[str] = Form(None),   # Date string 'YYYY-MM-DD'
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Handles the actual submission and processing of SpawnChangeProposals.
     Creates a new SpawnChangeProposal in the database.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).filter(User.id == user_id).first()
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
-    world = db.query(World).filter(func.lower(World.name) == world_name.lower()).first()
-    if not world:
+    world_id, resolved_spawn_id = await slug_resolver.spawn_id(db, world_name, spawn_name)
+    if world_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="World not found")
-
-    spawn = db.query(Spawn).filter(
-        func.lower(Spawn.name) == spawn_name.lower(),
-        Spawn.world_id == world.id,
-        Spawn.id == spawn_id # Ensure the ID matches for robustness
-    ).first()
-    if not spawn:
+    if resolved_spawn_id != spawn_id: # Ensure the ID matches for robustness
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Spawn not found in this world with the provided ID.")
+    spawn = await db.get(Spawn, spawn_id, options=SPAWN_PAGE_SPAWN)
     world = spawn.world
     # Prepare settings time deltas
     locking_period_delta = timedelta(minutes=locking_period_minutes)
@@ -772,8 +822,8 @@ async def post_propose_spawn_change(
         )
 
         db.add(new_change_proposal)
-        db.commit()
-        db.refresh(new_change_proposal)
+        await db.commit()
+        await db.refresh(new_change_proposal)
 
         message_text = "Your spawn change proposal has been successfully submitted for review!"
         return RedirectResponse(
@@ -782,7 +832,7 @@ async def post_propose_spawn_change(
         )
 
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         # You might want to log the full error `e` for debugging
         error_message = f"A database integrity error occurred while submitting your proposal: {e.orig}"
         return RedirectResponse(
@@ -790,7 +840,7 @@ async def post_propose_spawn_change(
             status_code=status.HTTP_303_SEE_OTHER
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.info(f"Error during spawn change proposal submission: {e}") # Log the full error
         error_message = "An unexpected error occurred during your proposal submission."
         return RedirectResponse(
@@ -805,28 +855,23 @@ async def toggle_spawn_favourite(
     world_name: str,
     spawn_name: str,
     action: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    user: CurrentUser = Depends(get_current_user)
 ):
     """
     Adds or removes a spawn from the logged-in user's favourites based on the
     provided action. This endpoint expects 'add' or 'remove' as the action
     in the form data, aligning with the `updateFavouritesOnServer` JavaScript function.
     """
-    user_id = request.session.get('user_id')
-    user = db.query(User).options(joinedload(User.favourite_spawns)).filter(User.id == user_id).first()
     if not user:
-        request.session.pop('user_id', None)
-        request.session.pop('username', None)
         return JSONResponse(
             status_code=status.HTTP_403_FORBIDDEN,
             content={"detail": "You must be logged in to favourite a spawn."}
         )
 
     # Find the spawn using a case-insensitive search, ensuring it belongs to the correct world
-    spawn = db.query(Spawn).join(World).filter(
-        func.lower(World.name) == world_name.lower(),
-        func.lower(Spawn.name) == spawn_name.lower()
-    ).first()
+    _, spawn_id = await slug_resolver.spawn_id(db, world_name, spawn_name)
+    spawn = await db.get(Spawn, spawn_id) if spawn_id is not None else None
 
     if not spawn:
         return JSONResponse(
@@ -834,21 +879,22 @@ async def toggle_spawn_favourite(
             content={"detail": "Spawn not found in this world."}
         )
 
+    db_user = (await db.scalars(select(User).options(selectinload(User.favourite_spawns)).where(User.id == user.id))).one()
     is_favourited: bool
     message: str
 
     if action == "add":
-        if spawn not in user.favourite_spawns:
-            user.favourite_spawns.append(spawn)
-            db.add(user)
+        if spawn not in db_user.favourite_spawns:
+            db_user.favourite_spawns.append(spawn)
+            db.add(db_user)
             message = f"'{spawn.name}' has been added to your favourites."
         else:
             message = f"'{spawn.name}' is already in your favourites."
         is_favourited = True
     elif action == "remove":
-        if spawn in user.favourite_spawns:
-            user.favourite_spawns.remove(spawn)
-            db.add(user)
+        if spawn in db_user.favourite_spawns:
+            db_user.favourite_spawns.remove(spawn)
+            db.add(db_user)
             message = f"'{spawn.name}' has been removed from your favourites."
         else:
             message = f"'{spawn.name}' is not in your favourites."
@@ -860,9 +906,9 @@ async def toggle_spawn_favourite(
         )
 
     try:
-        db.commit()
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error updating favourites: {e}")
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
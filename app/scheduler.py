@@ -0,0 +1,423 @@
+"""
+Filename: scheduler.py
+
+Resolves a spawn's open bids into hunts.
+
+- Bids are placed highest bid_points first (the earlier bid wins a tie), each
+  at the earliest start in its hunt window where the whole claim fits.
+- The claim lasts the bid's claim_time minutes, clamped to the spawn's
+  claim_time_min/claim_time_max.
+- Hunts already on the timeline (locked bids, manual hunts) are kept free of.
+- Bids that fit get a scheduled_start and a Hunt row; the others lose.
+
+The free time is kept as sorted, disjoint gaps in a treap that also tracks the
+longest gap of each subtree, so finding and taking a slot is O(log n) and
+resolving n bids is O(n log n).
+
+A single bid added or withdrawn only reallocates the bids whose windows
+overlap it, directly or through each other; see SpawnSchedule.
+
+Writes go through lock_sweeper, which hears about the new lock deadlines, and
+its scheduling job resolves every spawn with open bids (python lock_sweeper.py):
+
+    await resolve_spawn_and_track(db, spawn_id)
+    await change_schedule_and_track(db, spawn_id, lambda schedule: schedule.add(bid))
+"""
+
+import os
+import random
+from bisect import bisect_right
+from datetime import datetime, timedelta, UTC
+from typing import Optional
+
+from sqlalchemy import select, insert, update, delete, bindparam, func, or_
+
+from models import Bid, Hunt, Spawn, Character, UserWorldActivity
+
+SCHEDULE_MAX_AGE = float(os.environ.get("SCHEDULE_MAX_AGE", "300")) # seconds before a kept schedule is loaded again
+
+
+class _Gap:
+    """A treap node: one free interval [start, end)."""
+    __slots__ = ('start', 'end', 'priority', 'left', 'right', 'longest')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.longest = end - start
+
+
+def _update(node):
+    node.longest = node.end - node.start
+    if node.left and node.left.longest > node.longest:
+        node.longest = node.left.longest
+    if node.right and node.right.longest > node.longest:
+        node.longest = node.right.longest
+    return node
+
+
+def _split(node, key):
+    """Splits into (gaps starting before key, gaps starting at or after key)."""
+    if node is None:
+        return None, None
+    if node.start < key:
+        node.right, right = _split(node.right, key)
+        return _update(node), right
+    left, node.left = _split(node.left, key)
+    return left, _update(node)
+
+
+def _merge(left, right):
+    """Joins two treaps; every gap in left starts before those in right."""
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return _update(left)
+    right.left = _merge(left, right.left)
+    return _update(right)
+
+
+def _last(node):
+    while node is not None and node.right is not None:
+        node = node.right
+    return node
+
+
+def _first_fitting(node, length):
+    """The earliest gap at least `length` long."""
+    while node is not None and node.longest >= length:
+        if node.left is not None and node.left.longest >= length:
+            node = node.left
+        elif node.end - node.start >= length:
+            return node
+        else:
+            node = node.right
+    return None
+
+
+class FreeSlots:
+    """The free time of one spawn's timeline, as sorted disjoint gaps."""
+
+    def __init__(self, start: datetime = datetime.min, end: datetime = datetime.max):
+        self._root = _Gap(start, end)
+
+    def __iter__(self):
+        """Yields the gaps as (start, end), in order."""
+        stack, node = [], self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.start, node.end
+            node = node.right
+
+    def find(self, earliest: datetime, latest_end: datetime, length: timedelta) -> Optional[datetime]:
+        """
+        The earliest free start at or after `earliest` for a claim of `length`
+        that ends by `latest_end`, or None if there is none.
+        """
+        before, after = _split(self._root, earliest)
+        start = None
+        gap = _last(before)
+        if gap is not None and gap.end - earliest >= length:
+            start = earliest # The gap straddling `earliest` is long enough
+        else:
+            gap = _first_fitting(after, length)
+            if gap is not None:
+                start = gap.start
+        self._root = _merge(before, after)
+        if start is None or start + length > latest_end:
+            return None
+        return start
+
+    def take(self, start: datetime, end: datetime):
+        """Marks [start, end) as busy, whether or not all of it was free."""
+        before, rest = _split(self._root, start)
+        inside, after = _split(rest, end)
+        pieces = []
+        gap = _last(before)
+        if gap is not None and gap.end > start:
+            before, _ = _split(before, gap.start)
+            pieces.append((gap.start, start))
+            if gap.end > end:
+                pieces.append((end, gap.end))
+        gap = _last(inside)
+        if gap is not None and gap.end > end:
+            pieces.append((end, gap.end))
+        for piece_start, piece_end in pieces:
+            if piece_end > piece_start:
+                before = _merge(before, _Gap(piece_start, piece_end))
+        self._root = _merge(before, after)
+
+
+def claim_duration(claim_time: int, claim_time_min: timedelta, claim_time_max: timedelta) -> timedelta:
+    """A bid's claim_time minutes, clamped to the spawn's limits."""
+    return min(max(timedelta(minutes=claim_time), claim_time_min), claim_time_max)
+
+
+def allocate(bids, claim_time_min: timedelta, claim_time_max: timedelta, reserved=(), not_before: Optional[datetime] = None) -> dict:
+    """
+    Places bids (objects or rows with id, bid_points, claim_time,
+    hunt_window_start and hunt_window_end) on a timeline that is busy during
+    the `reserved` (start, end) intervals. Nothing starts before `not_before`.
+    Returns {bid_id: scheduled_start} for the bids that fit.
+    """
+    slots = FreeSlots()
+    for start, end in reserved:
+        slots.take(start, end)
+
+    schedule = {}
+    for bid in sorted(bids, key=lambda bid: (-bid.bid_points, bid.id)):
+        length = claim_duration(bid.claim_time, claim_time_min, claim_time_max)
+        earliest = max(bid.hunt_window_start, not_before) if not_before else bid.hunt_window_start
+        start = slots.find(earliest, bid.hunt_window_end, length)
+        if start is not None:
+            slots.take(start, start + length)
+            schedule[bid.id] = start
+    return schedule
+
+
+class _Component:
+    """Bids whose hunt windows overlap, directly or through each other."""
+    __slots__ = ('start', 'end', 'bid_ids')
+
+    def __init__(self, start, end, bid_ids):
+        self.start = start
+        self.end = end
+        self.bid_ids = bid_ids
+
+
+class SpawnSchedule:
+    """
+    One spawn's schedule, kept up to date as single bids come and go.
+
+    A bid can only be placed inside its own window, so bids in different
+    connected components of overlapping windows never compete: adding or
+    withdrawing a bid reallocates just its component, and the result is the
+    same as allocating every bid again. The schedule is computed for a fixed
+    `not_before`; reload it from the database as time moves on.
+    """
+
+    def __init__(self, spawn_id: int, claim_time_min: timedelta, claim_time_max: timedelta, reserved=(), not_before: Optional[datetime] = None,
+                 locking_period: timedelta = timedelta(0)):
+        self.spawn_id = spawn_id
+        self.claim_time_min = claim_time_min
+        self.claim_time_max = claim_time_max
+        self.locking_period = locking_period
+        self.reserved = list(reserved)
+        self.not_before = not_before
+        self.bids = {} # bid id -> bid
+        self.schedule = {} # bid id -> scheduled start, for the winners
+        self._components = [] # disjoint, sorted by start
+        self._component_of = {} # bid id -> _Component
+
+    @classmethod
+    def load(cls, connection, spawn_id: int, now: Optional[datetime] = None) -> 'SpawnSchedule':
+        """Builds the schedule of the spawn's open bids (not locked, window not over)."""
+        now = now or datetime.now(UTC).replace(tzinfo=None)
+        spawn = connection.execute(
+            select(Spawn.claim_time_min, Spawn.claim_time_max, Spawn.locking_period).where(Spawn.id == spawn_id)
+        ).one()
+        bids = connection.execute(
+            select(Bid.id, Bid.character_id, Bid.bid_points, Bid.claim_time, Bid.hunt_window_start, Bid.hunt_window_end)
+            .where(Bid.spawn_id == spawn_id, Bid.hunt_window_end > now, or_(Bid.is_locked == False, Bid.is_locked.is_(None)))
+        ).all()
+        # The open bids' own hunts are replaced on write; any other hunt stays put
+        reserved = connection.execute(
+            select(Hunt.start_time, Hunt.end_time)
+            .where(Hunt.spawn_id == spawn_id, Hunt.end_time > now, or_(Hunt.bid_id.is_(None), Hunt.bid_id.not_in([bid.id for bid in bids])))
+        ).all()
+        schedule = cls(spawn_id, spawn.claim_time_min, spawn.claim_time_max, [tuple(interval) for interval in reserved], not_before=now,
+                       locking_period=spawn.locking_period)
+        schedule.bids = {bid.id: bid for bid in bids}
+        schedule._components = schedule._connect(list(schedule.bids))
+        schedule._component_of = {bid_id: component for component in schedule._components for bid_id in component.bid_ids}
+        schedule.schedule = schedule._allocate(list(schedule.bids))
+        return schedule
+
+    def _window(self, bid):
+        start = max(bid.hunt_window_start, self.not_before) if self.not_before else bid.hunt_window_start
+        return start, max(start, bid.hunt_window_end)
+
+    def _connect(self, bid_ids) -> list:
+        """Groups bids into components, sorted by start."""
+        components = []
+        for bid_id in sorted(bid_ids, key=lambda bid_id: self._window(self.bids[bid_id])):
+            start, end = self._window(self.bids[bid_id])
+            if components and start < components[-1].end:
+                components[-1].end = max(components[-1].end, end)
+                components[-1].bid_ids.add(bid_id)
+            else:
+                components.append(_Component(start, end, {bid_id}))
+        return components
+
+    def _allocate(self, bid_ids) -> dict:
+        return allocate(
+            [self.bids[bid_id] for bid_id in bid_ids], self.claim_time_min, self.claim_time_max,
+            self.reserved, not_before=self.not_before
+        )
+
+    def _reallocate(self, bid_ids, removed=()) -> dict:
+        """Allocates the bids again; returns {bid_id: start or None} for those that moved."""
+        placed = self._allocate(bid_ids)
+        changes = {bid_id: None for bid_id in removed if self.schedule.pop(bid_id, None) is not None}
+        for bid_id in bid_ids:
+            start = placed.get(bid_id)
+            if self.schedule.get(bid_id) != start:
+                changes[bid_id] = start
+                if start is None:
+                    del self.schedule[bid_id]
+                else:
+                    self.schedule[bid_id] = start
+        return changes
+
+    def add(self, bid) -> dict:
+        """
+        Adds an open bid and reallocates its component.
+        Returns {bid_id: scheduled start or None} for the bids whose slot changed.
+        """
+        self.bids[bid.id] = bid
+        start, end = self._window(bid)
+        # Components overlapping the window are consecutive; merge them
+        first = bisect_right(self._components, start, key=lambda component: component.end)
+        last = first
+        while last < len(self._components) and self._components[last].start < end:
+            last += 1
+        merged = _Component(start, end, {bid.id})
+        for component in self._components[first:last]:
+            merged.start = min(merged.start, component.start)
+            merged.end = max(merged.end, component.end)
+            merged.bid_ids |= component.bid_ids
+        self._components[first:last] = [merged]
+        for bid_id in merged.bid_ids:
+            self._component_of[bid_id] = merged
+        return self._reallocate(merged.bid_ids)
+
+    def withdraw(self, bid_id: int) -> dict:
+        """
+        Removes a bid and reallocates what is left of its component.
+        Returns {bid_id: scheduled start or None} for the bids whose slot
+        changed, the withdrawn bid included if it had one.
+        """
+        component = self._component_of.pop(bid_id, None)
+        if component is None:
+            return {}
+        del self.bids[bid_id]
+        remaining = component.bid_ids - {bid_id}
+        # Without the bid the component may fall apart
+        position = self._components.index(component)
+        parts = self._connect(remaining)
+        self._components[position:position + 1] = parts
+        for part in parts:
+            for remaining_id in part.bid_ids:
+                self._component_of[remaining_id] = part
+        return self._reallocate(remaining, removed=[bid_id])
+
+    def write(self, connection, changes: dict) -> dict:
+        """
+        Writes changed slots in the caller's transaction: the bids'
+        scheduled_start and their Hunt rows. If the transaction fails, drop
+        this schedule and load it again.
+        Returns {bid_id: (scheduled_start, lock_at) or None} for the changed
+        bids, for the lock sweeper once the transaction is committed.
+        """
+        if not changes:
+            return {}
+        replaced = connection.scalars(delete(Hunt).where(Hunt.bid_id.in_(list(changes))).returning(Hunt.character_id)).all()
+        updates = [{"bid_id": bid_id, "start": start} for bid_id, start in changes.items() if bid_id in self.bids]
+        if updates:
+            connection.execute(update(Bid).where(Bid.id == bindparam('bid_id')).values(scheduled_start=bindparam('start')), updates)
+        insert_hunts(connection, [
+            {
+                "character_id": self.bids[bid_id].character_id,
+                "spawn_id": self.spawn_id,
+                "start_time": start,
+                "end_time": start + claim_duration(self.bids[bid_id].claim_time, self.claim_time_min, self.claim_time_max),
+                "points_paid": self.bids[bid_id].bid_points,
+                "bid_id": bid_id,
+            }
+            for bid_id, start in changes.items() if start is not None
+        ])
+        # Activity only moves forward on insert; forget the replaced hunts' start times
+        if replaced:
+            UserWorldActivity.refresh_characters(connection, set(replaced), self.spawn_id)
+        return {
+            bid_id: (start, start - self.locking_period) if start is not None else None
+            for bid_id, start in changes.items()
+        }
+
+
+def insert_hunts(connection, hunts: list):
+    """
+    Inserts Hunt rows in bulk. Bulk statements skip the ORM listeners, so the
+    hunts' activity is recorded here.
+    """
+    if not hunts:
+        return
+    connection.execute(insert(Hunt), hunts)
+    UserWorldActivity.upsert_from_select(
+        connection,
+        select(Character.user_id, Character.world_id, Hunt.spawn_id, func.max(Hunt.start_time))
+        .join(Character, Character.id == Hunt.character_id)
+        .where(Hunt.bid_id.in_([hunt["bid_id"] for hunt in hunts]), Character.user_id.isnot(None))
+        .group_by(Character.user_id, Character.world_id, Hunt.spawn_id)
+    )
+
+
+class ScheduleRegistry:
+    """
+    The schedules of the spawns seen so far, loaded from the database on first
+    use and again once they are SCHEDULE_MAX_AGE seconds old.
+    """
+
+    def __init__(self, max_age: float = SCHEDULE_MAX_AGE):
+        self.max_age = timedelta(seconds=max_age)
+        self._schedules = {}
+
+    def get(self, connection, spawn_id: int, now: Optional[datetime] = None) -> SpawnSchedule:
+        now = now or datetime.now(UTC).replace(tzinfo=None)
+        schedule = self._schedules.get(spawn_id)
+        if schedule is None or now - schedule.not_before > self.max_age:
+            schedule = self._schedules[spawn_id] = SpawnSchedule.load(connection, spawn_id, now)
+        return schedule
+
+    def invalidate(self, spawn_id: Optional[int] = None):
+        if spawn_id is None:
+            self._schedules.clear()
+        else:
+            self._schedules.pop(spawn_id, None)
+
+
+schedules = ScheduleRegistry()
+
+
+def resolve_spawn(connection, spawn_id: int, now: Optional[datetime] = None) -> dict:
+    """
+    Schedules all of the spawn's open bids and writes the result in the
+    caller's transaction: scheduled_start on every open bid (None for the
+    losers), and one Hunt per winner, replacing the hunts of a previous
+    resolution. Returns {"scheduled", "unplaced"} counts and the
+    "lock_deadlines" of SpawnSchedule.write.
+    """
+    schedule = SpawnSchedule.load(connection, spawn_id, now)
+    lock_deadlines = schedule.write(connection, {bid_id: schedule.schedule.get(bid_id) for bid_id in schedule.bids})
+    schedules.invalidate(spawn_id)
+    return {
+        "scheduled": len(schedule.schedule),
+        "unplaced": len(schedule.bids) - len(schedule.schedule),
+        "lock_deadlines": lock_deadlines,
+    }
+
+
+def open_spawns(connection, now: Optional[datetime] = None) -> list:
+    """Ids of the spawns with open bids (not locked, window not over)."""
+    now = now or datetime.now(UTC).replace(tzinfo=None)
+    return list(connection.scalars(
+        select(Bid.spawn_id).distinct()
+        .where(Bid.hunt_window_end > now, or_(Bid.is_locked == False, Bid.is_locked.is_(None)))
+    ))
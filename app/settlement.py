@@ -0,0 +1,117 @@
+"""
+Filename: settlement.py
+
+Settles points once hunts and bid windows are over, through the append-only
+points ledger (PointsLedgerEntry):
+
+- each hunt that ended is debited from its winner, for its points_paid;
+- each bid whose window closed without a slot is credited
+  SETTLEMENT_WAITING_CREDIT points, so waiting characters move up.
+
+The scheduler doesn't use Spawn.deprioratize_time yet, so no bid is passed
+over for being deprioritized. Waiting bids are the only ones credited.
+
+One transaction per spawn writes the ledger entries and adds them to the
+Points balances, after writing down the points the debited characters
+accrued (see Points). Entries are unique per hunt and per losing bid, so running
+it again settles only what is new. Balances can be rebuilt from the ledger:
+
+    python settlement.py            # settle every spawn
+    python settlement.py --rebuild  # recompute Points from the ledger
+"""
+
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, UTC
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import select, insert, literal, exists, union, Numeric, DateTime
+
+from database import SessionLocal
+from models import Bid, Hunt, Points, PointsLedgerEntry, LedgerReason
+
+SETTLEMENT_WAITING_CREDIT = Decimal(os.environ.get("SETTLEMENT_WAITING_CREDIT", "1")) # points per losing bid
+
+
+def settle_spawn(connection, spawn_id: int, now: Optional[datetime] = None) -> dict:
+    """
+    Settles the spawn's ended hunts and lost bids in the caller's transaction.
+    Returns {"debited", "credited"} entry counts.
+    """
+    now = now or datetime.now(UTC).replace(tzinfo=None)
+    ledger = PointsLedgerEntry
+    columns = ['character_id', 'spawn_id', 'amount', 'reason', 'hunt_id', 'created_at']
+    debits = connection.execute(
+        insert(ledger).from_select(columns, select(
+            Hunt.character_id, Hunt.spawn_id, -Hunt.points_paid, literal(LedgerReason.HUNT, ledger.reason.type), Hunt.id, literal(now, DateTime)
+        ).where(
+            Hunt.spawn_id == spawn_id, Hunt.end_time <= now, Hunt.points_paid > 0,
+            ~exists().where(ledger.reason == LedgerReason.HUNT, ledger.hunt_id == Hunt.id)
+        )).returning(ledger.character_id, ledger.amount)
+    ).all()
+
+    columns = ['character_id', 'spawn_id', 'amount', 'reason', 'bid_id', 'created_at']
+    credits = connection.execute(
+        insert(ledger).from_select(columns, select(
+            Bid.character_id, Bid.spawn_id, literal(SETTLEMENT_WAITING_CREDIT, Numeric), literal(LedgerReason.WAITING, ledger.reason.type), Bid.id, literal(now, DateTime)
+        ).where(
+            Bid.spawn_id == spawn_id, Bid.hunt_window_end <= now, Bid.scheduled_start.is_(None),
+            ~exists().where(ledger.reason == LedgerReason.WAITING, ledger.bid_id == Bid.id)
+        )).returning(ledger.character_id, ledger.amount)
+    ).all()
+
+    # Spending is when accrued points are written down
+    Points.materialize(connection, {(entry.character_id, spawn_id) for entry in debits}, now)
+    amounts = defaultdict(Decimal)
+    for entry in debits + credits:
+        amounts[(entry.character_id, spawn_id)] += Decimal(entry.amount)
+    Points.add(connection, dict(amounts), now)
+    return {"debited": len(debits), "credited": len(credits)}
+
+
+def unsettled_spawns(connection, now: Optional[datetime] = None) -> list:
+    """Ids of the spawns with ended hunts or lost bids not in the ledger yet."""
+    now = now or datetime.now(UTC).replace(tzinfo=None)
+    ledger = PointsLedgerEntry
+    return list(connection.scalars(union(
+        select(Hunt.spawn_id).where(
+            Hunt.end_time <= now, Hunt.points_paid > 0,
+            ~exists().where(ledger.reason == LedgerReason.HUNT, ledger.hunt_id == Hunt.id)
+        ),
+        select(Bid.spawn_id).where(
+            Bid.hunt_window_end <= now, Bid.scheduled_start.is_(None),
+            ~exists().where(ledger.reason == LedgerReason.WAITING, ledger.bid_id == Bid.id)
+        ),
+    )))
+
+
+def settle_all(db, now: Optional[datetime] = None) -> dict:
+    """Settles every spawn that needs it, committing once per spawn."""
+    now = now or datetime.now(UTC).replace(tzinfo=None)
+    totals = {"spawns": 0, "debited": 0, "credited": 0}
+    for spawn_id in unsettled_spawns(db.connection(), now):
+        counts = settle_spawn(db.connection(), spawn_id, now)
+        db.commit()
+        totals["spawns"] += 1
+        totals["debited"] += counts["debited"]
+        totals["credited"] += counts["credited"]
+    return totals
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        if "--rebuild" in sys.argv[1:]:
+            rows = Points.rebuild(db.connection())
+            db.commit()
+            print(f"Rebuilt {rows} points balances from the ledger.")
+        else:
+            print(f"Settled points: {settle_all(db)}")
+    except Exception as e:
+        db.rollback()
+        print(f"Error settling points: {e}")
+        raise
+    finally:
+        db.close()
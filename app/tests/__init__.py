@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The application modules import each other as top-level modules
+# (e.g. ``from models import User``), so make the app directory importable.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+# database.py builds its engine URL from the environment at import time;
+# tests never connect to it, but the URL must parse.
+os.environ.setdefault("DB_PORT", "5432")
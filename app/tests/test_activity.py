@@ -0,0 +1,155 @@
+import unittest
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import User, Character, World, Spawn, Bid, Hunt, UserWorldActivity, Base
+from scheduler import SpawnSchedule
+
+test_engine = create_engine("sqlite:///:memory:")
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+
+
+class TestActiveUsers(unittest.TestCase):
+    """
+    Tests for the active-user queries on World and Spawn.
+    """
+
+    def setUp(self):
+        Base.metadata.create_all(bind=test_engine)
+        self.db = TestingSessionLocal()
+
+        self.world = World(name='Antica')
+        self.other_world = World(name='Secura', inactive_threshold=timedelta(days=1))
+        self.active = User(username='active', password_hash='x')
+        self.stale = User(username='stale', password_hash='x')
+        self.db.add_all([self.world, self.other_world, self.active, self.stale])
+        self.db.flush()
+
+        self.spawn = Spawn(name='Dragon Lair', world=self.world)
+        self.other_spawn = Spawn(name='Hero Cave', world=self.world)
+        self.secura_spawn = Spawn(name='Dragon Lair', world=self.other_world)
+        self.knight = Character(name='Knight', level=100, vocation='Knight', user=self.active, world=self.world, validation_hash='a')
+        self.druid = Character(name='Druid', level=100, vocation='Druid', user=self.stale, world=self.world, validation_hash='b')
+        self.paladin = Character(name='Paladin', level=100, vocation='Paladin', user=self.active, world=self.other_world, validation_hash='c')
+        self.db.add_all([self.spawn, self.other_spawn, self.secura_spawn, self.knight, self.druid, self.paladin])
+        self.db.flush()
+
+        now = datetime.now(UTC).replace(tzinfo=None)
+        # Several bids and hunts per character, only some of them recent
+        for days_ago in (2, 45, 60):
+            self.db.add(Bid(character=self.knight, spawn=self.spawn, bid_points=10, claim_time=15,
+                            hunt_window_start=now - timedelta(days=days_ago),
+                            hunt_window_end=now - timedelta(days=days_ago) + timedelta(hours=2)))
+            self.db.add(Hunt(character=self.druid, spawn=self.spawn,
+                             start_time=now - timedelta(days=days_ago + 40),
+                             end_time=now - timedelta(days=days_ago + 40) + timedelta(hours=1)))
+        self.db.add(Hunt(character=self.druid, spawn=self.other_spawn,
+                         start_time=now - timedelta(days=3), end_time=now - timedelta(days=3) + timedelta(hours=1)))
+        self.db.add(Hunt(character=self.paladin, spawn=self.secura_spawn,
+                         start_time=now - timedelta(days=2), end_time=now - timedelta(days=2) + timedelta(hours=1)))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.rollback()
+        Base.metadata.drop_all(bind=test_engine)
+        self.db.close()
+
+    def test_world_active_users(self):
+        active_users = self.world.get_active_users(self.db)
+        self.assertCountEqual([user.username for user in active_users], ['active', 'stale'])
+        # Secura only counts activity within one day
+        self.assertEqual(self.other_world.get_active_users(self.db), [])
+
+    def test_spawn_active_users(self):
+        self.assertEqual([user.username for user in self.spawn.get_active_users(self.db)], ['active'])
+        self.assertEqual([user.username for user in self.other_spawn.get_active_users(self.db)], ['stale'])
+
+    def test_count_active_users(self):
+        counts = World.count_active_users(self.db, [self.world, self.other_world])
+        self.assertEqual(counts, {self.world.id: 2})
+        self.assertEqual(World.count_active_users(self.db, []), {})
+
+    def test_activity_recorded_on_insert(self):
+        rows = {
+            (row.user_id, row.world_id, row.spawn_id): row.last_activity_at
+            for row in self.db.query(UserWorldActivity).all()
+        }
+        self.assertEqual(set(rows), {
+            (self.active.id, self.world.id, self.spawn.id),
+            (self.stale.id, self.world.id, self.spawn.id),
+            (self.stale.id, self.world.id, self.other_spawn.id),
+            (self.active.id, self.other_world.id, self.secura_spawn.id),
+        })
+        # The most recent bid wins even though older ones were inserted after it
+        latest_bid = max(bid.hunt_window_start for bid in self.db.query(Bid).all())
+        self.assertEqual(rows[(self.active.id, self.world.id, self.spawn.id)], latest_bid)
+
+    def test_backfill_matches_incremental(self):
+        incremental = {
+            (row.user_id, row.world_id, row.spawn_id, row.last_activity_at)
+            for row in self.db.query(UserWorldActivity).all()
+        }
+        self.db.query(UserWorldActivity).delete()
+        self.db.commit()
+        self.assertEqual(self.world.get_active_users(self.db), [])
+
+        self.assertEqual(UserWorldActivity.backfill(self.db), 4)
+        self.db.commit()
+        backfilled = {
+            (row.user_id, row.world_id, row.spawn_id, row.last_activity_at)
+            for row in self.db.query(UserWorldActivity).all()
+        }
+        self.assertEqual(backfilled, incremental)
+
+    def activity(self, user):
+        self.db.expire_all()
+        return {
+            (row.world_id, row.spawn_id): row.last_activity_at
+            for row in self.db.query(UserWorldActivity).filter(UserWorldActivity.user_id == user.id)
+        }
+
+    def test_activity_follows_character_owner(self):
+        stale_activity = self.activity(self.stale)
+        self.druid.user = self.active
+        self.db.commit()
+        self.assertEqual(self.activity(self.stale), {})
+        self.assertEqual(self.activity(self.active)[(self.world.id, self.other_spawn.id)], stale_activity[(self.world.id, self.other_spawn.id)])
+        self.assertEqual([user.username for user in self.other_spawn.get_active_users(self.db)], ['active'])
+
+    def test_deleted_character_activity_is_dropped(self):
+        # As when a rival claim is removed or a character is disowned. Only
+        # characters without bids can go, but bulk deletes leave activity behind.
+        self.db.query(Bid).filter(Bid.character_id == self.knight.id).delete()
+        self.db.delete(self.knight)
+        self.db.commit()
+        self.assertEqual(set(self.activity(self.active)), {(self.other_world.id, self.secura_spawn.id)})
+        self.assertEqual([user.username for user in self.world.get_active_users(self.db)], ['stale'])
+
+    def test_replaced_hunts_are_forgotten(self):
+        now = datetime.now(UTC).replace(tzinfo=None)
+        bid = Bid(character=self.knight, spawn=self.other_spawn, bid_points=10, claim_time=60,
+                  hunt_window_start=now - timedelta(days=50), hunt_window_end=now + timedelta(days=10))
+        self.db.add(bid)
+        self.db.flush()
+        schedule = SpawnSchedule.load(self.db.connection(), self.other_spawn.id, now)
+        schedule.write(self.db.connection(), {bid.id: now + timedelta(days=5)})
+        self.db.commit()
+        self.assertEqual(self.activity(self.active)[(self.world.id, self.other_spawn.id)], now + timedelta(days=5))
+
+        # The bid loses its slot: its own window start is the last activity again
+        schedule.write(self.db.connection(), {bid.id: None})
+        self.db.commit()
+        self.assertEqual(self.activity(self.active)[(self.world.id, self.other_spawn.id)], now - timedelta(days=50))
+        self.assertEqual([user.username for user in self.other_spawn.get_active_users(self.db)], ['stale'])
+
+    def test_deleted_hunts_are_forgotten(self):
+        self.db.delete(self.db.query(Hunt).filter(Hunt.spawn_id == self.other_spawn.id).one())
+        self.db.commit()
+        self.assertNotIn((self.world.id, self.other_spawn.id), self.activity(self.stale))
+        self.assertEqual(self.other_spawn.get_active_users(self.db), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
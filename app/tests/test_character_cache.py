@@ -0,0 +1,157 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from character_cache import CharacterCache, InMemoryBackend, RedisBackend, normalize_name
+from routers import characters
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio.Redis for RedisBackend."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def scan_iter(self, match):
+        for key in list(self.data):
+            if key.startswith(match.rstrip('*')):
+                yield key
+
+
+class TestCharacterCache(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.clock = FakeClock()
+        self.calls = []
+        self.results = {}
+        self.release = None
+
+        async def fetch(name):
+            self.calls.append(name)
+            if self.release is not None:
+                await self.release.wait()
+            result = self.results.get(normalize_name(name))
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.cache = CharacterCache(fetch, InMemoryBackend(clock=self.clock), ttl=60, stale_ttl=600, negative_ttl=30, clock=self.clock)
+        self.results['hunter knight'] = {'level': 200}
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name("  Hunter   KNIGHT "), "hunter knight")
+
+    async def test_fresh_entries_are_served_from_cache(self):
+        self.assertEqual(await self.cache.get("Hunter Knight"), {'level': 200})
+        self.clock.now += 59
+        self.assertEqual(await self.cache.get("hunter  knight"), {'level': 200})
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_stale_entries_are_served_while_refreshing(self):
+        await self.cache.get("Hunter Knight")
+        self.results['hunter knight'] = {'level': 201}
+        self.clock.now += 61
+
+        self.assertEqual(await self.cache.get("Hunter Knight"), {'level': 200})
+        await asyncio.sleep(0) # Let the background refresh run
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(await self.cache.get("Hunter Knight"), {'level': 201})
+
+    async def test_expired_entries_are_refetched(self):
+        await self.cache.get("Hunter Knight")
+        self.clock.now += 661
+        self.results['hunter knight'] = {'level': 202}
+        self.assertEqual(await self.cache.get("Hunter Knight"), {'level': 202})
+
+    async def test_concurrent_lookups_share_one_fetch(self):
+        self.release = asyncio.Event()
+        lookups = [asyncio.create_task(self.cache.get(name)) for name in ("Hunter Knight", "hunter knight", "HUNTER KNIGHT")]
+        await asyncio.sleep(0)
+        self.release.set()
+
+        self.assertEqual(await asyncio.gather(*lookups), [{'level': 200}] * 3)
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_unknown_names_are_cached_briefly(self):
+        self.assertIsNone(await self.cache.get("Nobody"))
+        self.assertIsNone(await self.cache.get("Nobody"))
+        self.assertEqual(len(self.calls), 1)
+
+        self.clock.now += 31
+        self.results['nobody'] = {'level': 8}
+        self.assertEqual(await self.cache.get("Nobody"), {'level': 8})
+
+    async def test_errors_are_not_cached(self):
+        self.results['hunter knight'] = RuntimeError("TibiaData is down")
+        with self.assertRaises(RuntimeError):
+            await self.cache.get("Hunter Knight")
+
+        self.results['hunter knight'] = {'level': 200}
+        self.assertEqual(await self.cache.get("Hunter Knight"), {'level': 200})
+
+    async def test_failed_refresh_keeps_stale_entry(self):
+        await self.cache.get("Hunter Knight")
+        self.results['hunter knight'] = RuntimeError("TibiaData is down")
+        self.clock.now += 61
+
+        with self.assertLogs('character_cache', level='WARNING'):
+            self.assertEqual(await self.cache.get("Hunter Knight"), {'level': 200})
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+        self.assertEqual(await self.cache.get("Hunter Knight"), {'level': 200})
+
+    async def test_redis_backend(self):
+        redis = FakeRedis()
+        cache = CharacterCache(self.cache.fetch, RedisBackend(client=redis), ttl=60, clock=self.clock)
+        self.assertEqual(await cache.get("Hunter Knight"), {'level': 200})
+        self.assertIn("huntmaster:character:hunter knight", redis.data)
+
+        # A second process sharing the backend doesn't fetch again
+        other = CharacterCache(self.cache.fetch, RedisBackend(client=redis), ttl=60, clock=self.clock)
+        self.assertEqual(await other.get("hunter knight"), {'level': 200})
+        self.assertEqual(len(self.calls), 1)
+
+        await cache.clear()
+        self.assertEqual(redis.data, {})
+
+
+class TestGetCharacterData(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await characters.character_cache.clear()
+
+    async def asyncTearDown(self):
+        await characters.character_cache.clear()
+
+    async def test_not_found_is_reported_and_cached(self):
+        fetch = mock.AsyncMock(return_value=None)
+        with mock.patch.object(characters.character_cache, "fetch", fetch):
+            self.assertEqual(await characters.get_character_data("Nobody"), (None, "Character 'Nobody' not found."))
+            await characters.get_character_data("Nobody")
+        fetch.assert_awaited_once()
+
+    async def test_lookup_errors_are_reported(self):
+        fetch = mock.AsyncMock(side_effect=characters.CharacterLookupError("TibiaData is down"))
+        with mock.patch.object(characters.character_cache, "fetch", fetch):
+            self.assertEqual(await characters.get_character_data("Hunter Knight"), (None, "TibiaData is down"))
+
+
+if __name__ == '__main__':
+    unittest.main()
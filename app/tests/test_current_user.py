@@ -0,0 +1,79 @@
+import unittest
+
+from dependencies import CurrentUser, IdentityCache, current_user_cache
+from tests.test_routes import RouteTestCase, count_loaded_rows
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestIdentityCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = IdentityCache(maxsize=2, ttl=60, clock=self.clock)
+
+    def identity(self, user_id):
+        return CurrentUser(id=user_id, username=f'user{user_id}', is_admin=False)
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.set(self.identity(1))
+        self.clock.now = 59
+        self.assertEqual(self.cache.get(1), self.identity(1))
+        self.clock.now = 60
+        self.assertIsNone(self.cache.get(1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set(self.identity(1))
+        self.cache.set(self.identity(2))
+        self.cache.get(1)
+        self.cache.set(self.identity(3))
+        self.assertIsNotNone(self.cache.get(1))
+        self.assertIsNone(self.cache.get(2))
+        self.assertIsNotNone(self.cache.get(3))
+
+    def test_invalidate(self):
+        self.cache.set(self.identity(1))
+        self.cache.invalidate(1)
+        self.cache.invalidate(2) # Unknown ids are ignored
+        self.assertIsNone(self.cache.get(1))
+
+
+class TestGetCurrentUser(RouteTestCase):
+
+    def test_identity_is_served_from_cache(self):
+        self.client.get("/worlds")
+        identity = current_user_cache.get(self.user.id)
+        self.assertEqual(identity.username, 'hunter')
+        self.assertEqual(identity.world_names, ('Antica', 'Secura'))
+
+        with count_loaded_rows() as counts:
+            response = self.client.get("/dashboard")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('User', counts)
+
+    def test_sidebar_updates_after_disown(self):
+        self.assertIn('/worlds/Secura', self.client.get("/dashboard").text)
+
+        response = self.client.post("/character/disown", data={"character_name": "Hunter Druid"}, follow_redirects=False)
+        self.assertEqual(response.status_code, 303)
+
+        self.assertEqual(current_user_cache.get(self.user.id), None)
+        self.assertNotIn('/worlds/Secura', self.client.get("/dashboard").text)
+
+    def test_deleted_user_is_logged_out(self):
+        self.db.delete(self.user)
+        self.db.commit()
+
+        response = self.client.get("/dashboard", follow_redirects=False)
+        self.assertEqual(response.status_code, 303)
+        self.assertEqual(response.headers['location'], '/login')
+
+
+if __name__ == '__main__':
+    unittest.main()
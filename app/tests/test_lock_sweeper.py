@@ -0,0 +1,217 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, UTC
+from unittest import mock
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+import lock_sweeper as lock_sweeper_module
+from lock_sweeper import LockSweeper, resolve_spawn_and_track, change_schedule_and_track, resolve_open_spawns
+from models import Base, User, Character, World, Spawn, Bid, Hunt
+from scheduler import resolve_spawn, schedules
+from tests.test_routes import APP_DIR
+
+T0 = datetime(2026, 10, 19, 12, 0)
+
+
+def at(minutes):
+    return T0 + timedelta(minutes=minutes)
+
+
+class TestLockSweeper(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        path = os.path.join(tempfile.mkdtemp(), 'locks.db')
+        sync_engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=sync_engine)
+        self.db = sessionmaker(bind=sync_engine)()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        self.now = T0
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.sweeper = LockSweeper(self.session_factory, retry=0.01, clock=lambda: self.now)
+
+        world = World(name='Antica')
+        user = User(username='hunter', password_hash='x')
+        self.db.add_all([world, user])
+        self.db.flush()
+        # Locks 30 minutes before a hunt starts
+        self.spawn = Spawn(name='Dragon Lair', world=world, locking_period=timedelta(minutes=30))
+        self.other_spawn = Spawn(name='Hero Cave', world=world, locking_period=timedelta(minutes=10))
+        self.character = Character(name='Knight', level=100, vocation='Knight', user=user, world=world, validation_hash=None)
+        self.db.add_all([self.spawn, self.other_spawn, self.character])
+        self.db.commit()
+
+    async def asyncTearDown(self):
+        await self.sweeper.stop()
+        self.db.close()
+        await self.engine.dispose()
+
+    def bid(self, spawn, start, **kwargs):
+        bid = Bid(character=self.character, spawn=spawn, bid_points=10, claim_time=60,
+                  hunt_window_start=at(start), hunt_window_end=at(start + 120), scheduled_start=at(start), **kwargs)
+        self.db.add(bid)
+        self.db.commit()
+        return bid
+
+    def locked(self):
+        self.db.expire_all()
+        return sorted(bid.id for bid in self.db.query(Bid).filter(Bid.is_locked == True))
+
+    async def test_locks_due_bids_in_one_update(self):
+        soon = self.bid(self.spawn, 40) # locks at 10
+        later = self.bid(self.other_spawn, 40) # locks at 30
+        self.bid(self.spawn, 200)
+        await self.sweeper.load()
+        self.assertEqual(self.sweeper.next_deadline(), at(10))
+
+        updates = []
+        on_execute = lambda conn, cursor, statement, *args: updates.append(statement) if statement.startswith("UPDATE bids") else None
+        event.listen(self.engine.sync_engine, "before_cursor_execute", on_execute)
+        try:
+            self.assertTrue(await self.sweeper.sweep_once(now=at(30)))
+        finally:
+            event.remove(self.engine.sync_engine, "before_cursor_execute", on_execute)
+
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.locked(), [soon.id, later.id])
+        hunts = sorted((hunt.bid_id, hunt.start_time, hunt.end_time) for hunt in self.db.query(Hunt))
+        self.assertEqual(hunts, [(soon.id, at(40), at(100)), (later.id, at(40), at(100))])
+        self.assertEqual(self.sweeper.next_deadline(), at(170))
+
+    async def test_rescheduled_bids_lock_at_their_new_deadline(self):
+        bid = self.bid(self.spawn, 40)
+        await self.sweeper.load()
+        bid.scheduled_start = at(100)
+        self.db.commit()
+        self.sweeper.update({bid.id: (at(100), at(70))})
+
+        await self.sweeper.sweep_once(now=at(20))
+        self.assertEqual(self.locked(), [])
+        self.assertEqual(self.sweeper.next_deadline(), at(70))
+        await self.sweeper.sweep_once(now=at(70))
+        self.assertEqual(self.locked(), [bid.id])
+
+    async def test_bids_rescheduled_elsewhere_are_not_locked(self):
+        bid = self.bid(self.spawn, 40)
+        await self.sweeper.load()
+        bid.scheduled_start = at(100)
+        self.db.commit()
+        await self.sweeper.sweep_once(now=at(20))
+        self.assertEqual(self.locked(), [])
+
+    async def test_dropped_bids_are_forgotten(self):
+        bid = self.bid(self.spawn, 40)
+        await self.sweeper.load()
+        self.sweeper.update({bid.id: None})
+        self.assertIsNone(self.sweeper.next_deadline())
+        await self.sweeper.sweep_once(now=at(100))
+        self.assertEqual(self.locked(), [])
+
+    async def test_schedules_feed_the_heap(self):
+        self.db.add(Bid(character=self.character, spawn=self.spawn, bid_points=10, claim_time=60,
+                        hunt_window_start=at(60), hunt_window_end=at(180)))
+        self.db.commit()
+        await self.sweeper.load()
+        self.assertIsNone(self.sweeper.next_deadline())
+
+        result = resolve_spawn(self.db.connection(), self.spawn.id, now=T0)
+        self.db.commit()
+        self.sweeper.update(result["lock_deadlines"])
+        self.assertEqual(self.sweeper.next_deadline(), at(30))
+
+    async def test_tracked_resolutions_feed_the_sweeper(self):
+        self.db.add(Bid(character=self.character, spawn=self.spawn, bid_points=10, claim_time=60,
+                        hunt_window_start=at(60), hunt_window_end=at(180)))
+        self.db.commit()
+        await self.sweeper.load()
+        with mock.patch.object(lock_sweeper_module, "lock_sweeper", self.sweeper):
+            async with self.session_factory() as db:
+                result = await resolve_spawn_and_track(db, self.spawn.id, now=T0)
+        self.assertEqual(result["scheduled"], 1)
+        self.assertEqual(self.sweeper.next_deadline(), at(30))
+
+    async def test_scheduling_job_resolves_open_spawns(self):
+        first = Bid(character=self.character, spawn=self.spawn, bid_points=10, claim_time=60,
+                    hunt_window_start=at(60), hunt_window_end=at(180))
+        second = Bid(character=self.character, spawn=self.other_spawn, bid_points=10, claim_time=60,
+                     hunt_window_start=at(60), hunt_window_end=at(180))
+        over = Bid(character=self.character, spawn=self.spawn, bid_points=10, claim_time=60,
+                   hunt_window_start=at(-200), hunt_window_end=at(-80))
+        self.db.add_all([first, second, over])
+        self.db.commit()
+        await self.sweeper.load()
+        with mock.patch.object(lock_sweeper_module, "lock_sweeper", self.sweeper):
+            totals = await resolve_open_spawns(self.session_factory, now=T0)
+        self.assertEqual(totals, {"spawns": 2, "scheduled": 2, "unplaced": 0})
+        self.assertEqual(self.db.query(Hunt).count(), 2)
+        # Dragon Lair locks 30 minutes ahead, Hero Cave 10
+        self.assertEqual(self.sweeper.status()["pending"], 2)
+        self.assertEqual(self.sweeper.next_deadline(), at(30))
+
+    async def test_tracked_schedule_changes_feed_the_sweeper(self):
+        schedules.invalidate()
+        self.addCleanup(schedules.invalidate)
+        now = datetime.now(UTC).replace(tzinfo=None)
+        await self.sweeper.load()
+        with mock.patch.object(lock_sweeper_module, "lock_sweeper", self.sweeper):
+            async with self.session_factory() as db:
+                await db.run_sync(lambda session: schedules.get(session.connection(), self.spawn.id))
+                bid = Bid(character_id=self.character.id, spawn_id=self.spawn.id, bid_points=10, claim_time=60,
+                          hunt_window_start=now + timedelta(hours=1), hunt_window_end=now + timedelta(hours=3))
+                db.add(bid)
+                await db.flush()
+                lock_deadlines = await change_schedule_and_track(db, self.spawn.id, lambda schedule: schedule.add(bid))
+
+                with self.assertRaises(ZeroDivisionError):
+                    await change_schedule_and_track(db, self.spawn.id, lambda schedule: 1 / 0)
+        start = now + timedelta(hours=1)
+        self.assertEqual(lock_deadlines, {bid.id: (start, start - timedelta(minutes=30))})
+        self.assertEqual(self.sweeper.next_deadline(), start - timedelta(minutes=30))
+        # A failed write drops the kept schedule
+        self.assertNotIn(self.spawn.id, schedules._schedules)
+
+    async def test_background_task_wakes_for_new_deadlines(self):
+        self.sweeper.start()
+        for _ in range(100):
+            if self.sweeper.loaded:
+                break
+            await asyncio.sleep(0.01)
+        bid = self.bid(self.spawn, 20) # already due at T0
+        self.sweeper.update({bid.id: (at(20), at(-10))})
+        for _ in range(100):
+            if self.locked():
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.locked(), [bid.id])
+        self.assertEqual(self.sweeper.status()["pending"], 0)
+
+
+class TestLockSweeperStartup(unittest.IsolatedAsyncioTestCase):
+    """The app starts the sweeper only where LOCK_SWEEPER_ENABLED is set."""
+
+    async def startup(self, enabled):
+        cwd = os.getcwd()
+        os.chdir(APP_DIR) # main mounts the static directory
+        self.addCleanup(os.chdir, cwd)
+        import main
+        with mock.patch.object(main, "LOCK_SWEEPER_ENABLED", enabled), \
+                mock.patch.object(main.tibiadata, "start", mock.AsyncMock()), \
+                mock.patch.object(main.world_sync, "start"), \
+                mock.patch.object(main.spawns.slug_resolver, "load", mock.AsyncMock()), \
+                mock.patch.object(main.lock_sweeper, "start") as start:
+            await main.on_startup()
+        return start.called
+
+    async def test_disabled(self):
+        self.assertFalse(await self.startup(False))
+
+    async def test_enabled(self):
+        self.assertTrue(await self.startup(True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+
+from routers.spawns import slug_resolver
+from tests.test_routes import RouteTestCase, test_engine
+
+
+class TestNameIndexes(RouteTestCase):
+    """
+    The case-insensitive world/spawn/proposal lookups behind each URL are
+    answered from the lower(name) indexes rather than table scans.
+    The slug resolver is kept empty, so every lookup reaches the database.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(slug_resolver, "load", mock.AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def query_plans(self, statements, table):
+        """EXPLAIN QUERY PLAN for each captured lookup by lower(<table>.name)."""
+        plans = []
+        with test_engine.connect() as connection:
+            for statement, parameters in statements:
+                if f"lower({table}.name)" in statement and statement.lstrip().upper().startswith("SELECT"):
+                    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                    plans.append(" | ".join(row[-1] for row in rows))
+        self.assertTrue(plans, f"No lookup by lower({table}.name) was executed")
+        return plans
+
+    def assert_uses_index(self, statements, table, index):
+        for plan in self.query_plans(statements, table):
+            self.assertIn(f"USING INDEX {index}", plan)
+            self.assertNotIn(f"SCAN {table}", plan)
+
+    def test_world_page(self):
+        statements = self.get_statements("/worlds/antica", with_parameters=True)
+        self.assert_uses_index(statements, "worlds", "ix_worlds_lower_name")
+
+    def test_spawn_page(self):
+        statements = self.get_statements("/worlds/antica/spawns/spawn 0", with_parameters=True)
+        self.assert_uses_index(statements, "worlds", "ix_worlds_lower_name")
+        self.assert_uses_index(statements, "spawns", "ix_spawns_world_id_lower_name")
+
+    def test_favourite_joins_world_and_spawn(self):
+        with self.capture_statements(with_parameters=True) as statements:
+            self.client.post("/worlds/antica/spawns/spawn 1/favourite", data={"action": "add"})
+        self.assert_uses_index(statements, "worlds", "ix_worlds_lower_name")
+        self.assert_uses_index(statements, "spawns", "ix_spawns_world_id_lower_name")
+
+    def test_propose_spawn_checks_proposal_names(self):
+        form = {
+            "name": "new spawn", "description": "", "min_level": 1, "max_level": 100,
+            "locking_time_mins": 15, "claim_min_mins": 15, "claim_max_mins": 60, "deprioratize_time_mins": 0
+        }
+        with self.capture_statements(with_parameters=True) as statements:
+            response = self.client.post("/worlds/antica/propose", data=form, follow_redirects=False)
+        # The fixture's pending proposal is called "New Spawn"
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("has already been proposed", response.text)
+        self.assert_uses_index(statements, "spawn_proposals", "ix_spawn_proposals_lower_name")
+
+
+if __name__ == '__main__':
+    unittest.main()
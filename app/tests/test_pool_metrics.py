@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from dependencies import current_user_cache
+from pool_metrics import PoolMetrics, TimedQueuePool, pool_metrics
+from tests.test_routes import RouteTestCase
+
+
+class TestPoolMetrics(unittest.TestCase):
+
+    def setUp(self):
+        # Checkout waits are recorded on the shared pool_metrics, so give each test its own pool name
+        self.name = self.id()
+        self.engine = create_engine(
+            f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'pool.db')}",
+            poolclass=TimedQueuePool,
+            pool_logging_name=self.name,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05
+        )
+        self.metrics = PoolMetrics()
+        self.metrics.attach(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_counts_checkouts_and_live_usage(self):
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            stats = self.metrics.snapshot()[self.name]
+            self.assertEqual(stats["checked_out"], 1)
+            self.assertEqual(stats["overflow"], 0)
+
+        with self.engine.connect():
+            pass
+        stats = self.metrics.snapshot()[self.name]
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["connects"], 1)
+        self.assertEqual(stats["checkouts"], 2)
+
+    def test_records_wait_time_and_timeouts(self):
+        with self.engine.connect():
+            with self.assertRaises(PoolTimeoutError):
+                self.engine.connect()
+
+        stats = pool_metrics.stats_for(self.name).as_dict()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["wait_max_ms"], 50)
+
+
+class TestPoolStatsEndpoint(RouteTestCase):
+
+    def test_admins_only(self):
+        self.assertEqual(self.client.get("/internal/pool-stats").status_code, 403)
+
+        self.user.is_admin = True
+        self.db.commit()
+        current_user_cache.clear()
+        response = self.client.get("/internal/pool-stats")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {"sync", "async"})
+        self.assertIn("wait_max_ms", response.json()["async"])
+
+
+if __name__ == '__main__':
+    unittest.main()
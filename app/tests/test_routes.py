@@ -0,0 +1,505 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, UTC
+from unittest import mock
+from urllib.parse import unquote
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
+
+from database import get_async_db
+from dependencies import current_user_cache
+from routers import characters
+from routers.spawns import slug_resolver, world_stats_cache, spawn_active_users_cache, spawn_page_proposals_select
+from models import (
+    Base, User, Character, World, Spawn, Bid, Hunt, SpawnProposal, SpawnChangeProposal,
+    Vote, VoteType, ProposalStatus
+)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A file database, shared by the sync engine that populates it and the async
+# engine the routes use. The test client runs each request on a fresh event
+# loop, so the async engine doesn't pool connections.
+TEST_DB_PATH = os.path.join(tempfile.mkdtemp(), 'huntmaster_test.db')
+test_engine = create_engine(f"sqlite:///{TEST_DB_PATH}")
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+test_async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(test_async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_test_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+@contextmanager
+def count_loaded_rows():
+    """Counts the ORM objects loaded from the database, per model name."""
+    counts = Counter()
+
+    def on_loaded(session, instance):
+        counts[type(instance).__name__] += 1
+
+    event.listen(Session, 'loaded_as_persistent', on_loaded)
+    try:
+        yield counts
+    finally:
+        event.remove(Session, 'loaded_as_persistent', on_loaded)
+
+
+class RouteTestCase(unittest.TestCase):
+    """
+    Base class for tests that drive the FastAPI app against an in-memory
+    SQLite database. Creates a logged-in client for the user 'hunter'.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Templates and static files are resolved relative to the app directory
+        cls._cwd = os.getcwd()
+        os.chdir(APP_DIR)
+        from main import app
+        cls.app = app
+        cls.app.dependency_overrides[get_async_db] = get_test_async_db
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.dependency_overrides.pop(get_async_db, None)
+        os.chdir(cls._cwd)
+
+    def setUp(self):
+        current_user_cache.clear()
+        slug_resolver.invalidate()
+        world_stats_cache.clear()
+        spawn_active_users_cache.clear()
+        Base.metadata.create_all(bind=test_engine)
+        self.db = TestingSessionLocal()
+        self.populate()
+        self.db.commit()
+        self.client = TestClient(self.app)
+        response = self.client.post("/login", data={"username": "hunter", "password": "password"}, follow_redirects=False)
+        self.assertEqual(response.status_code, 303)
+
+    def tearDown(self):
+        self.db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+    @contextmanager
+    def capture_statements(self, with_parameters=False):
+        """
+        Collects the SQL statements the routes send to the database, as
+        (statement, parameters) pairs if with_parameters is set.
+        """
+        statements = []
+
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters) if with_parameters else statement)
+
+        event.listen(test_async_engine.sync_engine, 'before_cursor_execute', on_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(test_async_engine.sync_engine, 'before_cursor_execute', on_execute)
+
+    def get_statements(self, url, with_parameters=False):
+        """GETs url, expecting a 200, and returns the statements it ran."""
+        with self.capture_statements(with_parameters) as statements:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return statements
+
+    def populate(self):
+        """
+        A world with a crowd of other players, spawns with a bid and hunt
+        history, a pending spawn proposal and spawn change proposals with votes.
+        """
+        now = datetime.now(UTC).replace(tzinfo=None)
+        self.user = User(username='hunter')
+        self.user.set_password('password')
+        self.world = World(name='Antica', location='Europe')
+        self.other_world = World(name='Secura', location='Europe')
+        self.db.add_all([self.user, self.world, self.other_world])
+        self.db.flush()
+
+        self.characters = [
+            Character(name='Hunter Knight', level=200, vocation='Knight', user=self.user, world=self.world, validation_hash=None),
+            Character(name='Hunter Druid', level=150, vocation='Druid', user=self.user, world=self.other_world, validation_hash=None),
+        ]
+        others = [User(username=f'player{i}', password_hash='x') for i in range(20)]
+        self.db.add_all(self.characters + others)
+        self.db.flush()
+        crowd = [
+            Character(name=f'Player {i}', level=100, vocation='Paladin', user=other, world=self.world, validation_hash=None)
+            for i, other in enumerate(others)
+        ]
+        self.spawns = [Spawn(name=f'Spawn {i}', world=self.world) for i in range(5)]
+        self.db.add_all(crowd + self.spawns)
+        self.db.flush()
+        self.spawn = self.spawns[0]
+
+        for spawn in self.spawns:
+            for hours_ago, character in enumerate(crowd):
+                start = now - timedelta(hours=hours_ago + 1)
+                self.db.add(Bid(character=character, spawn=spawn, bid_points=10, claim_time=15,
+                                hunt_window_start=start, hunt_window_end=start + timedelta(hours=2)))
+                self.db.add(Hunt(character=character, spawn=spawn, start_time=start, end_time=start + timedelta(minutes=30)))
+
+        proposal = SpawnProposal(name='New Spawn', world=self.world, status=ProposalStatus.PENDING)
+        proposal.sponsors.extend(others[:3])
+        self.db.add(proposal)
+
+        self.change_proposals = [
+            SpawnChangeProposal(name='Change for Spawn 0', spawn=self.spawn, status=ProposalStatus.PENDING),
+            SpawnChangeProposal(name='Change for Spawn 0', spawn=self.spawn, status=ProposalStatus.APPROVED,
+                                approved_at=datetime.now(UTC) - timedelta(days=1)),
+        ]
+        self.db.add_all(self.change_proposals)
+        self.db.flush()
+        for i, other in enumerate(others):
+            for change_proposal in self.change_proposals:
+                vote_type = VoteType.UPVOTE if i % 3 else VoteType.DOWNVOTE
+                self.db.add(Vote(user_id=other.id, proposal_id=change_proposal.id, vote_type=vote_type))
+
+
+class TestRouteLoading(RouteTestCase):
+    """
+    Pins the number of ORM rows each page loads, so relationships don't
+    silently start dragging in whole worlds, spawn histories or vote lists.
+    """
+
+    def get_loaded(self, url):
+        with count_loaded_rows() as counts:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.text)
+        return dict(counts)
+
+    def test_world_list_loads(self):
+        self.assertEqual(self.get_loaded("/worlds"), {'World': 2})
+
+    def test_world_page_loads(self):
+        self.assertEqual(self.get_loaded("/worlds/antica"), {
+            'World': 1, 'Spawn': 5, 'SpawnProposal': 1, 'User': 3
+        })
+
+    def test_spawn_page_loads(self):
+        # The spawn's active users are counted, not loaded, and vote tallies
+        # are counter columns, so no users or votes are loaded
+        self.assertEqual(self.get_loaded("/worlds/antica/spawns/spawn 0"), {
+            'World': 1, 'Spawn': 1, 'SpawnChangeProposal': 2
+        })
+
+    def test_character_list_loads(self):
+        self.assertEqual(self.get_loaded("/characters"), {'Character': 2, 'World': 2})
+
+    def test_dashboard_loads(self):
+        self.assertEqual(self.get_loaded("/dashboard"), {})
+
+
+
+class TestRouteWrites(RouteTestCase):
+    """
+    Drives the form and JSON endpoints, so every relationship they touch is
+    loaded up front rather than lazily on the async session.
+    """
+
+    def test_sponsor_proposal(self):
+        proposal_id = self.db.query(SpawnProposal.id).scalar()
+        response = self.client.post("/worlds/antica/sponsor", data={"proposal_id": proposal_id})
+        self.assertEqual(response.status_code, 200, response.text)
+        # 20 active users only need 2 sponsors, so the fourth approves it
+        self.assertTrue(response.json()["spawn_created"])
+        self.assertEqual(self.db.query(Spawn).filter(Spawn.name == "New Spawn").count(), 1)
+
+    def test_vote_on_change_proposal(self):
+        proposal_id = self.change_proposals[0].id
+        response = self.client.post("/worlds/antica/spawns/spawn 0/vote", data={"proposal_id": proposal_id, "vote_type": "upvote"})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["your_vote"], "upvote")
+        self.assertEqual(response.json()["total_votes"], 21)
+
+    def test_toggle_favourite(self):
+        url = "/worlds/antica/spawns/spawn 1/favourite"
+        self.assertTrue(self.client.post(url, data={"action": "add"}).json()["is_favourited"])
+        self.assertIn("Spawn 1", self.client.get("/dashboard").text)
+        self.assertFalse(self.client.post(url, data={"action": "remove"}).json()["is_favourited"])
+
+    def test_propose_spawn(self):
+        response = self.client.post("/worlds/antica/propose", data={
+            "name": "Brand New Spawn", "description": "", "min_level": 1, "max_level": 100,
+            "locking_time_mins": 15, "claim_min_mins": 15, "claim_max_mins": 60, "deprioratize_time_mins": 0
+        }, follow_redirects=False)
+        self.assertEqual(response.status_code, 303, response.text)
+        self.assertEqual(self.db.query(SpawnProposal).filter(SpawnProposal.name == "Brand New Spawn").count(), 1)
+
+
+
+class TestVoteTallies(RouteTestCase):
+    """
+    SpawnChangeProposal.upvotes/downvotes follow the change_votes rows, and
+    the vote hybrids read them in Python and in SQL.
+    """
+
+    def tally(self, proposal):
+        self.db.expire(proposal)
+        return proposal.votes_for, proposal.votes_against, proposal.total_votes
+
+    def test_fixture_votes_are_counted(self):
+        for proposal in self.change_proposals:
+            self.assertEqual(self.tally(proposal), (13, 7, 20))
+
+    def test_changed_and_deleted_votes(self):
+        proposal = self.change_proposals[0]
+        vote = self.db.query(Vote).filter(Vote.proposal_id == proposal.id, Vote.vote_type == VoteType.DOWNVOTE).first()
+        vote.vote_type = VoteType.UPVOTE
+        self.db.commit()
+        self.assertEqual(self.tally(proposal), (14, 6, 20))
+
+        self.db.delete(vote)
+        self.db.commit()
+        self.assertEqual(self.tally(proposal), (13, 6, 19))
+
+    def test_hybrids_in_sql(self):
+        self.change_proposals[1].upvotes = 2
+        self.db.commit()
+        rows = self.db.query(SpawnChangeProposal.id).filter(
+            SpawnChangeProposal.votes_for > SpawnChangeProposal.votes_against
+        ).order_by(SpawnChangeProposal.total_votes.desc()).all()
+        self.assertEqual(rows, [(self.change_proposals[0].id,)])
+
+    def test_vote_route_updates_counters(self):
+        proposal_id = self.change_proposals[0].id
+        response = self.client.post("/worlds/antica/spawns/spawn 0/vote", data={"proposal_id": proposal_id, "vote_type": "downvote"})
+        self.assertEqual(response.json()["current_votes_against"], 8)
+        self.assertEqual(self.tally(self.change_proposals[0]), (13, 8, 21))
+
+
+class TestProposalEngagement(RouteTestCase):
+    """The spawn page counts the spawn's active users once for all its proposal cards."""
+
+    def test_count_matches_get_active_users(self):
+        self.assertEqual(Spawn.count_active_users(self.db, [self.spawn]), {self.spawn.id: len(self.spawn.get_active_users(self.db))})
+        self.assertEqual(self.change_proposals[0].get_engagement(self.db), 1) # 20 votes, 20 active users
+
+    def test_spawn_page_counts_once(self):
+        with self.capture_statements() as statements:
+            response = self.client.get("/worlds/antica/spawns/spawn 0")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([statement for statement in statements if 'user_world_activity' in statement]), 1)
+
+
+class TestSpawnPage(RouteTestCase):
+    """
+    The spawn page is assembled from the spawn (with its world) plus one
+    query for every listed proposal, the user's votes on them and the
+    spawn's active-user count.
+    """
+
+    def test_round_trips(self):
+        self.get_statements("/worlds/antica/spawns/spawn 0") # warm the slug and identity caches
+        self.assertEqual(len(self.get_statements("/worlds/antica/spawns/spawn 0")), 2)
+
+    def test_listed_proposals(self):
+        now = datetime.now(UTC)
+        temporary = SpawnChangeProposal(name='Event week', spawn=self.spawn, status=ProposalStatus.APPROVED,
+                                        approved_at=now - timedelta(days=10),
+                                        start_time=now - timedelta(days=1), end_time=now + timedelta(days=1))
+        expired = SpawnChangeProposal(name='Last event', spawn=self.spawn, status=ProposalStatus.APPROVED,
+                                      approved_at=now - timedelta(days=2),
+                                      start_time=now - timedelta(days=5), end_time=now - timedelta(days=3))
+        rejected = SpawnChangeProposal(name='Rejected', spawn=self.spawn, status=ProposalStatus.REJECTED,
+                                       approved_at=now - timedelta(days=3))
+        pending = [
+            SpawnChangeProposal(name=f'Pending {i}', spawn=self.spawn, status=ProposalStatus.PENDING,
+                                created_at=now - timedelta(hours=i))
+            for i in range(1, 5)
+        ]
+        other_spawn = SpawnChangeProposal(name='Elsewhere', spawn=self.spawns[1], status=ProposalStatus.PENDING)
+        self.db.add_all([temporary, expired, rejected, other_spawn] + pending)
+        self.db.flush()
+        self.db.add(Vote(user_id=self.user.id, proposal_id=pending[3].id, vote_type=VoteType.DOWNVOTE))
+        self.db.commit()
+
+        rows = self.db.execute(spawn_page_proposals_select(self.spawn, self.user.id, now)).all()
+        listed = [(category, proposal.name, vote_type) for proposal, category, vote_type, _ in rows]
+        # The fixture's pending proposal is the newest, so it isn't among the 3 oldest
+        approved = self.change_proposals[1]
+        self.assertEqual(listed, [
+            ('permanent', approved.name, None),
+            ('temporary', 'Event week', None),
+            ('recent', approved.name, None),
+            ('recent', 'Last event', None),
+            ('recent', 'Rejected', None),
+            ('pending', 'Pending 4', VoteType.DOWNVOTE),
+            ('pending', 'Pending 3', None),
+            ('pending', 'Pending 2', None),
+        ])
+        self.assertEqual({active_users for *_, active_users in rows}, {20})
+
+
+class TestSlugResolver(RouteTestCase):
+    """
+    World and spawn names in URLs resolve from the slug cache once it is
+    warm, and names added since it loaded still resolve.
+    """
+
+    def test_warm_cache_skips_name_lookups(self):
+        self.get_statements("/worlds/antica/spawns/spawn 0")
+        statements = self.get_statements("/worlds/ANTICA/spawns/Spawn 0")
+        self.assertFalse([statement for statement in statements if "lower(" in statement])
+
+    def test_unknown_names_are_not_found(self):
+        self.assertEqual(self.client.get("/worlds/nowhere").status_code, 404)
+        self.assertEqual(self.client.get("/worlds/antica/spawns/nothing").status_code, 404)
+
+    def test_approved_spawn_resolves(self):
+        self.client.get("/worlds/antica")
+        proposal_id = self.db.query(SpawnProposal.id).scalar()
+        self.assertTrue(self.client.post("/worlds/antica/sponsor", data={"proposal_id": proposal_id}).json()["spawn_created"])
+        self.assertEqual(self.client.get("/worlds/antica/spawns/new spawn").status_code, 200)
+
+    def test_names_added_elsewhere_resolve(self):
+        self.client.get("/worlds/antica")
+        # e.g. by another worker, which can't invalidate this process' cache
+        self.db.add(Spawn(name='Late Spawn', world=self.world))
+        self.db.commit()
+        self.assertEqual(self.client.get("/worlds/antica/spawns/late spawn").status_code, 200)
+
+
+def stats_queries(statements):
+    """The world statistics aggregates among the captured statements."""
+    return [statement for statement in statements if 'AS pending_proposals_count' in statement]
+
+
+class TestWorldStats(RouteTestCase):
+    """
+    The world page's statistics come from one aggregate query, cached per
+    world for a short TTL.
+    """
+
+    def test_stats_match_the_data(self):
+        self.assertEqual(len(stats_queries(self.get_statements("/worlds/antica"))), 1)
+        stats = world_stats_cache._entries[self.world.id][1]
+        self.assertEqual(stats, {
+            "spawn_count": 5,
+            "character_count": self.db.query(Character).filter(Character.world_id == self.world.id).count(),
+            "user_count": 21,
+            "active_users_count": World.count_active_users(self.db, [self.world])[self.world.id],
+            "pending_proposals_count": 1,
+        })
+
+    def test_stats_are_cached(self):
+        self.get_statements("/worlds/antica")
+        self.assertEqual(stats_queries(self.get_statements("/worlds/antica")), [])
+
+        with mock.patch.object(world_stats_cache, "ttl", 0):
+            world_stats_cache.clear()
+            self.get_statements("/worlds/antica")
+            self.assertEqual(len(stats_queries(self.get_statements("/worlds/antica"))), 1)
+
+    def test_new_proposal_invalidates_stats(self):
+        self.get_statements("/worlds/antica")
+        self.client.post("/worlds/antica/propose", data={
+            "name": "Another Spawn", "description": "", "min_level": 1, "max_level": 100,
+            "locking_time_mins": 15, "claim_min_mins": 15, "claim_max_mins": 60, "deprioratize_time_mins": 0
+        }, follow_redirects=False)
+        self.assertEqual(len(stats_queries(self.get_statements("/worlds/antica"))), 1)
+        self.assertEqual(world_stats_cache._entries[self.world.id][1]["pending_proposals_count"], 2)
+
+
+class TestVerifyCharacter(RouteTestCase):
+    """
+    Verifying a character looks its alts up concurrently and claims them all
+    in one transaction, reporting the ones that couldn't be fetched.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # 'Claimed Knight' is verified by another player; the insert hook leaves it pending
+        rival = self.db.query(User).filter(User.username == 'player0').one()
+        self.db.add(Character(name='Claimed Knight', level=100, vocation='Knight', user=rival, world=self.world))
+        self.db.flush()
+        self.db.query(Character).filter(Character.name == 'Claimed Knight').update({Character.validation_hash: None})
+        self.db.commit()
+        asyncio.run(characters.character_cache.clear())
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fetched = []
+
+    def tearDown(self):
+        asyncio.run(characters.character_cache.clear())
+        super().tearDown()
+
+    def character(self, name, world='Antica', other_characters=()):
+        return {
+            'character': {'name': name, 'level': 100, 'vocation': 'Sorcerer', 'world': world},
+            'other_characters': [{'name': other, 'world': other_world} for other, other_world in other_characters]
+        }
+
+    async def fetch(self, name):
+        self.fetched.append(name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if name == 'Hunter Ghost':
+            return None
+        if name == 'Hunter Broken':
+            raise characters.CharacterLookupError("TibiaData is down")
+        alts = [('Hunter Mage', 'Antica'), ('Hunter Ranger', 'Antica'),
+                ('Hunter Sorcerer', 'Antica'), ('Hunter Ghost', 'Antica'), ('Hunter Broken', 'Antica'),
+                ('Hunter Druid', 'Secura')]
+        return self.character(name, other_characters=alts if name == 'Claimed Knight' else ())
+
+    def verify(self, character_name):
+        commits = []
+        on_commit = lambda session: commits.append(session)
+        event.listen(Session, 'after_commit', on_commit)
+        try:
+            with mock.patch.object(characters.character_cache, 'fetch', self.fetch), \
+                    mock.patch.object(characters, 'ALT_FETCH_CONCURRENCY', 2):
+                response = self.client.post("/character/verify", data={"character_name": character_name}, follow_redirects=False)
+        finally:
+            event.remove(Session, 'after_commit', on_commit)
+        self.assertEqual(response.status_code, 303, response.text)
+        return response, commits
+
+    def owner(self, name):
+        self.db.expire_all()
+        return self.db.query(User.username).join(Character).filter(Character.name == name).scalar()
+
+    def test_alts_are_fetched_concurrently_and_claimed_together(self):
+        response, commits = self.verify('Claimed Knight')
+
+        self.assertEqual(len(commits), 1)
+        # Alts on other worlds aren't looked up
+        self.assertEqual(sorted(self.fetched), ['Claimed Knight', 'Hunter Broken', 'Hunter Ghost', 'Hunter Mage', 'Hunter Ranger', 'Hunter Sorcerer'])
+        self.assertEqual(self.max_in_flight, 2)
+        for name in ('Claimed Knight', 'Hunter Mage', 'Hunter Ranger', 'Hunter Sorcerer'):
+            self.assertEqual(self.owner(name), 'hunter')
+
+    def test_failed_alts_are_reported_without_aborting(self):
+        response, _ = self.verify('Claimed Knight')
+
+        location = unquote(response.headers['location'])
+        self.assertTrue(location.startswith('/characters?error=Could not verify'), location)
+        self.assertIn("Hunter Ghost (Character 'Hunter Ghost' not found.)", location)
+        self.assertIn('Hunter Broken (TibiaData is down)', location)
+        self.assertIsNone(self.owner('Hunter Ghost'))
+        self.assertEqual(self.owner('Hunter Sorcerer'), 'hunter')
+
+    def test_rival_claim_is_removed(self):
+        self.verify('Claimed Knight')
+        self.db.expire_all()
+        self.assertEqual(self.db.query(Character).filter(Character.name == 'Claimed Knight').count(), 1)
+        self.assertEqual(self.owner('Claimed Knight'), 'hunter')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,317 @@
+import random
+import unittest
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import User, Character, World, Spawn, Bid, Hunt, UserWorldActivity, Base
+import scheduler
+from scheduler import FreeSlots, SpawnSchedule, allocate, claim_duration, resolve_spawn, schedules
+from tests.test_routes import RouteTestCase
+
+test_engine = create_engine("sqlite:///:memory:")
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+
+T0 = datetime(2026, 10, 19, 12, 0)
+
+
+def at(minutes):
+    return T0 + timedelta(minutes=minutes)
+
+
+def make_bid(id, points, window_start, window_end, claim_time):
+    return SimpleNamespace(id=id, bid_points=points, hunt_window_start=at(window_start), hunt_window_end=at(window_end), claim_time=claim_time)
+
+
+def brute_force_allocate(bids, claim_time_min, claim_time_max, reserved=()):
+    """allocate(), minute by minute over a list of busy intervals."""
+    busy = list(reserved)
+    schedule = {}
+    for bid in sorted(bids, key=lambda bid: (-bid.bid_points, bid.id)):
+        length = claim_duration(bid.claim_time, claim_time_min, claim_time_max)
+        start = bid.hunt_window_start
+        while start + length <= bid.hunt_window_end:
+            if all(start + length <= busy_start or start >= busy_end for busy_start, busy_end in busy):
+                busy.append((start, start + length))
+                schedule[bid.id] = start
+                break
+            start += timedelta(minutes=1)
+    return schedule
+
+
+class TestFreeSlots(unittest.TestCase):
+
+    def test_take_splits_and_merges_gaps(self):
+        slots = FreeSlots(at(0), at(100))
+        slots.take(at(10), at(20))
+        slots.take(at(50), at(60))
+        slots.take(at(55), at(70)) # overlaps a busy interval
+        slots.take(at(90), at(200)) # runs past the end
+        self.assertEqual(list(slots), [(at(0), at(10)), (at(20), at(50)), (at(70), at(90))])
+
+    def test_find(self):
+        slots = FreeSlots(at(0), at(100))
+        slots.take(at(10), at(20))
+        self.assertEqual(slots.find(at(5), at(100), timedelta(minutes=5)), at(5))
+        self.assertEqual(slots.find(at(5), at(100), timedelta(minutes=6)), at(20))
+        self.assertIsNone(slots.find(at(5), at(25), timedelta(minutes=6)))
+        self.assertIsNone(slots.find(at(0), at(200), timedelta(minutes=150)))
+
+    def test_matches_a_list_of_gaps(self):
+        rng = random.Random(7)
+        slots = FreeSlots(at(0), at(10000))
+        free = [True] * 10000 # one flag per minute
+        for _ in range(300):
+            start = rng.randrange(10000)
+            length = rng.randrange(1, 60)
+            slots.take(at(start), at(start + length))
+            for minute in range(start, min(start + length, 10000)):
+                free[minute] = False
+        expected, minute = [], 0
+        while minute < 10000:
+            if free[minute]:
+                end = minute
+                while end < 10000 and free[end]:
+                    end += 1
+                expected.append((at(minute), at(end)))
+                minute = end
+            minute += 1
+        self.assertEqual(list(slots), expected)
+
+
+class TestAllocate(unittest.TestCase):
+
+    def test_highest_bid_gets_its_earliest_slot(self):
+        bids = [
+            make_bid(1, 10, 0, 120, 60),
+            make_bid(2, 50, 0, 120, 60),
+            make_bid(3, 30, 0, 120, 60),
+        ]
+        schedule = allocate(bids, timedelta(minutes=15), timedelta(hours=3))
+        self.assertEqual(schedule, {2: at(0), 3: at(60)})
+
+    def test_ties_go_to_the_earlier_bid(self):
+        bids = [make_bid(2, 10, 0, 60, 60), make_bid(1, 10, 0, 60, 60)]
+        self.assertEqual(allocate(bids, timedelta(minutes=15), timedelta(hours=3)), {1: at(0)})
+
+    def test_claims_are_clamped_to_the_spawn_limits(self):
+        bids = [make_bid(1, 20, 0, 300, 5), make_bid(2, 10, 0, 300, 500)]
+        schedule = allocate(bids, timedelta(minutes=15), timedelta(minutes=90))
+        self.assertEqual(schedule, {1: at(0), 2: at(15)})
+
+    def test_reserved_time_and_not_before(self):
+        bids = [make_bid(1, 10, 0, 200, 30)]
+        self.assertEqual(allocate(bids, timedelta(minutes=15), timedelta(hours=3), reserved=[(at(0), at(40))]), {1: at(40)})
+        self.assertEqual(allocate(bids, timedelta(minutes=15), timedelta(hours=3), not_before=at(100)), {1: at(100)})
+
+    def test_matches_brute_force(self):
+        rng = random.Random(11)
+        for _ in range(20):
+            bids = []
+            for id in range(1, 80):
+                start = rng.randrange(0, 2000)
+                bids.append(make_bid(id, rng.randrange(1, 50), start, start + rng.randrange(15, 400), rng.randrange(5, 120)))
+            reserved = [(at(start), at(start + 30)) for start in rng.sample(range(0, 2000), 5)]
+            self.assertEqual(
+                allocate(bids, timedelta(minutes=15), timedelta(minutes=90), reserved),
+                brute_force_allocate(bids, timedelta(minutes=15), timedelta(minutes=90), reserved)
+            )
+
+
+class TestSpawnSchedule(unittest.TestCase):
+    """Adding and withdrawing single bids gives the same schedule as a full recompute."""
+
+    CLAIM_MIN = timedelta(minutes=15)
+    CLAIM_MAX = timedelta(minutes=90)
+
+    def random_bid(self, rng, id):
+        start = rng.randrange(-200, 3000)
+        return make_bid(id, rng.randrange(1, 30), start, start + rng.randrange(15, 300), rng.randrange(5, 120))
+
+    def test_matches_full_recompute(self):
+        for seed in range(25):
+            rng = random.Random(seed)
+            reserved = [(at(start), at(start + 45)) for start in rng.sample(range(0, 3000), 4)]
+            schedule = SpawnSchedule(1, self.CLAIM_MIN, self.CLAIM_MAX, reserved, not_before=at(0))
+            expected_before = {}
+            for id in range(1, 120):
+                if schedule.bids and rng.random() < 0.3:
+                    changes = schedule.withdraw(rng.choice(list(schedule.bids)))
+                else:
+                    changes = schedule.add(self.random_bid(rng, id))
+                full = allocate(schedule.bids.values(), self.CLAIM_MIN, self.CLAIM_MAX, reserved, not_before=at(0))
+                self.assertEqual(schedule.schedule, full, f"seed {seed}, step {id}")
+                # The reported changes turn the previous schedule into this one
+                applied = {**expected_before, **changes}
+                self.assertEqual({bid_id: start for bid_id, start in applied.items() if start is not None}, full)
+                expected_before = full
+
+    def test_only_the_affected_component_is_reallocated(self):
+        schedule = SpawnSchedule(1, self.CLAIM_MIN, self.CLAIM_MAX, not_before=at(0))
+        for id in range(1, 51):
+            schedule.add(make_bid(id, id, id * 1000, id * 1000 + 120, 60)) # far apart
+        schedule.add(make_bid(100, 5, 3000, 3100, 60)) # shares bid 3's component
+        with mock.patch.object(scheduler, "allocate", wraps=allocate) as spy:
+            self.assertEqual(schedule.add(make_bid(101, 99, 3000, 3100, 60)), {101: at(3000), 100: None})
+            self.assertEqual(len(spy.call_args.args[0]), 3)
+            self.assertEqual(schedule.withdraw(101), {101: None, 100: at(3000)})
+            self.assertEqual(len(spy.call_args.args[0]), 2)
+
+    def test_withdrawing_splits_a_component(self):
+        schedule = SpawnSchedule(1, self.CLAIM_MIN, self.CLAIM_MAX, not_before=at(0))
+        schedule.add(make_bid(1, 10, 0, 100, 60))
+        schedule.add(make_bid(2, 10, 200, 300, 60))
+        schedule.add(make_bid(3, 10, 50, 250, 60)) # bridges the two
+        self.assertEqual(len(schedule._components), 1)
+        schedule.withdraw(3)
+        self.assertEqual([component.bid_ids for component in schedule._components], [{1}, {2}])
+        self.assertEqual(schedule.withdraw(42), {})
+
+
+class TestResolveSpawn(unittest.TestCase):
+
+    def setUp(self):
+        Base.metadata.create_all(bind=test_engine)
+        self.db = TestingSessionLocal()
+        self.world = World(name='Antica')
+        self.user = User(username='hunter', password_hash='x')
+        self.db.add_all([self.world, self.user])
+        self.db.flush()
+        self.spawn = Spawn(name='Dragon Lair', world=self.world, claim_time_min=timedelta(minutes=15), claim_time_max=timedelta(hours=2))
+        self.characters = [
+            Character(name=f'Knight {i}', level=100, vocation='Knight', user=self.user, world=self.world, validation_hash=None)
+            for i in range(3)
+        ]
+        self.db.add_all([self.spawn] + self.characters)
+        self.db.flush()
+
+    def tearDown(self):
+        self.db.rollback()
+        Base.metadata.drop_all(bind=test_engine)
+        self.db.close()
+
+    def bid(self, character, points, window_start, window_end, claim_time, **kwargs):
+        bid = Bid(character=character, spawn=self.spawn, bid_points=points, claim_time=claim_time,
+                  hunt_window_start=at(window_start), hunt_window_end=at(window_end), **kwargs)
+        self.db.add(bid)
+        return bid
+
+    def resolve(self):
+        result = resolve_spawn(self.db.connection(), self.spawn.id, now=T0)
+        self.lock_deadlines = result.pop("lock_deadlines")
+        self.db.commit()
+        self.db.expire_all()
+        return result
+
+    def test_writes_schedule_and_hunts(self):
+        low = self.bid(self.characters[0], 10, 0, 60, 60)
+        high = self.bid(self.characters[1], 20, 0, 90, 60)
+        self.db.commit()
+
+        self.assertEqual(self.resolve(), {"scheduled": 1, "unplaced": 1})
+        self.assertEqual((high.scheduled_start, low.scheduled_start), (at(0), None))
+        hunt = self.db.query(Hunt).one()
+        self.assertEqual((hunt.bid_id, hunt.start_time, hunt.end_time, hunt.points_paid), (high.id, at(0), at(60), 20))
+        # Winners lock the spawn's locking_period (15 minutes by default) before they start
+        self.assertEqual(self.lock_deadlines, {high.id: (at(0), at(-15)), low.id: None})
+
+    def test_resolving_again_replaces_the_hunts(self):
+        first = self.bid(self.characters[0], 10, 0, 180, 60)
+        self.db.commit()
+        self.resolve()
+        second = self.bid(self.characters[1], 20, 0, 180, 60)
+        self.db.commit()
+
+        self.assertEqual(self.resolve(), {"scheduled": 2, "unplaced": 0})
+        self.assertEqual((second.scheduled_start, first.scheduled_start), (at(0), at(60)))
+        self.assertEqual(sorted((hunt.bid_id, hunt.start_time) for hunt in self.db.query(Hunt)), [(first.id, at(60)), (second.id, at(0))])
+
+    def test_locked_bids_keep_their_hunts(self):
+        locked = self.bid(self.characters[0], 5, 0, 180, 60, is_locked=True, scheduled_start=at(0))
+        self.db.flush()
+        self.db.add(Hunt(character=self.characters[0], spawn=self.spawn, start_time=at(0), end_time=at(60), bid_id=locked.id))
+        open_bid = self.bid(self.characters[1], 50, 0, 180, 60)
+        self.db.commit()
+
+        self.resolve()
+        self.assertEqual((locked.scheduled_start, open_bid.scheduled_start), (at(0), at(60)))
+        self.assertEqual(self.db.query(Hunt).count(), 2)
+
+    def stored_schedule(self):
+        self.db.expire_all()
+        return (
+            sorted((bid.id, bid.scheduled_start) for bid in self.db.query(Bid)),
+            sorted((hunt.bid_id, hunt.start_time, hunt.end_time) for hunt in self.db.query(Hunt)),
+        )
+
+    def test_incremental_writes_match_a_full_resolution(self):
+        rng = random.Random(3)
+        for _ in range(30):
+            start = rng.randrange(0, 600)
+            self.bid(rng.choice(self.characters), rng.randrange(1, 50), start, start + rng.randrange(30, 200), rng.randrange(15, 90))
+        self.db.commit()
+        self.resolve()
+        schedules.invalidate()
+
+        schedule = schedules.get(self.db.connection(), self.spawn.id, now=T0)
+        added = self.bid(self.characters[0], 40, 100, 300, 60)
+        self.db.flush()
+        schedule.write(self.db.connection(), schedule.add(added))
+        withdrawn = rng.choice([bid_id for bid_id in schedule.bids if bid_id != added.id])
+        schedule.write(self.db.connection(), schedule.withdraw(withdrawn))
+        self.db.query(Bid).filter(Bid.id == withdrawn).delete()
+        self.db.commit()
+        incremental = self.stored_schedule()
+
+        self.resolve()
+        self.assertEqual(self.stored_schedule(), incremental)
+
+    def test_hunts_are_recorded_as_activity(self):
+        self.bid(self.characters[0], 10, 0, 180, 60)
+        self.db.commit()
+        self.db.query(UserWorldActivity).delete()
+        self.db.commit()
+
+        self.resolve()
+        activity = self.db.query(UserWorldActivity).one()
+        self.assertEqual((activity.user_id, activity.spawn_id, activity.last_activity_at), (self.user.id, self.spawn.id, at(0)))
+
+
+class TestScheduleAfterSpawnChange(RouteTestCase):
+    """A kept schedule is dropped when an approved change rewrites the spawn's limits."""
+
+    def setUp(self):
+        super().setUp()
+        schedules.invalidate()
+        self.addCleanup(schedules.invalidate)
+
+    def test_new_claim_limits_are_used(self):
+        proposal = self.change_proposals[0]
+        proposal.claim_time_min = proposal.claim_time_max = timedelta(minutes=45)
+        proposal.locking_period = timedelta(minutes=5)
+        resolve_spawn(self.db.connection(), self.spawn.id)
+        schedules.get(self.db.connection(), self.spawn.id) # kept, with the old limits
+        self.db.commit()
+
+        response = self.client.post("/worlds/antica/spawns/spawn 0/vote", data={"proposal_id": proposal.id, "vote_type": "upvote"})
+        self.assertEqual(response.json()["status"], "approved", response.text)
+
+        schedule = schedules.get(self.db.connection(), self.spawn.id)
+        now = datetime.now(UTC).replace(tzinfo=None)
+        bid = Bid(character=self.characters[0], spawn=self.spawn, bid_points=100, claim_time=15,
+                  hunt_window_start=now + timedelta(days=1), hunt_window_end=now + timedelta(days=2))
+        self.db.add(bid)
+        self.db.flush()
+        lock_deadlines = schedule.write(self.db.connection(), schedule.add(bid))
+        self.db.commit()
+
+        hunt = self.db.query(Hunt).filter(Hunt.bid_id == bid.id).one()
+        self.assertEqual(hunt.end_time - hunt.start_time, timedelta(minutes=45))
+        self.assertEqual(lock_deadlines[bid.id], (hunt.start_time, hunt.start_time - timedelta(minutes=5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
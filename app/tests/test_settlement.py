@@ -0,0 +1,194 @@
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from models import User, Character, World, Spawn, Bid, Hunt, Points, PointsLedgerEntry, LedgerReason, Base
+from settlement import settle_spawn, settle_all, unsettled_spawns
+
+test_engine = create_engine("sqlite:///:memory:")
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+
+NOW = datetime(2026, 10, 19, 12, 0)
+
+
+class SettlementTestCase(unittest.TestCase):
+    """
+    Two spawns with a finished hunt each, a hunt still running, a lost bid
+    and a bid whose window is still open.
+    """
+
+    def setUp(self):
+        Base.metadata.create_all(bind=test_engine)
+        self.db = TestingSessionLocal()
+        world = World(name='Antica')
+        user = User(username='hunter', password_hash='x')
+        self.db.add_all([world, user])
+        self.db.flush()
+        self.spawn = Spawn(name='Dragon Lair', world=world)
+        self.other_spawn = Spawn(name='Hero Cave', world=world)
+        self.winner, self.loser, self.other = [
+            Character(name=name, level=100, vocation='Knight', user=user, world=world, validation_hash=None)
+            for name in ('Winner', 'Loser', 'Other')
+        ]
+        self.db.add_all([self.spawn, self.other_spawn, self.winner, self.loser, self.other])
+        self.db.flush()
+
+        start = NOW - timedelta(hours=3)
+        won = self.bid(self.winner, self.spawn, start, points=30, scheduled_start=start)
+        self.bid(self.loser, self.spawn, start, points=10)
+        self.bid(self.loser, self.spawn, NOW - timedelta(hours=1), points=10) # window still open
+        self.db.flush()
+        self.db.add_all([
+            Hunt(character=self.winner, spawn=self.spawn, start_time=start, end_time=start + timedelta(hours=1), points_paid=30, bid_id=won.id),
+            Hunt(character=self.other, spawn=self.spawn, start_time=NOW - timedelta(minutes=30), end_time=NOW + timedelta(minutes=30), points_paid=20),
+            Hunt(character=self.other, spawn=self.other_spawn, start_time=start, end_time=start + timedelta(hours=1), points_paid=5),
+        ])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.rollback()
+        Base.metadata.drop_all(bind=test_engine)
+        self.db.close()
+
+    def bid(self, character, spawn, window_start, points, **kwargs):
+        bid = Bid(character=character, spawn=spawn, bid_points=points, claim_time=60,
+                  hunt_window_start=window_start, hunt_window_end=window_start + timedelta(hours=2), **kwargs)
+        self.db.add(bid)
+        return bid
+
+    def balances(self):
+        self.db.expire_all()
+        return {(row.character_id, row.spawn_id): Decimal(row.points) for row in self.db.query(Points)}
+
+
+class TestSettlement(SettlementTestCase):
+
+    def test_settles_ended_hunts_and_lost_bids(self):
+        self.assertEqual(settle_spawn(self.db.connection(), self.spawn.id, NOW), {"debited": 1, "credited": 1})
+        self.db.commit()
+        self.assertEqual(self.balances(), {
+            (self.winner.id, self.spawn.id): Decimal(-30),
+            (self.loser.id, self.spawn.id): Decimal(1),
+        })
+        reasons = sorted(entry.reason.value for entry in self.db.query(PointsLedgerEntry))
+        self.assertEqual(reasons, ["hunt", "waiting"])
+
+    def test_settling_again_adds_only_new_entries(self):
+        settle_spawn(self.db.connection(), self.spawn.id, NOW)
+        self.assertEqual(settle_spawn(self.db.connection(), self.spawn.id, NOW), {"debited": 0, "credited": 0})
+        # An hour later the other hunt and the second losing bid are over too
+        self.assertEqual(settle_spawn(self.db.connection(), self.spawn.id, NOW + timedelta(hours=1)), {"debited": 1, "credited": 1})
+        self.db.commit()
+        self.assertEqual(self.balances(), {
+            (self.winner.id, self.spawn.id): Decimal(-30),
+            (self.loser.id, self.spawn.id): Decimal(2),
+            (self.other.id, self.spawn.id): Decimal(-20),
+        })
+
+    def test_balances_add_to_existing_points(self):
+        self.db.add(Points(character=self.loser, spawn=self.spawn, points=Decimal('2.5')))
+        self.db.commit()
+        settle_spawn(self.db.connection(), self.spawn.id, NOW)
+        self.db.commit()
+        self.assertEqual(self.balances()[(self.loser.id, self.spawn.id)], Decimal('3.5'))
+
+    def test_one_transaction_per_spawn(self):
+        self.assertCountEqual(unsettled_spawns(self.db.connection(), NOW), [self.spawn.id, self.other_spawn.id])
+        commits = []
+        event.listen(self.db, "after_commit", lambda session: commits.append(session))
+        self.assertEqual(settle_all(self.db, NOW), {"spawns": 2, "debited": 2, "credited": 1})
+        self.assertEqual(len(commits), 2)
+        self.assertEqual(unsettled_spawns(self.db.connection(), NOW), [])
+
+    def test_rebuild_from_the_ledger(self):
+        settle_all(self.db, NOW)
+        settle_all(self.db, NOW + timedelta(hours=2))
+        self.db.add(PointsLedgerEntry(character=self.winner, spawn=self.spawn, amount=Decimal(5), reason=LedgerReason.ADJUSTMENT))
+        Points.add(self.db.connection(), {(self.winner.id, self.spawn.id): Decimal(5)})
+        self.db.commit()
+        projected = self.balances()
+
+        self.db.query(Points).update({Points.points: 0})
+        self.assertEqual(Points.rebuild(self.db.connection()), len(projected))
+        self.db.commit()
+        self.assertEqual(self.balances(), projected)
+
+        # Rebuilding one spawn leaves the others alone
+        self.db.query(Points).filter(Points.spawn_id == self.other_spawn.id).update({Points.points: 99})
+        Points.rebuild(self.db.connection(), spawn_id=self.spawn.id)
+        self.db.commit()
+        self.assertEqual(self.balances()[(self.other.id, self.other_spawn.id)], Decimal(99))
+
+
+class TestPointsAccrual(SettlementTestCase):
+    """Points grow by `rate` per hour, computed on read and written down on spending."""
+
+    def setUp(self):
+        super().setUp()
+        self.db.add_all([
+            Points(character=self.winner, spawn=self.spawn, points=Decimal(100), rate=Decimal(2), base_time=NOW - timedelta(hours=5)),
+            Points(character=self.loser, spawn=self.spawn, points=Decimal(95), rate=Decimal(4), base_time=NOW - timedelta(hours=3)),
+            Points(character=self.other, spawn=self.spawn, points=Decimal(120), rate=Decimal(0), base_time=NOW - timedelta(hours=9)),
+        ])
+        self.db.commit()
+
+    def points(self, character):
+        self.db.expire_all()
+        return self.db.query(Points).filter(Points.character_id == character.id, Points.spawn_id == self.spawn.id).one()
+
+    def test_points_at(self):
+        self.assertEqual(self.points(self.winner).points_at(NOW), Decimal(110))
+        self.assertEqual(self.points(self.winner).points_at(NOW + timedelta(minutes=30)), Decimal(111))
+        self.assertEqual(self.points(self.other).points_at(NOW), Decimal(120))
+
+    def test_ranking_in_sql(self):
+        ranked = self.db.query(Points.character_id, Points.points_at(NOW)).filter(Points.spawn_id == self.spawn.id) \
+            .order_by(Points.points_at(NOW).desc()).all()
+        self.assertEqual([character_id for character_id, _ in ranked], [self.other.id, self.winner.id, self.loser.id])
+        self.assertEqual([round(float(value), 6) for _, value in ranked], [120, 110, 107])
+        # Later on, the loser's faster accrual overtakes the winner
+        later = self.db.query(Points.character_id).filter(Points.spawn_id == self.spawn.id) \
+            .order_by(Points.points_at(NOW + timedelta(hours=10)).desc()).first()
+        self.assertEqual(later, (self.loser.id,))
+
+    def test_postgresql_expression(self):
+        sql = str(Points.points_at(NOW).compile(dialect=postgresql.dialect()))
+        self.assertIn("EXTRACT(EPOCH FROM (", sql)
+
+    def test_spending_writes_accrual_down(self):
+        settle_spawn(self.db.connection(), self.spawn.id, NOW)
+        self.db.commit()
+
+        winner = self.points(self.winner)
+        self.assertEqual((round(float(winner.points), 6), winner.base_time), (80, NOW)) # 100 + 5h * 2 - 30
+        accrual = self.db.query(PointsLedgerEntry).filter(PointsLedgerEntry.reason == LedgerReason.ACCRUAL).one()
+        self.assertEqual((accrual.character_id, round(float(accrual.amount), 6)), (self.winner.id, 10))
+
+        # The loser was only credited; its accrual still isn't written down
+        loser = self.points(self.loser)
+        self.assertEqual((loser.points, loser.base_time), (Decimal(96), NOW - timedelta(hours=3)))
+        self.assertEqual(loser.points_at(NOW), Decimal(108))
+
+    def test_rebuild_keeps_accrual(self):
+        self.db.add_all([
+            PointsLedgerEntry(character=self.winner, spawn=self.spawn, amount=Decimal(100), reason=LedgerReason.ADJUSTMENT),
+            PointsLedgerEntry(character=self.loser, spawn=self.spawn, amount=Decimal(95), reason=LedgerReason.ADJUSTMENT),
+        ])
+        self.db.commit()
+        settle_all(self.db, NOW)
+        projected = {character.id: self.points(character).points_at(NOW) for character in (self.winner, self.loser)}
+
+        Points.rebuild(self.db.connection())
+        self.db.commit()
+        for character in (self.winner, self.loser):
+            self.assertAlmostEqual(float(self.points(character).points_at(NOW)), float(projected[character.id]), places=6)
+        # No ledger entries back the third balance
+        self.assertEqual(self.points(self.other).points, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+from collections import Counter
+
+import httpx
+
+from database import get_async_db
+from dependencies import get_current_user
+from models import User, Spawn, SpawnProposal, ProposalStatus, proposal_sponsors
+from tests.test_routes import RouteTestCase, get_test_async_db
+from tests.test_vote_concurrency import get_header_user, get_concurrent_db
+
+SPONSORS = 200
+
+
+class TestConcurrentSponsors(RouteTestCase):
+    """
+    Hundreds of users sponsoring the same proposal at once: each sponsorship
+    is stored once, and exactly one request approves it and creates the spawn.
+    """
+
+    def setUp(self):
+        super().setUp()
+        sponsors = [User(username=f'sponsor{i}', password_hash='x') for i in range(SPONSORS)]
+        self.db.add_all(sponsors)
+        self.db.commit()
+        self.sponsor_ids = [sponsor.id for sponsor in sponsors]
+        self.proposal = self.db.query(SpawnProposal).one() # pending, with 3 sponsors
+        self.app.dependency_overrides[get_current_user] = get_header_user
+        self.app.dependency_overrides[get_async_db] = get_concurrent_db
+        self.addCleanup(self.app.dependency_overrides.pop, get_current_user, None)
+        self.addCleanup(self.app.dependency_overrides.__setitem__, get_async_db, get_test_async_db)
+
+    def require_sponsors(self, count):
+        # 20 active users
+        self.world.sponsorship_flat = count
+        self.world.sposorship_fraction = count / 20
+        self.db.commit()
+
+    def sponsor_all(self, user_ids):
+        """Sends one sponsorship per user id, all at once, on a single event loop."""
+        async def send():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                return await asyncio.gather(*(
+                    client.post("/worlds/antica/sponsor", data={"proposal_id": self.proposal.id}, headers={"X-User-Id": str(user_id)})
+                    for user_id in user_ids
+                ))
+        responses = asyncio.run(send())
+        for response in responses:
+            self.assertEqual(response.status_code, 200, response.text)
+        return [response.json() for response in responses]
+
+    def stored(self):
+        self.db.expire_all()
+        sponsors = self.db.query(proposal_sponsors).filter(proposal_sponsors.c.spawn_proposal_id == self.proposal.id).count()
+        spawns = self.db.query(Spawn).filter(Spawn.proposal_id == self.proposal.id).count()
+        return sponsors, spawns, self.db.get(SpawnProposal, self.proposal.id).status
+
+    def test_exactly_one_spawn_is_created(self):
+        self.require_sponsors(50)
+        results = self.sponsor_all(self.sponsor_ids)
+        self.assertEqual(len([result for result in results if result.get("spawn_created")]), 1)
+        # The 47th new sponsor reaches 50; later ones find it approved
+        self.assertEqual(Counter(result["message"].startswith("Proposal sponsored successfully") for result in results)[True], 46)
+        self.assertEqual(self.stored(), (50, 1, ProposalStatus.APPROVED))
+
+    def test_threshold_already_met(self):
+        # The fixture's proposal already has enough sponsors; the first new one approves it
+        results = self.sponsor_all(self.sponsor_ids)
+        self.assertEqual(len([result for result in results if result.get("spawn_created")]), 1)
+        self.assertEqual(self.stored(), (4, 1, ProposalStatus.APPROVED))
+
+    def test_repeated_sponsorship_counts_once(self):
+        self.require_sponsors(50)
+        results = self.sponsor_all([self.sponsor_ids[0]] * 20)
+        self.assertEqual(Counter(result["message"] for result in results)["You have already sponsored this proposal."], 19)
+        self.assertEqual(self.stored(), (4, 0, ProposalStatus.PENDING))
+
+
+if __name__ == '__main__':
+    unittest.main()
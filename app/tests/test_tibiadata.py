@@ -0,0 +1,69 @@
+import unittest
+from unittest import mock
+
+import httpx
+
+import tibiadata as tibiadata_module
+from tibiadata import TibiaDataClient
+from routers import characters
+
+CHARACTER_RESPONSE = {
+    "character": {
+        "character": {"name": "Hunter Knight", "level": 200, "vocation": "Knight", "world": "Antica"},
+        "other_characters": [{"name": "Hunter Druid", "world": "Antica"}]
+    }
+}
+
+
+class TestTibiaDataClient(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.requests = []
+
+        def handler(request):
+            self.requests.append(request)
+            return httpx.Response(200, json=CHARACTER_RESPONSE)
+
+        self.client = TibiaDataClient(base_url="https://tibiadata.test/v4", http2=False, transport=httpx.MockTransport(handler))
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def test_requests_share_one_client(self):
+        await self.client.start()
+        http_client = self.client.client
+        await self.client.get("/worlds")
+        await self.client.get("/character/Hunter%20Knight")
+
+        self.assertIs(self.client.client, http_client)
+        self.assertEqual([str(r.url) for r in self.requests], [
+            "https://tibiadata.test/v4/worlds",
+            "https://tibiadata.test/v4/character/Hunter%20Knight",
+        ])
+
+    async def test_reopens_after_close(self):
+        await self.client.get("/worlds")
+        await self.client.close()
+        response = await self.client.get("/worlds")
+        self.assertEqual(response.status_code, 200)
+
+    async def test_falls_back_to_http1_without_h2(self):
+        client = TibiaDataClient(http2=True)
+        with mock.patch.object(tibiadata_module, "http2_available", return_value=False), \
+                mock.patch.object(tibiadata_module.httpx, "AsyncClient") as async_client:
+            client.client
+        self.assertFalse(async_client.call_args.kwargs["http2"])
+
+    async def test_get_character_data_uses_shared_client(self):
+        await characters.character_cache.clear()
+        with mock.patch.object(characters, "tibiadata", self.client):
+            character_info, other_characters = await characters.get_character_data("Hunter Knight")
+
+        self.assertEqual(character_info["level"], 200)
+        self.assertEqual(other_characters[0]["name"], "Hunter Druid")
+        self.assertEqual(len(self.requests), 1)
+        await characters.character_cache.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+from collections import Counter
+
+import httpx
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from database import get_async_db
+from dependencies import CurrentUser, get_current_user
+from models import User, Vote, SpawnChangeProposal, ProposalStatus
+from tests.test_routes import RouteTestCase, TEST_DB_PATH, get_test_async_db
+
+VOTERS = 200
+
+# SQLite takes its write lock lazily, so concurrent writers can deadlock on
+# the lock upgrade and fail with "database is locked" (Postgres has row locks
+# instead). These tests take the lock when the transaction begins.
+concurrent_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool, connect_args={"timeout": 60})
+ConcurrentSessionLocal = async_sessionmaker(concurrent_engine, autoflush=False, expire_on_commit=False)
+
+
+@event.listens_for(concurrent_engine.sync_engine, "connect")
+def receive_connect(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None # Let the begin listener emit BEGIN
+
+
+@event.listens_for(concurrent_engine.sync_engine, "begin")
+def receive_begin(connection):
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+async def get_concurrent_db():
+    async with ConcurrentSessionLocal() as db:
+        yield db
+
+
+def get_header_user(request: Request):
+    """Logs every request in as the user named by its X-User-Id header."""
+    user_id = int(request.headers["x-user-id"])
+    return CurrentUser(id=user_id, username=f"voter{user_id}", is_admin=False)
+
+
+class TestConcurrentVotes(RouteTestCase):
+    """
+    Hundreds of votes cast at once on the same proposal are each counted
+    exactly once, and only one of them decides the proposal.
+    """
+
+    def setUp(self):
+        super().setUp()
+        voters = [User(username=f'voter{i}', password_hash='x') for i in range(VOTERS)]
+        self.db.add_all(voters)
+        self.db.commit()
+        self.voter_ids = [voter.id for voter in voters]
+        self.proposal = self.change_proposals[0]
+        self.app.dependency_overrides[get_current_user] = get_header_user
+        self.app.dependency_overrides[get_async_db] = get_concurrent_db
+        self.addCleanup(self.app.dependency_overrides.pop, get_current_user, None)
+        self.addCleanup(self.app.dependency_overrides.__setitem__, get_async_db, get_test_async_db)
+
+    def set_engagement_threshold(self, threshold):
+        self.world.engagement_threshold = threshold
+        self.db.commit()
+
+    def vote_all(self, user_ids, vote_type="upvote"):
+        """Sends one vote per user id, all at once, on a single event loop."""
+        async def send():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                return await asyncio.gather(*(
+                    client.post(
+                        "/worlds/antica/spawns/spawn 0/vote",
+                        data={"proposal_id": self.proposal.id, "vote_type": vote_type},
+                        headers={"X-User-Id": str(user_id)}
+                    )
+                    for user_id in user_ids
+                ))
+        responses = asyncio.run(send())
+        for response in responses:
+            self.assertEqual(response.status_code, 200, response.text)
+        return [response.json() for response in responses]
+
+    def stored_votes(self):
+        self.db.expire_all()
+        proposal = self.db.get(SpawnChangeProposal, self.proposal.id)
+        rows = self.db.query(Vote).filter(Vote.proposal_id == proposal.id).count()
+        return proposal.upvotes + proposal.downvotes, rows, proposal.status
+
+    def test_every_vote_is_counted(self):
+        self.set_engagement_threshold(1000) # never decided
+        results = self.vote_all(self.voter_ids)
+        self.assertEqual(Counter(result["status"] for result in results), {"pending": VOTERS})
+        self.assertEqual(self.stored_votes(), (VOTERS + 20, VOTERS + 20, ProposalStatus.PENDING))
+        # Each response saw its own vote on top of the ones before it
+        self.assertEqual(sorted(result["total_votes"] for result in results), list(range(21, VOTERS + 21)))
+
+    def test_repeated_votes_count_once(self):
+        self.set_engagement_threshold(1000)
+        results = self.vote_all([self.voter_ids[0]] * 20, vote_type="downvote")
+        self.assertEqual(Counter(result["status"] for result in results), {"pending": 1, "already_voted": 19})
+        self.assertEqual(self.stored_votes(), (21, 21, ProposalStatus.PENDING))
+        self.assertEqual(self.proposal.downvotes, 8)
+
+    def test_one_vote_decides(self):
+        # 20 active users: the 40th vote reaches the threshold and approves it
+        self.set_engagement_threshold(2)
+        results = self.vote_all(self.voter_ids)
+        decided = [result for result in results if "changes applied" in result["message"]]
+        self.assertEqual(len(decided), 1)
+        self.assertEqual(decided[0]["total_votes"], 40)
+        statuses = Counter(result["status"] for result in results)
+        # Votes that arrive after the decision are turned away
+        self.assertEqual(statuses, {"pending": 19, "approved": VOTERS - 19})
+
+        total, rows, status = self.stored_votes()
+        self.assertEqual((total, rows, status), (40, 40, ProposalStatus.APPROVED))
+
+
+if __name__ == '__main__':
+    unittest.main()
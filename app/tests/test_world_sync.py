@@ -0,0 +1,191 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import httpx
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import world_sync as world_sync_module
+from models import Base, World
+from tibiadata import TibiaDataClient
+from world_sync import WorldSync, parse_worlds, update_worlds
+from tests.test_routes import RouteTestCase
+
+
+def worlds_payload(*worlds, players_online=100):
+    return {"worlds": {
+        "regular_worlds": [{"name": name, "location": location, "players_online": players_online} for name, location in worlds],
+        "tournament_worlds": []
+    }}
+
+
+class TestWorldSync(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        path = os.path.join(tempfile.mkdtemp(), 'worlds.db')
+        Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        self.requests = []
+        self.responses = []
+
+        def handler(request):
+            self.requests.append(request)
+            return self.responses.pop(0)
+
+        self.client = TibiaDataClient(base_url="https://tibiadata.test/v4", http2=False, transport=httpx.MockTransport(handler))
+        self.sync = WorldSync(self.session_factory, self.client, interval=3600, retry=60)
+
+    async def asyncTearDown(self):
+        await self.sync.stop()
+        await self.client.close()
+        await self.engine.dispose()
+
+    async def worlds(self):
+        async with self.session_factory() as db:
+            return {world.name: world.location for world in (await db.scalars(select(World))).all()}
+
+    def test_parse_worlds(self):
+        data = worlds_payload(("Antica", "Europe"))
+        data["worlds"]["tournament_worlds"] = [{"name": "Endebra", "location": "South America"}, {"name": ""}]
+        self.assertEqual(parse_worlds(data), [
+            {"name": "Antica", "location": "Europe"},
+            {"name": "Endebra", "location": "South America"},
+        ])
+
+    async def test_sync_adds_and_updates_worlds(self):
+        self.responses.append(httpx.Response(200, json=worlds_payload(("Antica", "Europe"), ("Secura", "Europe"))))
+        self.assertTrue(await self.sync.sync_once())
+        self.responses.append(httpx.Response(200, json=worlds_payload(("Antica", "Europe"), ("Secura", "North America"))))
+        self.assertTrue(await self.sync.sync_once())
+
+        self.assertEqual(await self.worlds(), {"Antica": "Europe", "Secura": "North America"})
+        self.assertTrue(self.sync.ready)
+
+    async def test_upsert_counts(self):
+        async with self.session_factory() as db:
+            self.assertEqual(
+                await update_worlds(db, [{"name": "Antica", "location": "Europe"}, {"name": "Secura", "location": "Europe"}]),
+                {"inserted": 2, "updated": 0, "unchanged": 0}
+            )
+
+        statements = []
+        on_execute = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(self.engine.sync_engine, "before_cursor_execute", on_execute)
+        try:
+            async with self.session_factory() as db:
+                counts = await update_worlds(db, [
+                    {"name": "Antica", "location": "Europe"},
+                    {"name": "Secura", "location": "North America"},
+                    {"name": "Bona", "location": "South America"},
+                    {"name": "Bona", "location": "South America"},
+                ])
+        finally:
+            event.remove(self.engine.sync_engine, "before_cursor_execute", on_execute)
+
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "unchanged": 1})
+        self.assertEqual(await self.worlds(), {"Antica": "Europe", "Secura": "North America", "Bona": "South America"})
+        # The SQLite fallback looks the names up once, then upserts them all at once
+        self.assertEqual(len(statements), 2)
+
+    def test_postgresql_upsert(self):
+        connection = mock.Mock()
+        connection.dialect = postgresql.dialect()
+        connection.execute.return_value.scalars.return_value.all.return_value = [True, False]
+        counts = World.upsert_many(connection, [
+            {"name": "Antica", "location": "Europe"},
+            {"name": "Secura", "location": "Europe"},
+            {"name": "Bona", "location": "South America"},
+        ])
+
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "unchanged": 1})
+        self.assertEqual(connection.execute.call_count, 1)
+        sql = str(connection.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT (name) DO UPDATE SET location = excluded.location", sql)
+        self.assertIn("WHERE worlds.location IS DISTINCT FROM excluded.location", sql)
+        self.assertIn("RETURNING xmax = 0", sql)
+
+    async def test_unchanged_worlds_skip_the_database(self):
+        self.responses.append(httpx.Response(200, json=worlds_payload(("Antica", "Europe"), players_online=100)))
+        await self.sync.sync_once()
+        # Only the player counts changed
+        self.responses.append(httpx.Response(200, json=worlds_payload(("Antica", "Europe"), players_online=250)))
+        with mock.patch.object(world_sync_module, "update_worlds") as update_worlds:
+            self.assertTrue(await self.sync.sync_once())
+        update_worlds.assert_not_called()
+
+    async def test_conditional_requests(self):
+        self.responses.append(httpx.Response(200, json=worlds_payload(("Antica", "Europe")), headers={"ETag": '"v1"', "Last-Modified": "Sat, 17 Oct 2026 10:00:00 GMT"}))
+        await self.sync.sync_once()
+        self.responses.append(httpx.Response(304))
+        self.assertTrue(await self.sync.sync_once())
+
+        self.assertEqual(self.requests[1].headers["If-None-Match"], '"v1"')
+        self.assertEqual(self.requests[1].headers["If-Modified-Since"], "Sat, 17 Oct 2026 10:00:00 GMT")
+        self.assertEqual(await self.worlds(), {"Antica": "Europe"})
+
+    async def test_failures_are_recorded_not_raised(self):
+        self.responses.append(httpx.Response(503, text="maintenance"))
+        with self.assertLogs('world_sync', level='ERROR'):
+            self.assertFalse(await self.sync.sync_once())
+        self.assertFalse(self.sync.ready)
+        self.assertIn("503", self.sync.status()["last_error"])
+
+    async def test_start_does_not_wait_for_the_api(self):
+        release = asyncio.Event()
+
+        async def slow_get(path, **kwargs):
+            await release.wait()
+            return httpx.Response(200, json=worlds_payload(("Antica", "Europe")), request=httpx.Request("GET", path))
+
+        with mock.patch.object(self.client, "get", slow_get):
+            self.sync.start()
+            await asyncio.sleep(0.05)
+            self.assertTrue(self.sync.status()["running"])
+            self.assertFalse(self.sync.ready)
+
+            release.set()
+            for _ in range(100):
+                if self.sync.ready:
+                    break
+                await asyncio.sleep(0.01)
+        self.assertTrue(self.sync.ready)
+        self.assertEqual(await self.worlds(), {"Antica": "Europe"})
+
+    async def test_existing_worlds_make_it_ready_before_the_first_sync(self):
+        async with self.session_factory() as db:
+            db.add(World(name="Antica", location="Europe"))
+            await db.commit()
+
+        with mock.patch.object(self.sync, "sync_once", mock.AsyncMock(side_effect=asyncio.CancelledError)):
+            with self.assertRaises(asyncio.CancelledError):
+                await self.sync.run_forever()
+        self.assertTrue(self.sync.ready)
+
+
+class TestHealthEndpoints(RouteTestCase):
+
+    def test_liveness(self):
+        response = self.client.get("/health/live")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    def test_readiness_waits_for_worlds(self):
+        with mock.patch.object(world_sync_module.world_sync, "ready", False):
+            response = self.client.get("/health/ready")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["checks"], {"database": True, "worlds": False})
+
+        with mock.patch.object(world_sync_module.world_sync, "ready", True):
+            response = self.client.get("/health/ready")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "ready")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Filename: tibiadata.py
+
+The application's single HTTP client for the TibiaData API. One pooled
+httpx.AsyncClient is opened at startup and closed at shutdown, so requests
+reuse kept-alive connections instead of paying TCP and TLS setup each time.
+
+    response = await tibiadata.get(f"/character/{name}")
+"""
+
+import os
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+TIBIADATA_BASE_URL = os.environ.get("TIBIADATA_BASE_URL", "https://api.tibiadata.com/v4")
+TIBIADATA_TIMEOUT = float(os.environ.get("TIBIADATA_TIMEOUT", "10")) # seconds, for connect/read/write/pool
+TIBIADATA_MAX_CONNECTIONS = int(os.environ.get("TIBIADATA_MAX_CONNECTIONS", "20"))
+TIBIADATA_MAX_KEEPALIVE = int(os.environ.get("TIBIADATA_MAX_KEEPALIVE", "10"))
+TIBIADATA_KEEPALIVE_EXPIRY = float(os.environ.get("TIBIADATA_KEEPALIVE_EXPIRY", "30")) # seconds
+TIBIADATA_HTTP2 = os.environ.get("TIBIADATA_HTTP2", "true").lower() in ("1", "true", "yes")
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional 'h2' package (pip install httpx[http2])."""
+    try:
+        import h2 # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TibiaDataClient:
+    """
+    Owns the shared httpx.AsyncClient. If a request comes in before start()
+    (scripts, tests), the client is opened on first use.
+    """
+
+    def __init__(self, base_url: str = TIBIADATA_BASE_URL, http2: bool = TIBIADATA_HTTP2, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.http2 = http2
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = self.http2 and http2_available()
+        if self.http2 and not http2:
+            logger.warning("TIBIADATA_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            timeout=httpx.Timeout(TIBIADATA_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=TIBIADATA_MAX_CONNECTIONS,
+                max_keepalive_connections=TIBIADATA_MAX_KEEPALIVE,
+                keepalive_expiry=TIBIADATA_KEEPALIVE_EXPIRY,
+            ),
+            follow_redirects=True,
+            transport=self.transport,
+        )
+
+    async def start(self):
+        """Opens the client; called from the app's startup event."""
+        self.client
+
+    async def close(self):
+        """Closes the client and its pooled connections; called at shutdown."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        """GET a path relative to the API base URL, e.g. '/worlds'."""
+        return await self.client.get(path, **kwargs)
+
+
+tibiadata = TibiaDataClient()
@@ -0,0 +1,164 @@
+"""
+Filename: world_sync.py
+
+Keeps the World table in step with TibiaData's world list, from a background
+task instead of blocking startup on the API.
+
+- The first sync starts right after startup, then repeats every
+  WORLD_SYNC_INTERVAL seconds (sooner, after WORLD_SYNC_RETRY, on failure).
+- Requests are conditional (ETag / Last-Modified), and a hash of the world
+  names and locations skips the database when the payload didn't change;
+  player counts change constantly, so the raw body isn't hashed.
+- `ready` turns true once the World table is usable: either a sync has
+  succeeded, or a previous run already stored worlds.
+
+    world_sync.start()   # on startup
+    await world_sync.stop()   # on shutdown
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+import httpx
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import World
+from routers.spawns import slug_resolver
+from tibiadata import TibiaDataClient, tibiadata
+
+logger = logging.getLogger(__name__)
+
+WORLD_SYNC_INTERVAL = float(os.environ.get("WORLD_SYNC_INTERVAL", "3600")) # seconds between syncs
+WORLD_SYNC_RETRY = float(os.environ.get("WORLD_SYNC_RETRY", "60")) # seconds before retrying a failed sync
+
+
+def parse_worlds(data: dict) -> list:
+    """Extracts [{"name", "location"}] from a TibiaData /worlds payload, tournament worlds included."""
+    worlds = data.get('worlds', {})
+    return [
+        {"name": world_info['name'], "location": world_info.get('location')}
+        for world_info in worlds.get('regular_worlds', []) + worlds.get('tournament_worlds', [])
+        if world_info.get('name')
+    ]
+
+
+def worlds_hash(worlds: list) -> str:
+    return hashlib.sha256(json.dumps(sorted(worlds, key=lambda w: w["name"])).encode()).hexdigest()
+
+
+async def update_worlds(db: AsyncSession, worlds: list) -> dict:
+    """
+    Upserts the worlds in one statement and commits.
+    Returns {"inserted", "updated", "unchanged"} counts.
+    """
+    counts = await db.run_sync(lambda session: World.upsert_many(session.connection(), worlds))
+    await db.commit()
+    return counts
+
+
+class WorldSync:
+    """Periodically syncs worlds from TibiaData; see the module docstring."""
+
+    def __init__(self, session_factory, client: TibiaDataClient, interval: float = WORLD_SYNC_INTERVAL, retry: float = WORLD_SYNC_RETRY):
+        self.session_factory = session_factory
+        self.client = client
+        self.interval = interval
+        self.retry = retry
+        self.ready = False
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.content_hash: Optional[str] = None
+        self.last_sync: Optional[float] = None # time of the last successful check
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Starts the background loop; returns immediately."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_forever(self):
+        if not self.ready:
+            await self._check_existing_worlds()
+        while True:
+            succeeded = await self.sync_once()
+            await asyncio.sleep(self.interval if succeeded else self.retry)
+
+    async def _check_existing_worlds(self):
+        try:
+            async with self.session_factory() as db:
+                if await db.scalar(select(func.count(World.id))):
+                    self.ready = True
+        except Exception as e:
+            logger.warning(f"Could not check for existing worlds: {e}")
+
+    async def sync_once(self) -> bool:
+        """
+        Runs one sync. Returns False if it failed; errors are logged and kept
+        in `last_error`, never raised.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        try:
+            response = await self.client.get("/worlds", headers=headers)
+            if response.status_code == 304:
+                logger.info("Worlds not modified on TibiaData, skipping update.")
+            else:
+                response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+                worlds = parse_worlds(response.json())
+                content_hash = worlds_hash(worlds)
+                if content_hash == self.content_hash:
+                    logger.info("World list unchanged, skipping update.")
+                else:
+                    async with self.session_factory() as db:
+                        counts = await update_worlds(db, worlds)
+                    if counts["inserted"]:
+                        slug_resolver.invalidate()
+                    self.content_hash = content_hash
+                    logger.info(f"World data updated successfully from TibiaData.com: {counts}")
+                self.etag = response.headers.get("ETag")
+                self.last_modified = response.headers.get("Last-Modified")
+        except httpx.HTTPStatusError as e:
+            self.last_error = f"HTTP error updating worlds from TibiaData: {e.response.status_code} - {e.response.text}"
+        except httpx.RequestError as e:
+            self.last_error = f"Network error updating worlds from TibiaData: {e}"
+        except Exception as e:
+            self.last_error = f"An unexpected error occurred while updating worlds: {e}"
+        else:
+            self.ready = True
+            self.last_sync = time.time()
+            self.last_error = None
+            return True
+        logger.error(self.last_error)
+        return False
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "running": self._task is not None and not self._task.done(),
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+        }
+
+
+world_sync = WorldSync(AsyncSessionLocal, tibiadata)